@@ -0,0 +1,352 @@
+import argparse
+import os
+import sys
+import time
+
+import matplotlib
+import numpy as np
+from gig import EntType
+from utils import JSONFile, Log
+
+import synthetic_ents
+import synthetic_maps
+from gig_future import EntFuture, EntIndex
+from map_decoder import DecodeMetrics, MapDecoder
+from utils_future import Poly2GeoMapper
+
+log = Log("benchmark_decode")
+
+DIR_THIS = os.path.join("benchmarks", "benchmark_decode")
+BASELINE_PATH = os.path.join(DIR_THIS, "baseline.json")
+SCALES = [1, 2, 4]
+MAP_ENT_TYPE = EntType.GND
+# Coarser ents, over which adaptive sampling fills most cells. Over GNDs,
+# blocks are too small to pay off, and it looks up every cell instead.
+COARSE_ENT_TYPE = EntType.DISTRICT
+BOX_SIZE_LAT = 0.02
+N_POINT_LOOKUPS = 100
+N_TRANSFORM_POINTS = 1_000_000
+# Stages are compared as multiples of this stage's time, measured in the
+# same run, so that a baseline recorded on one machine holds on another.
+# It runs for about 0.3s, and is repeated more than the other stages,
+# since every comparison is scaled by it.
+REFERENCE_STAGE = "reference"
+N_REFERENCE = 10_000_000
+N_REPEAT_REFERENCE = 7
+
+
+def time_stage(func, n_repeat: int) -> tuple[float, object]:
+    # Best of n_repeat, which is the least noisy on a shared machine.
+    # The first call pays for imports and caches built on first use, so
+    # it is not timed.
+    func()
+    dts = []
+    for _ in range(n_repeat):
+        t_start = time.perf_counter()
+        result = func()
+        dts.append(time.perf_counter() - t_start)
+    return min(dts), result
+
+
+def run_reference():
+    # Fixed work, in both numpy and pure Python, like the decode stages
+    values = np.random.default_rng(0).random(N_REFERENCE)
+    np.sort(values)
+    return sum(x * x for x in values[: N_REFERENCE // 10].tolist())
+
+
+def run_scale(scale: int, n_repeat: int) -> dict:
+    md = MapDecoder(synthetic_maps.build_image(scale))
+    size = md.pil_image.size
+    reference_list = synthetic_maps.get_reference_list(size)
+    stage_to_dt = {}
+
+    def run(stage, func):
+        dt, result = time_stage(func, n_repeat)
+        stage_to_dt[stage] = dt
+        log.debug(f"[{scale}x] {stage}: {dt:.3f}s")
+        return result
+
+    dt_reference, _ = time_stage(
+        run_reference, max(n_repeat, N_REPEAT_REFERENCE)
+    )
+    stage_to_dt[REFERENCE_STAGE] = dt_reference
+    color_matrix = run(
+        "get_color_matrix",
+        lambda: md.get_color_matrix(
+            md.pil_image,
+            n_clusters=3,
+            min_saturation=0.1,
+            color_background=synthetic_maps.COLOR_BACKGROUND,
+        ),
+    )
+
+    color_to_label = synthetic_maps.get_color_to_label(color_matrix)
+
+    xys = [ref["xy"] for ref in reference_list]
+    latlngs = [ref["latlng"] for ref in reference_list]
+    params = run(
+        "Poly2GeoMapper.fit",
+        lambda: Poly2GeoMapper.fit(xys=xys, latlngs=latlngs),
+    )
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(0, size[0], N_TRANSFORM_POINTS)
+    ys = rng.uniform(0, size[1], N_TRANSFORM_POINTS)
+    run(
+        "Poly2GeoMapper.transform",
+        lambda: Poly2GeoMapper.transform((xs, ys), params),
+    )
+    # The same number of points, as a grid
+    n_grid = int(N_TRANSFORM_POINTS**0.5)
+    grid_out = (
+        np.empty((n_grid, n_grid), dtype=np.float32),
+        np.empty((n_grid, n_grid), dtype=np.float32),
+    )
+    run(
+        "Poly2GeoMapper.transform_grid",
+        lambda: Poly2GeoMapper.transform_grid(
+            np.linspace(0, size[0], n_grid),
+            np.linspace(0, size[1], n_grid),
+            params,
+            out=grid_out,
+        ),
+    )
+
+    info_kwargs = dict(
+        reference_list=reference_list,
+        color_background=synthetic_maps.COLOR_BACKGROUND,
+        box_size_lat=BOX_SIZE_LAT,
+        map_ent_type=MAP_ENT_TYPE,
+        color_to_label=color_to_label,
+        color_matrix=color_matrix,
+    )
+    info_list = run(
+        "get_latlng_color_info_list",
+        lambda: md.get_latlng_color_info_list(**info_kwargs),
+    )
+    info_table = run(
+        "get_info_table",
+        lambda: md.get_info_table(**info_kwargs),
+    )
+    info_table_adaptive = run(
+        "get_info_table.adaptive",
+        lambda: md.get_info_table(**info_kwargs, sampling="adaptive"),
+    )
+    assert info_table_adaptive.to_info_list() == info_list
+    coarse_info_kwargs = info_kwargs | dict(map_ent_type=COARSE_ENT_TYPE)
+    coarse_info_table = run(
+        "get_info_table.coarse",
+        lambda: md.get_info_table(**coarse_info_kwargs),
+    )
+    coarse_info_table_adaptive = run(
+        "get_info_table.coarse.adaptive",
+        lambda: md.get_info_table(**coarse_info_kwargs, sampling="adaptive"),
+    )
+    assert (
+        coarse_info_table_adaptive.to_info_list()
+        == coarse_info_table.to_info_list()
+    )
+    # Counters, unlike times, are exact, so any change is flagged
+    stage_to_counters = {}
+    for prefix, kwargs in [
+        ("get_info_table", info_kwargs),
+        ("get_info_table.coarse", coarse_info_kwargs),
+    ]:
+        for sampling in MapDecoder.SAMPLINGS:
+            metrics = DecodeMetrics()
+            md.get_info_table(**kwargs, metrics=metrics, sampling=sampling)
+            stage_to_counters[f"{prefix}.{sampling}"] = metrics.counters
+    run(
+        "aggregate.info_list",
+        lambda: (
+            md.get_ent_to_label_to_n(info_list),
+            md.get_most_common_colors(info_list),
+        ),
+    )
+    run(
+        "aggregate.info_table",
+        lambda: (
+            md.get_ent_to_label_to_n(info_table),
+            md.get_most_common_colors(info_table),
+        ),
+    )
+
+    info_latlngs = [info["latlng"] for info in info_list]
+    run(
+        "EntFuture.idx_regions_from_latlng",
+        lambda: [
+            EntFuture.idx_regions_from_latlng(latlng, MAP_ENT_TYPE)
+            for latlng in info_latlngs[:N_POINT_LOOKUPS]
+        ],
+    )
+    run(
+        "EntFuture.idx_regions_from_latlng_list",
+        lambda: EntFuture.idx_regions_from_latlng_list(
+            info_latlngs, MAP_ENT_TYPE
+        ),
+    )
+
+    ent_to_label_to_n = md.get_ent_to_label_to_n(info_list)
+    draw_kwargs = dict(
+        color_map_boundaries=(0, 0, 0),
+        map_ent_type=MAP_ENT_TYPE,
+        title="Benchmark",
+        color_to_label=color_to_label,
+    )
+    run(
+        "matplotlib.info_list_image",
+        lambda: md.generate_info_list_image(
+            info_list=info_list, box_size_lat=BOX_SIZE_LAT, **draw_kwargs
+        ),
+    )
+    run(
+        "matplotlib.image_for_ents",
+        lambda: md.generate_image_for_ents(
+            ent_to_label_to_n=ent_to_label_to_n, **draw_kwargs
+        ),
+    )
+    run(
+        "pil.info_list_image",
+        lambda: md.render_info_list_image(
+            info_list=info_list,
+            size=size,
+            reference_list=reference_list,
+            box_size_lat=BOX_SIZE_LAT,
+            **draw_kwargs,
+        ),
+    )
+    run(
+        "pil.image_for_ents",
+        lambda: md.render_image_for_ents(
+            ent_to_label_to_n=ent_to_label_to_n,
+            size=size,
+            reference_list=reference_list,
+            **draw_kwargs,
+        ),
+    )
+
+    return dict(
+        size=list(size),
+        n_info=len(info_list),
+        n_ents=len(ent_to_label_to_n),
+        stage_to_dt=stage_to_dt,
+        stage_to_counters=stage_to_counters,
+    )
+
+
+def compare(
+    results: dict,
+    baseline: dict,
+    tolerance: float,
+    min_delta: float,
+) -> list[str]:
+    # Returns a line for each changed output or counter, which are
+    # deterministic, and logs every stage. Times are only warned about,
+    # since even best-of-n times vary from run to run on a shared
+    # machine. They are compared relative to REFERENCE_STAGE: a stage is
+    # slow if, as a multiple of it, it is slower than in the baseline by
+    # more than tolerance (relative) and min_delta (seconds, at this
+    # machine's speed), so that jitter in the fastest stages is not
+    # flagged.
+    changes = []
+    for key, result in results.items():
+        baseline_result = baseline.get(key)
+        if baseline_result is None:
+            log.warning(f"[{key}] Not in baseline")
+            continue
+
+        for k in ["n_info", "n_ents"]:
+            if result[k] != baseline_result[k]:
+                changes.append(
+                    f"[{key}] {k}: {result[k]} != {baseline_result[k]}"
+                )
+
+        for stage, counters in result["stage_to_counters"].items():
+            baseline_counters = baseline_result.get(
+                "stage_to_counters", {}
+            ).get(stage)
+            if baseline_counters is None:
+                log.warning(f"[{key}] {stage}: counters not in baseline")
+            elif counters != baseline_counters:
+                changes.append(
+                    f"[{key}] {stage}: {counters} != {baseline_counters}"
+                )
+
+        dt_reference = result["stage_to_dt"][REFERENCE_STAGE]
+        dt_reference_baseline = baseline_result["stage_to_dt"].get(
+            REFERENCE_STAGE
+        )
+        if dt_reference_baseline is None:
+            log.warning(f"[{key}] {REFERENCE_STAGE}: not in baseline")
+            continue
+        speed = dt_reference / dt_reference_baseline
+        log.info(f"[{key}] This machine is {1 / speed:.2f}x the baseline's")
+
+        for stage, dt in result["stage_to_dt"].items():
+            dt_baseline = baseline_result["stage_to_dt"].get(stage)
+            if stage == REFERENCE_STAGE:
+                continue
+            if dt_baseline is None:
+                log.warning(f"[{key}] {stage}: {dt:.3f}s (not in baseline)")
+                continue
+            dt_expected = dt_baseline * speed
+            ratio = dt / dt_expected
+            line = (
+                f"[{key}] {stage}: {dt:.3f}s"
+                + f" vs {dt_expected:.3f}s expected ({ratio:.2f}x)"
+            )
+            if ratio > 1 + tolerance and dt - dt_expected > min_delta:
+                log.warning(line)
+            else:
+                log.info(line)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark every decode stage on synthetic maps."
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--n-repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--min-delta", type=float, default=0.05)
+    parser.add_argument(
+        "--write-baseline",
+        action="store_true",
+        help=f"Save the results as the new {BASELINE_PATH}",
+    )
+    args = parser.parse_args()
+
+    matplotlib.use("Agg")
+    synthetic_ents.register()
+    for ent_type in EntFuture.REGION_ENT_TYPES:
+        EntIndex.for_type(ent_type)
+
+    results = {}
+    for scale in args.scales:
+        results[f"{scale}x"] = run_scale(scale, args.n_repeat)
+
+    if args.write_baseline:
+        JSONFile(BASELINE_PATH).write(results)
+        log.info(f"Wrote {BASELINE_PATH}")
+        return
+
+    if not os.path.exists(BASELINE_PATH):
+        log.error(f"{BASELINE_PATH} not found. Run with --write-baseline.")
+        sys.exit(1)
+
+    changes = compare(
+        results,
+        JSONFile(BASELINE_PATH).read(),
+        args.tolerance,
+        args.min_delta,
+    )
+    if changes:
+        for line in changes:
+            log.error(line)
+        log.error(f"{len(changes)} changed output(s) or counter(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import numpy as np
+import shapely
+from gig import Ent, EntType
+
+from gig_future import EntFuture, EntGeoStore
+
+# A stand-in for gig's boundaries: a nested grid of PROVINCEs, DISTRICTs,
+# DSDs and GNDs over roughly Sri Lanka's bbox, with the same id scheme
+# (LK-1, LK-11, LK-1101, LK-1101001). Edges wiggle, so that polygons
+# have realistic vertex counts, but every level is built from the same
+# lattice, so neighbours (and parents and children) share edges.
+LAT_MIN, LAT_MAX = 5.9, 9.9
+LNG_MIN, LNG_MAX = 79.5, 82.0
+# Children per side, for each of PROVINCE, DISTRICT, DSD and GND
+N_SPLITS = [3, 2, 2, 3]
+# Geometry is built on a lattice of GND cells, each cell side split
+# into N_VERTICES_PER_GND_EDGE, so every level's vertices coincide.
+N_GND = int(np.prod(N_SPLITS))
+N_VERTICES_PER_GND_EDGE = 8
+WIGGLE = 0.2
+
+
+def get_lat_lng(k_lat: np.ndarray, k_lng: np.ndarray) -> tuple:
+    # Lattice indices -> (lat, lng), with each axis wiggling along the
+    # other, and no wiggle on GND grid lines.
+    m = N_VERTICES_PER_GND_EDGE
+    n = N_GND * m
+    lat = LAT_MIN + (LAT_MAX - LAT_MIN) * k_lat / n
+    lng = LNG_MIN + (LNG_MAX - LNG_MIN) * k_lng / n
+    dlat = WIGGLE * (LAT_MAX - LAT_MIN) / N_GND
+    dlng = WIGGLE * (LNG_MAX - LNG_MIN) / N_GND
+    lat = lat + np.where(
+        k_lat % m == 0, dlat * np.sin(np.pi * (k_lng % m) / m), 0
+    )
+    lng = lng + np.where(
+        k_lng % m == 0, dlng * np.sin(np.pi * (k_lat % m) / m), 0
+    )
+    return lat, lng
+
+
+def get_polygon(i0, i1, j0, j1) -> shapely.Polygon:
+    # (i0, i1, j0, j1) are GND cell indices, along lat and lng
+    m = N_VERTICES_PER_GND_EDGE
+    k_lat0, k_lat1, k_lng0, k_lng1 = i0 * m, i1 * m, j0 * m, j1 * m
+    k_lngs = np.arange(k_lng0, k_lng1)
+    k_lats = np.arange(k_lat0, k_lat1)
+    k_lat = np.concatenate(
+        [
+            np.full(len(k_lngs), k_lat0),
+            k_lats,
+            np.full(len(k_lngs), k_lat1),
+            k_lats[::-1] + 1,
+        ]
+    )
+    k_lng = np.concatenate(
+        [
+            k_lngs,
+            np.full(len(k_lats), k_lng1),
+            k_lngs[::-1] + 1,
+            np.full(len(k_lats), k_lng0),
+        ]
+    )
+    lat, lng = get_lat_lng(k_lat, k_lng)
+    return shapely.Polygon(np.column_stack([lng, lat]))
+
+
+def build_ents_and_geoms() -> dict[str, tuple[list[Ent], list]]:
+    rng = np.random.default_rng(0)
+    ent_type_to_ents_and_geoms = {
+        ent_type.name: ([], []) for ent_type in EntFuture.REGION_ENT_TYPES
+    }
+
+    def add_children(parent_id, bbox, i_level):
+        if i_level == len(N_SPLITS):
+            return
+        ent_type = EntFuture.REGION_ENT_TYPES[i_level]
+        ents, geoms = ent_type_to_ents_and_geoms[ent_type.name]
+        n = N_SPLITS[i_level]
+        n_digits = [1, 1, 2, 3][i_level]
+        i0, i1, j0, j1 = bbox
+        di, dj = (i1 - i0) // n, (j1 - j0) // n
+        for i in range(n):
+            for j in range(n):
+                ent_id = f"{parent_id}{i * n + j + 1:0{n_digits}d}"
+                child_bbox = (
+                    i0 + i * di,
+                    i0 + (i + 1) * di,
+                    j0 + j * dj,
+                    j0 + (j + 1) * dj,
+                )
+                geom = shapely.MultiPolygon([get_polygon(*child_bbox)])
+                centroid = shapely.centroid(geom)
+                ents.append(
+                    Ent(
+                        dict(
+                            id=ent_id,
+                            name=f"Synthetic {ent_id}",
+                            centroid=[centroid.y, centroid.x],
+                            population=int(rng.integers(1_000, 100_000)),
+                        )
+                    )
+                )
+                geoms.append(geom)
+                add_children(ent_id, child_bbox, i_level + 1)
+
+    add_children("LK-", (0, N_GND, 0, N_GND), 0)
+    return ent_type_to_ents_and_geoms
+
+
+def register():
+    # Puts the synthetic ents in place of gig's, so that nothing hits
+    # the network. Indexes and other values derived from gig's ents are
+    # rebuilt from these.
+    for ent_type_name, (ents, geoms) in build_ents_and_geoms().items():
+        ent_type = getattr(EntType, ent_type_name.upper())
+        EntGeoStore.set_for_type(ent_type, ents, geoms)
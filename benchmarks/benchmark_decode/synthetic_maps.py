@@ -0,0 +1,97 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from synthetic_ents import LAT_MAX, LAT_MIN, LNG_MAX, LNG_MIN
+
+# Maps like tests/inputs/lk-elephant-corridors.png: a few label colors
+# on white, with noisy fills, as in scanned or compressed maps.
+BASE_SIZE = (455, 654)
+MARGIN = 0.05
+COLOR_BACKGROUND = (255, 255, 255)
+COLOR_TO_LABEL = {
+    (81, 174, 200): "Temporary Corridors",
+    (20, 167, 85): "Permanent Corridors and Parks",
+}
+N_BLOBS = 60
+
+
+def get_xy(latlng: tuple[float, float], size: tuple[int, int]) -> tuple:
+    width, height = size
+    lat, lng = latlng
+    fx = (lng - LNG_MIN) / (LNG_MAX - LNG_MIN)
+    fy = (LAT_MAX - lat) / (LAT_MAX - LAT_MIN)
+    return (
+        round(width * (MARGIN + (1 - 2 * MARGIN) * fx)),
+        round(height * (MARGIN + (1 - 2 * MARGIN) * fy)),
+    )
+
+
+def get_reference_list(size: tuple[int, int]) -> list[dict]:
+    lat_mid = (LAT_MIN + LAT_MAX) / 2
+    lng_mid = (LNG_MIN + LNG_MAX) / 2
+    reference_list = []
+    for label, latlng, extreme_point in [
+        ("North", (LAT_MAX, lng_mid), "N"),
+        ("South", (LAT_MIN, lng_mid), "S"),
+        ("West", (lat_mid, LNG_MIN), "W"),
+        ("East", (lat_mid, LNG_MAX), "E"),
+        ("North West", (LAT_MAX, LNG_MIN), None),
+        ("North East", (LAT_MAX, LNG_MAX), None),
+        ("South West", (LAT_MIN, LNG_MIN), None),
+        ("South East", (LAT_MIN, LNG_MAX), None),
+        ("Centre", (lat_mid, lng_mid), None),
+    ]:
+        reference_list.append(
+            dict(
+                label=label,
+                xy=get_xy(latlng, size),
+                latlng=latlng,
+                extreme_point=extreme_point,
+            )
+        )
+    return reference_list
+
+
+def get_size(scale: int) -> tuple[int, int]:
+    return (BASE_SIZE[0] * scale, BASE_SIZE[1] * scale)
+
+
+def build_image(scale: int) -> Image.Image:
+    rng = np.random.default_rng(scale)
+    size = get_size(scale)
+    width, height = size
+    image = Image.new("RGB", size, COLOR_BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    colors = list(COLOR_TO_LABEL.keys())
+    for i in range(N_BLOBS):
+        cx = rng.uniform(0.1, 0.9) * width
+        cy = rng.uniform(0.1, 0.9) * height
+        rx = rng.uniform(0.02, 0.08) * width
+        ry = rng.uniform(0.02, 0.08) * height
+        draw.ellipse(
+            [cx - rx, cy - ry, cx + rx, cy + ry],
+            fill=colors[i % len(colors)],
+        )
+
+    # Noise on foreground pixels only, so the background stays uniform
+    rgb = np.array(image, dtype=np.int16)
+    is_foreground = (rgb != COLOR_BACKGROUND).any(axis=2)
+    noise = rng.integers(-8, 9, size=rgb.shape, dtype=np.int16)
+    rgb[is_foreground] += noise[is_foreground]
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8))
+
+
+def get_color_to_label(color_matrix: np.ndarray) -> dict[tuple, str]:
+    # As with real maps, the keys are read off the clustered colors
+    # (which noise moves away from the drawn ones), and each is given
+    # the label of the nearest drawn color.
+    colors = np.unique((color_matrix.reshape(-1, 3) * 255).astype(int), axis=0)
+    drawn_colors = np.array(list(COLOR_TO_LABEL.keys()))
+    labels = list(COLOR_TO_LABEL.values())
+    color_to_label = {}
+    for color in colors:
+        if tuple(color.tolist()) == COLOR_BACKGROUND:
+            continue
+        i = int(((drawn_colors - color) ** 2).sum(axis=1).argmin())
+        color_to_label[tuple(color.tolist())] = labels[i]
+    return color_to_label
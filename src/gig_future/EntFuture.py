@@ -1,31 +1,26 @@
+import numpy as np
 from gig import Ent, EntType
-from shapely.geometry import Point
-from utils import LatLng
+
+from gig_future.EntIndex import EntIndex
 
 
 class EntFuture(Ent):
+    REGION_ENT_TYPES = [
+        EntType.PROVINCE,
+        EntType.DISTRICT,
+        EntType.DSD,
+        EntType.GND,
+    ]
 
     @classmethod
     def from_latlng(
         cls,
         latlng: tuple[float, float],
         region_ent_type: EntType = EntType.PROVINCE,
-        parent_ent_id: str = "LK",
+        parent_ent_id: str = EntIndex.ROOT_ENT_ID,
     ) -> str:
-        ents = Ent.list_from_type(region_ent_type)
-        candidate_ents = [ent for ent in ents if parent_ent_id in ent.id]
-        sorted_candidate_ents = sorted(
-            candidate_ents,
-            key=lambda ent: LatLng(*latlng).distance(LatLng(*ent.centroid)),
-        )
-        lat, lng = latlng
-        point = Point(lng, lat)
-        for ent in sorted_candidate_ents:
-            geo = ent.geo()
-            if geo.geometry.contains(point).any():
-                return ent
-
-        return None
+        ent_index = EntIndex.for_type(region_ent_type)
+        return ent_index.find(latlng, parent_ent_id)
 
     @classmethod
     def idx_regions_from_latlng(
@@ -34,13 +29,8 @@ class EntFuture(Ent):
         map_ent_type: EntType = EntType.GND,
     ) -> dict:
         region_hierarchy = {}
-        parent_ent_id = "LK"
-        for ent_type in [
-            EntType.PROVINCE,
-            EntType.DISTRICT,
-            EntType.DSD,
-            EntType.GND,
-        ]:
+        parent_ent_id = EntIndex.ROOT_ENT_ID
+        for ent_type in cls.REGION_ENT_TYPES:
             ent = cls.from_latlng(latlng, ent_type, parent_ent_id)
             if ent is None:
                 return region_hierarchy
@@ -50,3 +40,29 @@ class EntFuture(Ent):
                 break
 
         return region_hierarchy
+
+    @classmethod
+    def idx_regions_from_latlng_list(
+        cls,
+        latlngs: np.ndarray,
+        map_ent_type: EntType = EntType.GND,
+    ) -> dict[str, np.ndarray]:
+        latlngs = np.asarray(latlngs, dtype=float).reshape(-1, 2)
+        n = len(latlngs)
+        region_hierarchy = {}
+        parent_ent_ids = np.full(n, EntIndex.ROOT_ENT_ID, dtype=object)
+        active = np.arange(n)
+        for ent_type in cls.REGION_ENT_TYPES:
+            ent_index = EntIndex.for_type(ent_type)
+            idxs = ent_index.find_idxs(latlngs[active], parent_ent_ids[active])
+            is_found = idxs >= 0
+            active = active[is_found]
+
+            ent_ids = np.full(n, None, dtype=object)
+            ent_ids[active] = ent_index.ent_ids[idxs[is_found]]
+            region_hierarchy[ent_type.name] = ent_ids
+            parent_ent_ids = ent_ids
+            if ent_type.name == map_ent_type.name:
+                break
+
+        return region_hierarchy
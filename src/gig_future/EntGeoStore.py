@@ -0,0 +1,153 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import time
+from functools import cached_property
+from typing import Callable
+
+import numpy as np
+import shapely
+from gig import Ent, EntType
+from utils import JSONFile, Log
+
+from utils_future import CacheDir
+
+log = Log("EntGeoStore")
+
+
+class EntGeoStore:
+    # Pre-parsed ent geometries, stored on disk as one flat WKB buffer
+    # plus offsets (both memory-mappable .npy files), under a directory
+    # keyed by the gig version and a hash of the fetched ent records,
+    # in the private CacheDir, since every lookup trusts these geometries.
+    DIR_NAME = "ent_geo"
+    # ent_type.name -> EntGeoStore (EntType is not hashable)
+    _store_cache = {}
+
+    def __init__(self, ent_type: EntType, ents: list[Ent], geoms: list):
+        self.ent_type = ent_type
+        self.ents = ents
+        self.geoms = np.asarray(geoms, dtype=object)
+        self.ent_id_to_idx = {ent.id: i for i, ent in enumerate(ents)}
+
+    def get_geom(self, ent_id: str):
+        return self.geoms[self.ent_id_to_idx[ent_id]]
+
+    @cached_property
+    def data_version(self) -> str:
+        # Hash of the geometries themselves, for caches of values derived
+        # from them (e.g. EntRaster, StageCache)
+        return hashlib.md5(b"".join(shapely.to_wkb(self.geoms))).hexdigest()
+
+    @staticmethod
+    def get_source_version(ents: list[Ent]) -> str:
+        # Hash of the ent records as fetched from gig (ids, centroids,
+        # areas, ...), which change whenever the boundaries do, so that
+        # new boundaries are fetched into a new store.
+        gig_version = importlib.metadata.version("gig-nuuuwan")
+        records_hash = hashlib.md5(
+            json.dumps(
+                [ent.d for ent in ents], sort_keys=True, default=str
+            ).encode()
+        ).hexdigest()[:16]
+        return f"{gig_version}-{records_hash}"
+
+    @staticmethod
+    def get_dir_store(ent_type: EntType, ents: list[Ent]) -> str:
+        return os.path.join(
+            CacheDir.get(EntGeoStore.DIR_NAME),
+            EntGeoStore.get_source_version(ents),
+            ent_type.name,
+        )
+
+    @staticmethod
+    def write_geoms(dir_store: str, ent_ids: list[str], geoms: list):
+        os.makedirs(dir_store, exist_ok=True)
+        wkbs = shapely.to_wkb(geoms)
+        offsets = np.cumsum([0] + [len(wkb) for wkb in wkbs])
+        buffer = np.frombuffer(b"".join(wkbs), dtype=np.uint8)
+        for name, arr in [("wkb.npy", buffer), ("offsets.npy", offsets)]:
+            CacheDir.write_atomic(
+                os.path.join(dir_store, name),
+                lambda path_tmp: np.save(path_tmp, arr),
+            )
+
+        # ids.json is written last, and marks the store as complete
+        CacheDir.write_atomic(
+            os.path.join(dir_store, "ids.json"),
+            lambda path_tmp: JSONFile(path_tmp).write(ent_ids),
+        )
+
+    @staticmethod
+    def read_geoms(dir_store: str) -> tuple[list[str], np.ndarray]:
+        ent_ids = JSONFile(os.path.join(dir_store, "ids.json")).read()
+        buffer = np.load(os.path.join(dir_store, "wkb.npy"), mmap_mode="r")
+        offsets = np.load(os.path.join(dir_store, "offsets.npy"))
+        wkbs = [
+            buffer[i_start:i_end].tobytes()
+            for i_start, i_end in zip(offsets[:-1], offsets[1:])
+        ]
+        return ent_ids, shapely.from_wkb(wkbs)
+
+    @classmethod
+    def build(cls, ent_type: EntType) -> "EntGeoStore":
+        t_start = time.time()
+        ents = Ent.list_from_type(ent_type)
+        ent_ids = [ent.id for ent in ents]
+        dir_store = cls.get_dir_store(ent_type, ents)
+
+        if os.path.exists(os.path.join(dir_store, "ids.json")):
+            stored_ent_ids, geoms = cls.read_geoms(dir_store)
+            assert stored_ent_ids == ent_ids, dir_store
+            source = "disk"
+        else:
+            geoms = [ent.geo().geometry.iloc[0] for ent in ents]
+            cls.write_geoms(dir_store, ent_ids, geoms)
+            source = "gig"
+
+        dt = time.time() - t_start
+        log.debug(
+            f"Loaded {len(ents)} {ent_type.name} geoms"
+            + f" from {source} ({dt:.2f}s)"
+        )
+        return cls(ent_type, ents, geoms)
+
+    @classmethod
+    def for_type(cls, ent_type: EntType) -> "EntGeoStore":
+        if ent_type.name not in cls._store_cache:
+            cls._store_cache[ent_type.name] = cls.build(ent_type)
+        return cls._store_cache[ent_type.name]
+
+    @classmethod
+    def set_for_type(
+        cls, ent_type: EntType, ents: list[Ent], geoms: list
+    ) -> "EntGeoStore":
+        # Uses ents and geoms for ent_type in place of gig's, e.g. in
+        # tests and offline benchmarks. Values derived from the old store
+        # (see get_derived) are rebuilt on their next use.
+        store = cls(ent_type, ents, geoms)
+        cls._store_cache[ent_type.name] = store
+        return store
+
+    @classmethod
+    def reset(cls):
+        # Forgets every store, set or loaded, so the next for_type loads
+        # gig's again.
+        cls._store_cache.clear()
+
+    @classmethod
+    def get_derived(
+        cls,
+        ent_type: EntType,
+        cache: dict,
+        func: Callable[["EntGeoStore"], object],
+    ):
+        # For caches of values built from a store (indexes, boundary
+        # paths, ...): cache maps ent_type.name -> (store, func(store)),
+        # and an entry is rebuilt if ent_type's store has been replaced.
+        store = cls.for_type(ent_type)
+        entry = cache.get(ent_type.name)
+        if entry is None or entry[0] is not store:
+            entry = cache[ent_type.name] = (store, func(store))
+        return entry[1]
@@ -0,0 +1,156 @@
+import time
+
+import numpy as np
+import shapely
+from gig import Ent, EntType
+from shapely import STRtree
+from shapely.geometry import Point
+from utils import LatLng, Log
+
+from gig_future.EntGeoStore import EntGeoStore
+
+log = Log("EntIndex")
+
+
+class EntIndex:
+    ROOT_ENT_ID = "LK"
+    # ent_type.name -> (EntGeoStore, EntIndex) (EntType is not hashable)
+    _idx_cache = {}
+
+    def __init__(self, ents: list[Ent], geoms: list):
+        self.ents = ents
+        self.ent_ids = np.array([ent.id for ent in ents], dtype=object)
+        self.geoms = np.asarray(geoms, dtype=object)
+        shapely.prepare(self.geoms)
+        self.tree = STRtree(self.geoms)
+        # (lat, lng), and (min_lng, min_lat, max_lng, max_lat), per ent
+        self.centroids = np.array(
+            [ent.centroid for ent in ents], dtype=float
+        ).reshape(-1, 2)
+        self.bboxes = shapely.bounds(self.geoms).reshape(-1, 4)
+
+        # ancestor id -> idxs of the ents under it, at any depth, so the
+        # root id lists every ent
+        parent_to_idx_list = {}
+        for i, ent_id in enumerate(self.ent_ids):
+            for ancestor_id in EntIndex.get_ancestor_ent_ids(ent_id):
+                parent_to_idx_list.setdefault(ancestor_id, []).append(i)
+        self.parent_to_idxs = {
+            parent_ent_id: np.array(idx_list, dtype=int)
+            for parent_ent_id, idx_list in parent_to_idx_list.items()
+        }
+
+    @classmethod
+    def build(cls, store: EntGeoStore) -> "EntIndex":
+        t_start = time.time()
+        ent_index = cls(store.ents, store.geoms)
+        dt = time.time() - t_start
+        log.debug(
+            f"Built {store.ent_type.name} index"
+            + f" ({len(store.ents)} ents, {dt:.2f}s)"
+        )
+        return ent_index
+
+    @classmethod
+    def for_type(cls, ent_type: EntType) -> "EntIndex":
+        return EntGeoStore.get_derived(ent_type, cls._idx_cache, cls.build)
+
+    @staticmethod
+    def get_ancestor_ent_ids(ent_id: str) -> list[str]:
+        # Ids nest by prefix (LK, LK-1, LK-11, LK-1127, LK-1127015), so
+        # the ancestors are the shorter prefixes of a valid id length.
+        id_lengths = EntType.ID_TYPE_CONFIG.get(ent_id.partition("-")[0], {})
+        return [ent_id[:n] for n in sorted(id_lengths) if n < len(ent_id)]
+
+    def get_child_idxs(self, parent_ent_id: str) -> np.ndarray:
+        return self.parent_to_idxs.get(parent_ent_id, np.zeros(0, dtype=int))
+
+    def get_distance(self, latlng: tuple[float, float], i: int) -> float:
+        return LatLng(*latlng).distance(LatLng(*self.centroids[i]))
+
+    def find(
+        self,
+        latlng: tuple[float, float],
+        parent_ent_id: str = ROOT_ENT_ID,
+    ) -> Ent | None:
+        lat, lng = latlng
+        point = Point(lng, lat)
+        if parent_ent_id == EntIndex.ROOT_ENT_ID:
+            candidate_idxs = self.tree.query(point).tolist()
+        else:
+            child_idxs = self.get_child_idxs(parent_ent_id)
+            min_lngs, min_lats, max_lngs, max_lats = self.bboxes[child_idxs].T
+            candidate_idxs = child_idxs[
+                (min_lngs <= lng)
+                & (lng <= max_lngs)
+                & (min_lats <= lat)
+                & (lat <= max_lats)
+            ].tolist()
+        sorted_candidate_idxs = sorted(
+            candidate_idxs,
+            key=lambda i: self.get_distance(latlng, i),
+        )
+        for i in sorted_candidate_idxs:
+            if self.geoms[i].contains(point):
+                return self.ents[i]
+
+        return None
+
+    def find_idxs(
+        self,
+        latlngs: np.ndarray,
+        parent_ent_ids: np.ndarray,
+    ) -> np.ndarray:
+        # Batch version of find. Returns, for each (lat, lng) row, the
+        # index into self.ents of the containing ent, or -1.
+        latlngs = np.asarray(latlngs, dtype=float).reshape(-1, 2)
+        n = len(latlngs)
+        idxs = np.full(n, -1, dtype=int)
+        if n == 0:
+            return idxs
+
+        points = shapely.points(latlngs[:, 1], latlngs[:, 0])
+        point_idxs, ent_idxs = self.tree.query(points, predicate="within")
+
+        # Keep only the hits under each point's parent. Hits are grouped
+        # by parent, so that each group is checked against
+        # parent_to_idxs once. Every ent is under the root, so its hits
+        # need no check.
+        parent_to_code = {}
+        parent_codes = np.fromiter(
+            (
+                parent_to_code.setdefault(parent_ent_id, len(parent_to_code))
+                for parent_ent_id in parent_ent_ids
+            ),
+            dtype=int,
+            count=n,
+        )
+        pair_parent_codes = parent_codes[point_idxs]
+        groups = np.split(
+            np.argsort(pair_parent_codes, kind="stable"),
+            np.cumsum(
+                np.bincount(pair_parent_codes, minlength=len(parent_to_code))
+            )[:-1],
+        )
+        is_child = np.ones(len(point_idxs), dtype=bool)
+        for parent_ent_id, group in zip(parent_to_code, groups):
+            if parent_ent_id == EntIndex.ROOT_ENT_ID:
+                continue
+            is_child[group] = np.isin(
+                ent_idxs[group], self.get_child_idxs(parent_ent_id)
+            )
+        point_idxs = point_idxs[is_child]
+        ent_idxs = ent_idxs[is_child]
+        idxs[point_idxs] = ent_idxs
+
+        # A point on a shared edge can fall in more than one ent.
+        # Resolve these the same way as find: nearest centroid wins.
+        unique_point_idxs, counts = np.unique(point_idxs, return_counts=True)
+        for i in unique_point_idxs[counts > 1]:
+            latlng = tuple(latlngs[i])
+            idxs[i] = min(
+                ent_idxs[point_idxs == i],
+                key=lambda j: self.get_distance(latlng, j),
+            )
+
+        return idxs
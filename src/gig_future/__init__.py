@@ -2,3 +2,5 @@
 # flake8: noqa: F408
 
 from gig_future.EntFuture import EntFuture
+from gig_future.EntGeoStore import EntGeoStore
+from gig_future.EntIndex import EntIndex
@@ -0,0 +1,86 @@
+import numpy as np
+from utils import JSONFile, Log
+
+log = Log("ColorPalette")
+
+
+class ColorPalette:
+    # A fitted set of colors (e.g. a publisher's legend). Applying it to
+    # an image is nearest-color assignment alone, with no clustering.
+
+    def __init__(
+        self,
+        colors: list[tuple[float, float, float]],
+        labels: list[str] = None,
+    ):
+        self.colors = np.asarray(colors, dtype=np.float64).reshape(-1, 3)
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.colors)
+
+    @staticmethod
+    def from_color_to_label(
+        color_to_label: dict[tuple, str],
+        color_background: tuple[int, int, int],
+    ) -> "ColorPalette":
+        colors = list(color_to_label.keys())
+        labels = list(color_to_label.values())
+        if tuple(color_background) not in color_to_label:
+            colors.append(tuple(color_background))
+            labels.append(None)
+        return ColorPalette(colors, labels)
+
+    @staticmethod
+    def get_unique_colors(
+        pixels: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Colors are packed into integer keys, which is much faster to
+        # unique than np.unique(..., axis=0).
+        rgb = np.clip(np.rint(pixels), 0, 255).astype(np.int64)
+        keys = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+        unique_keys, inverse, counts = np.unique(
+            keys, return_inverse=True, return_counts=True
+        )
+        colors = np.column_stack(
+            [unique_keys >> 16, (unique_keys >> 8) & 0xFF, unique_keys & 0xFF]
+        ).astype(np.float64)
+        return colors, inverse.reshape(-1), counts
+
+    @staticmethod
+    def get_nearest(
+        colors: np.ndarray,
+        palette_colors: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        d2 = (
+            (colors[:, np.newaxis, :] - palette_colors[np.newaxis, :, :]) ** 2
+        ).sum(axis=2)
+        idxs = d2.argmin(axis=1)
+        return idxs, d2[np.arange(len(colors)), idxs]
+
+    def assign(self, pixels: np.ndarray) -> np.ndarray:
+        # Index of the nearest palette color for each pixel. Distances
+        # are computed once per distinct color, not once per pixel.
+        pixels = pixels.reshape(-1, 3)
+        colors, inverse, _ = ColorPalette.get_unique_colors(pixels)
+        idxs, _ = ColorPalette.get_nearest(colors, self.colors)
+        return idxs[inverse]
+
+    def apply(self, color_array: np.ndarray) -> np.ndarray:
+        idxs = self.assign(color_array)
+        return self.colors[idxs].reshape(color_array.shape)
+
+    def to_dict(self) -> dict:
+        return dict(colors=self.colors.tolist(), labels=self.labels)
+
+    @staticmethod
+    def from_dict(d: dict) -> "ColorPalette":
+        return ColorPalette(d["colors"], d.get("labels"))
+
+    def write(self, path: str):
+        JSONFile(path).write(self.to_dict())
+        log.debug(f"Wrote {path}")
+
+    @staticmethod
+    def read(path: str) -> "ColorPalette":
+        return ColorPalette.from_dict(JSONFile(path).read())
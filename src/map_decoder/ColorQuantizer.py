@@ -0,0 +1,143 @@
+import time
+
+import numpy as np
+from utils import Log
+
+from map_decoder.ColorPalette import ColorPalette
+
+log = Log("ColorQuantizer")
+
+
+class ColorQuantizer:
+    BACKENDS = [
+        "kmeans",
+        "unique_kmeans",
+        "minibatch_kmeans",
+        "median_cut",
+    ]
+
+    def __init__(
+        self,
+        n_clusters: int,
+        backend: str = "kmeans",
+        sample_size: int = 100_000,
+        random_state: int = 42,
+    ):
+        if backend not in ColorQuantizer.BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+
+        self.n_clusters = n_clusters
+        self.backend = backend
+        self.sample_size = sample_size
+        self.random_state = random_state
+
+        self.cluster_centers = None
+        self.kmeans_labels = None
+        self.fit_time = None
+        self.inertia = None
+
+    @property
+    def report(self) -> dict:
+        return dict(
+            backend=self.backend,
+            n_clusters=len(self.cluster_centers),
+            fit_time=self.fit_time,
+            inertia=self.inertia,
+        )
+
+    @staticmethod
+    def median_cut(
+        colors: np.ndarray,
+        counts: np.ndarray,
+        n_clusters: int,
+    ) -> np.ndarray:
+        boxes = [np.arange(len(colors))]
+        while len(boxes) < n_clusters:
+            ranges = [np.ptp(colors[box], axis=0).max() for box in boxes]
+            i_box = int(np.argmax(ranges))
+            if ranges[i_box] == 0:
+                break
+            box = boxes.pop(i_box)
+            channel = np.ptp(colors[box], axis=0).argmax()
+            box = box[np.argsort(colors[box, channel], kind="stable")]
+            cum_counts = np.cumsum(counts[box])
+            i_split = np.searchsorted(cum_counts, cum_counts[-1] / 2)
+            i_split = min(max(i_split, 1), len(box) - 1)
+            boxes.extend([box[:i_split], box[i_split:]])
+
+        return np.array(
+            [
+                np.average(colors[box], axis=0, weights=counts[box])
+                for box in boxes
+            ]
+        )
+
+    def fit_centers(
+        self,
+        pixels: np.ndarray,
+        colors: np.ndarray,
+        counts: np.ndarray,
+    ) -> np.ndarray:
+        if len(colors) <= self.n_clusters:
+            return colors
+
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+
+        if self.backend == "kmeans":
+            kmeans = KMeans(
+                n_clusters=self.n_clusters,
+                random_state=self.random_state,
+                n_init=10,
+            )
+            kmeans.fit(pixels)
+            self.kmeans_labels = kmeans.labels_
+            return kmeans.cluster_centers_
+
+        if self.backend == "unique_kmeans":
+            kmeans = KMeans(
+                n_clusters=self.n_clusters,
+                random_state=self.random_state,
+                n_init=10,
+            )
+            kmeans.fit(colors, sample_weight=counts)
+            return kmeans.cluster_centers_
+
+        if self.backend == "minibatch_kmeans":
+            rng = np.random.default_rng(self.random_state)
+            n_sample = min(self.sample_size, len(pixels))
+            sample = pixels[rng.choice(len(pixels), n_sample, replace=False)]
+            kmeans = MiniBatchKMeans(
+                n_clusters=self.n_clusters,
+                random_state=self.random_state,
+                n_init=3,
+            )
+            kmeans.fit(sample)
+            return kmeans.cluster_centers_
+
+        return ColorQuantizer.median_cut(colors, counts, self.n_clusters)
+
+    def fit(self, pixels: np.ndarray) -> "ColorQuantizer":
+        t_start = time.time()
+        pixels = pixels.reshape(-1, 3)
+        colors, _, counts = ColorPalette.get_unique_colors(pixels)
+        self.kmeans_labels = None
+        self.cluster_centers = self.fit_centers(pixels, colors, counts)
+        self.fit_time = time.time() - t_start
+
+        # Inertia over every pixel, for all backends alike
+        _, d2 = ColorPalette.get_nearest(colors, self.cluster_centers)
+        self.inertia = float((d2 * counts).sum())
+        log.debug(f"{self.report=} ({len(colors)} unique colors)")
+        return self
+
+    def get_palette(self) -> ColorPalette:
+        return ColorPalette(self.cluster_centers)
+
+    def predict(self, pixels: np.ndarray) -> np.ndarray:
+        return self.get_palette().assign(pixels)
+
+    def fit_predict(self, pixels: np.ndarray) -> np.ndarray:
+        self.fit(pixels)
+        if self.kmeans_labels is not None:
+            return self.kmeans_labels
+        return self.predict(pixels)
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable
+
+from utils import Log
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = Log("DecodeMetrics")
+
+
+class DecodeMetrics:
+    # Per-stage wall time, CPU time (including worker processes) and,
+    # if trace_memory, peak traced memory, plus counters. Stages may be
+    # nested. Without trace_memory, the process's peak RSS so far is
+    # recorded instead, which costs nothing to read. hook, if given, is
+    # called with each stage's dict as it ends, e.g. to forward it to a
+    # metrics system. details holds any other per-decode facts, such as
+    # the color quantizer's fit.
+    def __init__(
+        self,
+        hook: Callable[[dict], None] = None,
+        trace_memory: bool = False,
+    ):
+        self.hook = hook
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.counters = {}
+        self.details = {}
+        self.stack = []
+
+    @staticmethod
+    def get_cpu_time() -> float:
+        # os.times includes children, so pool workers are counted once
+        # they have been joined.
+        t = os.times()
+        return t.user + t.system + t.children_user + t.children_system
+
+    @staticmethod
+    def get_max_rss() -> int | None:
+        # Peak resident set size of this process, in bytes (ru_maxrss is
+        # in bytes on macOS, and in KB elsewhere)
+        if resource is None:
+            return None
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1_024
+
+    def count(self, name: str, n: int = 1):
+        n = int(n)
+        self.counters[name] = self.counters.get(name, 0) + n
+        for frame in self.stack:
+            frame["counters"][name] = frame["counters"].get(name, 0) + n
+
+    def update_peaks(self):
+        # tracemalloc has one peak, so before it is reset, the peak so
+        # far is carried into every open stage.
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self.stack:
+            frame["peak"] = max(frame["peak"], peak)
+
+    @contextmanager
+    def stage(self, name: str):
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            self.update_peaks()
+            tracemalloc.reset_peak()
+
+        frame = dict(
+            name=name,
+            depth=len(self.stack),
+            counters={},
+            peak=0,
+            memory_start=(
+                tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+            ),
+        )
+        self.stack.append(frame)
+        t_start = time.perf_counter()
+        cpu_start = DecodeMetrics.get_cpu_time()
+        try:
+            yield self
+        finally:
+            wall_time = time.perf_counter() - t_start
+            cpu_time = DecodeMetrics.get_cpu_time() - cpu_start
+            peak_memory = None
+            max_rss = None
+            if self.trace_memory:
+                self.update_peaks()
+                peak_memory = frame["peak"] - frame["memory_start"]
+                if started_tracing:
+                    tracemalloc.stop()
+            else:
+                max_rss = DecodeMetrics.get_max_rss()
+            self.stack.pop()
+
+            d = dict(
+                name=name,
+                depth=frame["depth"],
+                wall_time=wall_time,
+                cpu_time=cpu_time,
+                peak_memory=peak_memory,
+                max_rss=max_rss,
+                counters=frame["counters"],
+            )
+            self.stages.append(d)
+            log.debug(
+                f"[{name}] wall_time={wall_time:.3f}s"
+                + f", cpu_time={cpu_time:.3f}s"
+                + (
+                    f", peak_memory={peak_memory / 1_000_000:.1f}MB"
+                    if peak_memory is not None
+                    else ""
+                )
+                + (
+                    f", max_rss={max_rss / 1_000_000:.1f}MB"
+                    if max_rss is not None
+                    else ""
+                )
+            )
+            if self.hook:
+                self.hook(d)
+
+    @property
+    def report(self) -> dict:
+        # Stages are listed in the order they finished, so nested stages
+        # come before the stage that contains them.
+        return dict(
+            stages=list(self.stages),
+            counters=dict(self.counters),
+            details=dict(self.details),
+            wall_time=sum(
+                d["wall_time"] for d in self.stages if not d["depth"]
+            ),
+            cpu_time=sum(d["cpu_time"] for d in self.stages if not d["depth"]),
+            max_rss=(
+                None if self.trace_memory else DecodeMetrics.get_max_rss()
+            ),
+        )
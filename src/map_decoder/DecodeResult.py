@@ -0,0 +1,191 @@
+import os
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+import numpy as np
+from PIL import Image
+from utils import JSONFile, Log
+
+from map_decoder.DecodeMetrics import DecodeMetrics
+from map_decoder.InfoTable import InfoTable
+
+if TYPE_CHECKING:
+    from gig import EntType
+
+log = Log("DecodeResult")
+
+
+class DecodeResult:
+    # What MapDecoder.decode returns. info_table (or info_list) is
+    # computed up front; info_list, statistics and images are computed on
+    # first access, then cached, so a numbers-only run never renders
+    # anything, or builds a dict per sample.
+    #
+    # Iterating yields the old 6-tuple, so existing code like
+    # (info_list, ..., image_for_ents) = md.decode(...) keeps working.
+    FIELDS = [
+        "info_list",
+        "image_inspection",
+        "image_info_list",
+        "most_common_colors",
+        "ent_to_label_to_n",
+        "image_for_ents",
+    ]
+
+    def __init__(
+        self,
+        map_decoder,
+        reference_list: list[dict],
+        color_reference_point: tuple[int, int, int],
+        color_map_boundaries: tuple[int, int, int],
+        box_size_lat: int,
+        map_ent_type: "EntType",
+        title: str,
+        color_to_label: dict[tuple, str],
+        renderer: str = "matplotlib",
+        metrics: DecodeMetrics = None,
+        *,
+        info_table: InfoTable = None,
+        info_list: list[dict] = None,
+        color_idx_matrix: np.ndarray = None,
+        color_table: np.ndarray = None,
+    ):
+        # Give info_table, or, without one, info_list; info_list is
+        # otherwise derived from info_table when first read.
+        if info_table is None and info_list is None:
+            raise ValueError("DecodeResult needs info_table or info_list")
+        self.map_decoder = map_decoder
+        self.info_table = info_table
+        if info_list is not None:
+            self.info_list = info_list
+        self.reference_list = reference_list
+        self.color_reference_point = color_reference_point
+        self.color_map_boundaries = color_map_boundaries
+        self.box_size_lat = box_size_lat
+        self.map_ent_type = map_ent_type
+        self.title = title
+        self.color_to_label = color_to_label
+        self.renderer = renderer
+        self.metrics = metrics or DecodeMetrics()
+        self.color_idx_matrix = color_idx_matrix
+        self.color_table = color_table
+
+    def __iter__(self):
+        for field in DecodeResult.FIELDS:
+            yield getattr(self, field)
+
+    def __len__(self):
+        return len(DecodeResult.FIELDS)
+
+    def __getitem__(self, i: int):
+        return getattr(self, DecodeResult.FIELDS[i])
+
+    @property
+    def report(self) -> dict:
+        # Metrics for every stage run so far, including lazy ones
+        return self.metrics.report
+
+    @property
+    def info(self) -> InfoTable | list[dict]:
+        # Whichever form the aggregations can run on fastest
+        if self.info_table is not None:
+            return self.info_table
+        return self.info_list
+
+    @cached_property
+    def info_list(self) -> list[dict]:
+        with self.metrics.stage("build_info_list"):
+            return self.info_table.to_info_list()
+
+    @cached_property
+    def most_common_colors(self) -> dict[tuple, float]:
+        with self.metrics.stage("most_common_colors"):
+            return self.map_decoder.get_most_common_colors(info_list=self.info)
+
+    @cached_property
+    def ent_to_label_to_n(self) -> dict[str, dict[str, int]]:
+        with self.metrics.stage("ent_to_label_to_n"):
+            return self.map_decoder.get_ent_to_label_to_n(self.info)
+
+    @cached_property
+    def zonal_stats(self) -> dict[str, dict[str, dict]]:
+        with self.metrics.stage("zonal_stats"):
+            return self.map_decoder.get_zonal_stats(
+                color_idx_matrix=self.color_idx_matrix,
+                color_table=self.color_table,
+                reference_list=self.reference_list,
+                map_ent_type=self.map_ent_type,
+                color_to_label=self.color_to_label,
+                metrics=self.metrics,
+            )
+
+    @cached_property
+    def image_inspection(self) -> Image.Image:
+        with self.metrics.stage("image_inspection"):
+            return self.map_decoder.generate_inspection_image(
+                pil_image=self.map_decoder.pil_image,
+                reference_list=self.reference_list,
+                color_reference_point=self.color_reference_point,
+            )
+
+    @cached_property
+    def image_info_list(self) -> Image.Image:
+        with self.metrics.stage("image_info_list"):
+            if self.renderer == "pil":
+                return self.map_decoder.render_info_list_image(
+                    info_list=self.info_list,
+                    size=self.map_decoder.pil_image.size,
+                    reference_list=self.reference_list,
+                    color_map_boundaries=self.color_map_boundaries,
+                    box_size_lat=self.box_size_lat,
+                    map_ent_type=self.map_ent_type,
+                    title=self.title,
+                    color_to_label=self.color_to_label,
+                )
+            return self.map_decoder.generate_info_list_image(
+                info_list=self.info_list,
+                color_map_boundaries=self.color_map_boundaries,
+                box_size_lat=self.box_size_lat,
+                map_ent_type=self.map_ent_type,
+                title=self.title,
+                color_to_label=self.color_to_label,
+            )
+
+    @cached_property
+    def image_for_ents(self) -> Image.Image:
+        with self.metrics.stage("image_for_ents"):
+            if self.renderer == "pil":
+                return self.map_decoder.render_image_for_ents(
+                    ent_to_label_to_n=self.ent_to_label_to_n,
+                    size=self.map_decoder.pil_image.size,
+                    reference_list=self.reference_list,
+                    color_to_label=self.color_to_label,
+                    map_ent_type=self.map_ent_type,
+                    title=self.title,
+                    color_map_boundaries=self.color_map_boundaries,
+                )
+            return self.map_decoder.generate_image_for_ents(
+                ent_to_label_to_n=self.ent_to_label_to_n,
+                color_to_label=self.color_to_label,
+                map_ent_type=self.map_ent_type,
+                title=self.title,
+                color_map_boundaries=self.color_map_boundaries,
+            )
+
+    def write(self, dir_output: str, images: bool = True):
+        os.makedirs(dir_output, exist_ok=True)
+        JSONFile(os.path.join(dir_output, "info_list.json")).write(
+            self.info_list
+        )
+        JSONFile(os.path.join(dir_output, "ent_to_label_to_n.json")).write(
+            self.ent_to_label_to_n
+        )
+        if images:
+            for name, image in [
+                ("inspection.png", self.image_inspection),
+                ("info_list.png", self.image_info_list),
+                ("ents.png", self.image_for_ents),
+            ]:
+                image.save(os.path.join(dir_output, name))
+        JSONFile(os.path.join(dir_output, "report.json")).write(self.report)
+        log.debug(f"Wrote {dir_output}")
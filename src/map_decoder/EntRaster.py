@@ -0,0 +1,159 @@
+import json
+import os
+import time
+from typing import TYPE_CHECKING
+
+import numpy as np
+from utils import Hash, Log
+
+from utils_future import CacheDir, Poly2GeoMapper
+
+if TYPE_CHECKING:
+    from gig import EntType
+
+log = Log("EntRaster")
+
+
+class EntRaster:
+    # Integer raster, the same shape as the source image, holding the
+    # index (into ent_ids) of the map_ent_type ent under each pixel,
+    # or -1 where there is none.
+    DIR_NAME = "ent_raster"
+    NO_ENT = -1
+    # Bumped whenever build changes, so cached rasters are rebuilt
+    VERSION = 3
+
+    def __init__(self, ent_ids: list[str], raster: np.ndarray):
+        self.ent_ids = np.asarray(ent_ids, dtype=object)
+        self.raster = raster
+
+    def get_ent_ids(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        idxs = self.raster[ys, xs]
+        ent_ids = np.full(len(idxs), None, dtype=object)
+        has_ent = idxs != EntRaster.NO_ENT
+        ent_ids[has_ent] = self.ent_ids[idxs[has_ent]]
+        return ent_ids
+
+    @staticmethod
+    def get_key(
+        size: tuple[int, int],
+        reference_list: list[dict],
+        map_ent_type: "EntType",
+    ) -> str:
+        from gig_future import EntGeoStore
+
+        store = EntGeoStore.for_type(map_ent_type)
+        d = dict(
+            version=EntRaster.VERSION,
+            size=list(size),
+            xys=[list(ref["xy"]) for ref in reference_list],
+            latlngs=[list(ref["latlng"]) for ref in reference_list],
+            map_ent_type=map_ent_type.name,
+            data_version=store.data_version,
+        )
+        return Hash.md5(json.dumps(d))
+
+    @staticmethod
+    def build(
+        size: tuple[int, int],
+        reference_list: list[dict],
+        map_ent_type: "EntType",
+    ) -> "EntRaster":
+        import shapely
+
+        from gig_future import EntGeoStore
+
+        t_start = time.time()
+        inverse_params = Poly2GeoMapper.fit_inverse(
+            xys=[ref["xy"] for ref in reference_list],
+            latlngs=[ref["latlng"] for ref in reference_list],
+        )
+
+        # Straight edges in lat/lng are curves in pixel space, so edges
+        # are split to about a pixel long before being mapped.
+        lats = [ref["latlng"][0] for ref in reference_list]
+        ys = [ref["xy"][1] for ref in reference_list]
+        lat_per_pixel = (max(lats) - min(lats)) / (max(ys) - min(ys))
+
+        # Every ring of every ent is projected in one call
+        store = EntGeoStore.for_type(map_ent_type)
+        polygons, polygon_ent_idxs = shapely.get_parts(
+            shapely.segmentize(store.geoms, lat_per_pixel), return_index=True
+        )
+        rings, ring_polygon_idxs = shapely.get_rings(
+            polygons, return_index=True
+        )
+        ring_is_exterior = np.diff(ring_polygon_idxs, prepend=-1) != 0
+        coords, ring_idxs = shapely.get_coordinates(rings, return_index=True)
+        xs, ys = Poly2GeoMapper.transform_inverse(
+            (coords[:, 1], coords[:, 0]), inverse_params
+        )
+
+        # Each pixel takes the ent whose polygon contains the pixel's
+        # center, as the exact lookup does: no outline is drawn, so no
+        # ent grows into its neighbours. Each polygon, with its holes, is
+        # tested only at the pixels in its bounding box, so a hole never
+        # clears another ent (e.g. an enclave inside it).
+        width, height = size
+        raster = np.full((height, width), EntRaster.NO_ENT, dtype=np.int32)
+        pixel_rings = shapely.linearrings(
+            np.column_stack([xs, ys]), indices=ring_idxs
+        )
+        pixel_polygons = [
+            shapely.Polygon(
+                pixel_rings[i_rings[0]], holes=pixel_rings[i_rings[1:]]
+            )
+            for i_rings in np.split(
+                np.arange(len(rings)), np.flatnonzero(ring_is_exterior)[1:]
+            )
+        ]
+        shapely.prepare(pixel_polygons)
+        for pixel_polygon, i_ent in zip(
+            pixel_polygons, polygon_ent_idxs.tolist()
+        ):
+            min_x, min_y, max_x, max_y = pixel_polygon.bounds
+            x0, y0 = max(0, int(np.ceil(min_x))), max(0, int(np.ceil(min_y)))
+            x1 = min(width, int(np.floor(max_x)) + 1)
+            y1 = min(height, int(np.floor(max_y)) + 1)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            box_ys, box_xs = np.mgrid[y0:y1, x0:x1]
+            is_inside = shapely.contains_xy(pixel_polygon, box_xs, box_ys)
+            raster[y0:y1, x0:x1][is_inside] = i_ent
+
+        ent_raster = EntRaster(
+            [ent.id for ent in store.ents],
+            raster,
+        )
+        dt = time.time() - t_start
+        log.debug(f"Built {map_ent_type.name} raster {size} ({dt:.2f}s)")
+        return ent_raster
+
+    def write(self, path: str):
+        CacheDir.write_atomic(
+            path,
+            lambda path_tmp: np.savez_compressed(
+                path_tmp, ent_ids=self.ent_ids.astype(str), raster=self.raster
+            ),
+        )
+        log.debug(f"Wrote {path}")
+
+    @staticmethod
+    def read(path: str) -> "EntRaster":
+        data = np.load(path)
+        return EntRaster(data["ent_ids"].tolist(), data["raster"])
+
+    @staticmethod
+    def for_image(
+        size: tuple[int, int],
+        reference_list: list[dict],
+        map_ent_type: "EntType",
+    ) -> "EntRaster":
+        key = EntRaster.get_key(size, reference_list, map_ent_type)
+        path = os.path.join(CacheDir.get(EntRaster.DIR_NAME), f"{key}.npz")
+        if os.path.exists(path):
+            return EntRaster.read(path)
+
+        ent_raster = EntRaster.build(size, reference_list, map_ent_type)
+        ent_raster.write(path)
+        return ent_raster
@@ -0,0 +1,32 @@
+from utils import Log
+
+from map_decoder.InfoTable import InfoTable
+
+log = Log("InfoAggregator")
+
+
+class InfoAggregator:
+    # Running ent_to_label_to_n and color counts over a stream of
+    # InfoTables, so that nothing but the totals is kept. Since each
+    # update adds new ents, labels and colors in first-seen order, the
+    # totals equal those of one InfoTable holding every row.
+    def __init__(self):
+        self.n = 0
+        self.ent_to_label_to_n = {}
+        self.color_to_n = {}
+
+    def update(self, info_table: InfoTable) -> "InfoAggregator":
+        self.n += len(info_table)
+        for ent_id, label_to_n in info_table.get_ent_to_label_to_n().items():
+            if ent_id not in self.ent_to_label_to_n:
+                self.ent_to_label_to_n[ent_id] = {}
+            running = self.ent_to_label_to_n[ent_id]
+            for label, n in label_to_n.items():
+                running[label] = running.get(label, 0) + n
+        for color, n in info_table.get_color_to_n().items():
+            self.color_to_n[color] = self.color_to_n.get(color, 0) + n
+        return self
+
+    @property
+    def most_common_colors(self) -> dict[tuple, float]:
+        return InfoTable.get_most_common_colors_from_counts(self.color_to_n)
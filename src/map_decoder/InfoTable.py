@@ -0,0 +1,178 @@
+import numpy as np
+from utils import Log
+
+log = Log("InfoTable")
+
+
+class InfoTable:
+    # Columnar form of info_list: one row per sample, as NumPy arrays.
+    # ent ids, labels and colors are stored as integer codes into
+    # ent_ids, labels and color_table, so a row costs about 40 bytes,
+    # rather than several hundred for a dict of tuples.
+    def __init__(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        lats: np.ndarray,
+        lngs: np.ndarray,
+        ent_codes: np.ndarray,
+        label_codes: np.ndarray,
+        color_codes: np.ndarray,
+        ent_ids: np.ndarray,
+        labels: list[str],
+        color_table: np.ndarray,
+    ):
+        self.xs = np.asarray(xs, dtype=np.int32)
+        self.ys = np.asarray(ys, dtype=np.int32)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.ent_codes = np.asarray(ent_codes, dtype=np.int32)
+        self.label_codes = np.asarray(label_codes, dtype=np.int32)
+        self.color_codes = np.asarray(color_codes, dtype=np.int32)
+        self.ent_ids = np.asarray(ent_ids, dtype=object)
+        self.labels = list(labels)
+        self.color_table = np.asarray(color_table, dtype=int).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.xs)
+
+    @staticmethod
+    def encode(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # (categories, codes), with categories in first-seen order
+        categories, first_idxs, codes = np.unique(
+            values, return_index=True, return_inverse=True
+        )
+        order = np.argsort(first_idxs, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return categories[order], rank[codes.reshape(-1)]
+
+    @staticmethod
+    def from_info_list(info_list: list[dict]) -> "InfoTable":
+        if not info_list:
+            return InfoTable([], [], [], [], [], [], [], [], [], [])
+        xys = np.array([info["xy"] for info in info_list], dtype=np.int64)
+        latlngs = np.array([info["latlng"] for info in info_list], dtype=float)
+        colors = np.array([info["color"] for info in info_list], dtype=int)
+        ent_ids, ent_codes = InfoTable.encode(
+            np.array([info["ent_id"] for info in info_list], dtype=object)
+        )
+        labels, label_codes = InfoTable.encode(
+            np.array([info["label"] for info in info_list], dtype=object)
+        )
+        keys = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+        color_keys, color_codes = InfoTable.encode(keys)
+        color_table = np.column_stack(
+            [color_keys >> 16, (color_keys >> 8) & 0xFF, color_keys & 0xFF]
+        )
+        return InfoTable(
+            xs=xys[:, 0],
+            ys=xys[:, 1],
+            lats=latlngs[:, 0],
+            lngs=latlngs[:, 1],
+            ent_codes=ent_codes,
+            label_codes=label_codes,
+            color_codes=color_codes,
+            ent_ids=ent_ids,
+            labels=labels.tolist(),
+            color_table=color_table,
+        )
+
+    def to_info_list(self) -> list[dict]:
+        ent_ids = self.ent_ids[self.ent_codes].tolist()
+        labels = [self.labels[i] for i in self.label_codes.tolist()]
+        colors = [tuple(color) for color in self.color_table.tolist()]
+        return [
+            dict(
+                xy=(x, y),
+                latlng=(lat, lng),
+                ent_id=ent_id,
+                label=label,
+                color=colors[color_code],
+            )
+            for x, y, lat, lng, ent_id, label, color_code in zip(
+                self.xs.tolist(),
+                self.ys.tolist(),
+                self.lats.tolist(),
+                self.lngs.tolist(),
+                ent_ids,
+                labels,
+                self.color_codes.tolist(),
+            )
+        ]
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(
+            dict(
+                x=self.xs,
+                y=self.ys,
+                lat=self.lats,
+                lng=self.lngs,
+                ent_id=pd.Categorical.from_codes(
+                    self.ent_codes, categories=self.ent_ids
+                ),
+                label=pd.Categorical.from_codes(
+                    self.label_codes, categories=self.labels
+                ),
+                color_code=self.color_codes,
+            )
+        )
+
+    def get_ent_to_label_to_n(self) -> dict[str, dict[str, int]]:
+        # Same dict, and order (first-seen ents, then first-seen labels
+        # within each ent), as counting info_list one dict at a time.
+        n_labels = max(len(self.labels), 1)
+        pair_keys = (
+            self.ent_codes.astype(np.int64) * n_labels + self.label_codes
+        )
+        unique_pair_keys, first_idxs, counts = np.unique(
+            pair_keys, return_index=True, return_counts=True
+        )
+        order = np.argsort(first_idxs, kind="stable")
+        idx = {}
+        for pair_key, n in zip(
+            unique_pair_keys[order].tolist(), counts[order].tolist()
+        ):
+            ent_code, label_code = divmod(pair_key, n_labels)
+            ent_id = self.ent_ids[ent_code]
+            if ent_id not in idx:
+                idx[ent_id] = {}
+            idx[ent_id][self.labels[label_code]] = n
+        return idx
+
+    def get_color_to_n(self) -> dict[tuple, int]:
+        # Sample count per color, in first-seen order
+        n = len(self)
+        counts = np.bincount(self.color_codes, minlength=len(self.color_table))
+        first_idxs = np.full(len(self.color_table), n)
+        np.minimum.at(first_idxs, self.color_codes, np.arange(n))
+        return {
+            tuple(self.color_table[i].tolist()): int(counts[i])
+            for i in np.argsort(first_idxs, kind="stable").tolist()
+            if counts[i]
+        }
+
+    @staticmethod
+    def get_most_common_colors_from_counts(
+        color_to_n: dict[tuple, int],
+    ) -> dict[tuple, float]:
+        # first-seen order, then a stable sort by share, as before
+        n = sum(color_to_n.values())
+        color_p_count = {
+            color: round(n_color / n, 4)
+            for color, n_color in color_to_n.items()
+        }
+        return dict(
+            sorted(
+                color_p_count.items(),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+        )
+
+    def get_most_common_colors(self) -> dict[tuple, float]:
+        return InfoTable.get_most_common_colors_from_counts(
+            self.get_color_to_n()
+        )
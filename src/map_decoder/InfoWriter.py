@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+from utils import Log
+
+from map_decoder.InfoTable import InfoTable
+
+log = Log("InfoWriter")
+
+
+class InfoWriter:
+    # Appends InfoTables to a JSON Lines or Parquet file as they are
+    # produced, so only one block is ever held in memory. The format is
+    # taken from the file extension, unless given.
+    #
+    # JSON Lines rows are the dicts of info_list. Parquet rows have the
+    # same fields, with xy and latlng split into columns; it needs
+    # pyarrow, which is imported only when a Parquet file is opened.
+    FORMATS = ["jsonl", "parquet"]
+
+    def __init__(self, path: str, format: str = None):
+        format = format or os.path.splitext(path)[1].lstrip(".")
+        if format not in InfoWriter.FORMATS:
+            raise ValueError(f"Unknown format: {format}")
+        self.path = path
+        self.format = format
+        self.n = 0
+
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        if format == "parquet":
+            import pyarrow.parquet as pq
+
+            self.file = pq.ParquetWriter(path, InfoWriter.get_schema())
+        else:
+            self.file = open(path, "w")
+
+    def __enter__(self) -> "InfoWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def get_schema():
+        import pyarrow as pa
+
+        return pa.schema(
+            [
+                ("x", pa.int32()),
+                ("y", pa.int32()),
+                ("lat", pa.float64()),
+                ("lng", pa.float64()),
+                ("ent_id", pa.string()),
+                ("label", pa.string()),
+                ("color", pa.list_(pa.uint8(), 3)),
+            ]
+        )
+
+    @staticmethod
+    def to_arrow(info_table: InfoTable):
+        import pyarrow as pa
+
+        colors = info_table.color_table[info_table.color_codes]
+        return pa.table(
+            dict(
+                x=info_table.xs,
+                y=info_table.ys,
+                lat=info_table.lats,
+                lng=info_table.lngs,
+                ent_id=info_table.ent_ids[info_table.ent_codes].tolist(),
+                label=np.array(info_table.labels, dtype=object)[
+                    info_table.label_codes
+                ].tolist(),
+                color=pa.FixedSizeListArray.from_arrays(
+                    pa.array(colors.reshape(-1), type=pa.uint8()), 3
+                ),
+            ),
+            schema=InfoWriter.get_schema(),
+        )
+
+    def write(self, info_table: InfoTable):
+        if self.format == "parquet":
+            self.file.write_table(InfoWriter.to_arrow(info_table))
+        else:
+            self.file.writelines(
+                json.dumps(info) + "\n" for info in info_table.to_info_list()
+            )
+        self.n += len(info_table)
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        log.debug(f"Wrote {self.n} rows to {self.path}")
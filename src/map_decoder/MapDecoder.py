@@ -1,11 +1,24 @@
-from gig import EntType
+from typing import TYPE_CHECKING, Callable, Iterator
+
+import numpy as np
 from PIL import Image
 from utils import Log
 
+from map_decoder.ColorPalette import ColorPalette
+from map_decoder.DecodeMetrics import DecodeMetrics
+from map_decoder.DecodeResult import DecodeResult
+from map_decoder.EntRaster import EntRaster
+from map_decoder.InfoTable import InfoTable
 from map_decoder.MapDecoderDrawMixin import MapDecoderDrawMixin
 from map_decoder.MapDecoderEntMixin import MapDecoderEntMixin
 from map_decoder.MapDecoderGeoMixin import MapDecoderGeoMixin
 from map_decoder.MapDecoderImageMixin import MapDecoderImageMixin
+from map_decoder.MapDecoderRenderMixin import MapDecoderRenderMixin
+from map_decoder.MapDecoderZonalMixin import MapDecoderZonalMixin
+from map_decoder.StageCache import StageCache
+
+if TYPE_CHECKING:
+    from gig import EntType
 
 log = Log("MapDecoder")
 
@@ -14,9 +27,13 @@ class MapDecoder(
     MapDecoderImageMixin,
     MapDecoderGeoMixin,
     MapDecoderDrawMixin,
+    MapDecoderRenderMixin,
     MapDecoderEntMixin,
+    MapDecoderZonalMixin,
 ):
 
+    DEFAULT_CHUNK_SIZE = 100_000
+
     def __init__(self, pil_image):
         self.pil_image = pil_image
 
@@ -25,6 +42,67 @@ class MapDecoder(
         pil_image = Image.open(filepath)
         return cls(pil_image)
 
+    def prepare(
+        self,
+        reference_list: list[dict],
+        min_saturation: float,
+        n_clusters: int,
+        color_background: tuple[int, int, int],
+        map_ent_type: "EntType",
+        use_ent_raster: bool,
+        quantizer_backend: str,
+        palette: ColorPalette,
+        max_tile_pixels: int,
+        metrics: DecodeMetrics,
+        stage_cache: StageCache = None,
+        color_to_label: dict[tuple, str] = None,
+    ) -> tuple[np.ndarray, np.ndarray, EntRaster | None]:
+        # The whole-image stages, shared by decode and decode_stream
+        if max_tile_pixels and palette is None and color_to_label:
+            # Centers fitted on a pixel sample can be off the legend's
+            # colors by a unit or so, and labels are matched exactly, so
+            # tiles are assigned to the legend's colors instead.
+            palette = ColorPalette.from_color_to_label(
+                color_to_label, color_background
+            )
+        with metrics.stage("color_idx_matrix"):
+            kwargs = dict(
+                n_clusters=n_clusters,
+                min_saturation=min_saturation,
+                color_background=color_background,
+                quantizer_backend=quantizer_backend,
+                palette=palette,
+                max_tile_pixels=max_tile_pixels,
+            )
+            if stage_cache is None:
+                color_idx_matrix, color_table = (
+                    MapDecoder.get_color_idx_matrix(
+                        pil_image=self.pil_image, metrics=metrics, **kwargs
+                    )
+                )
+            else:
+                color_idx_matrix, color_table = stage_cache.get_or_compute(
+                    "color_idx_matrix",
+                    dict(
+                        image=StageCache.hash_image(self.pil_image), **kwargs
+                    ),
+                    lambda: MapDecoder.get_color_idx_matrix(
+                        pil_image=self.pil_image, metrics=metrics, **kwargs
+                    ),
+                    metrics,
+                )
+            metrics.count("pixels_clustered", color_idx_matrix.size)
+
+        ent_raster = None
+        if use_ent_raster:
+            with metrics.stage("ent_raster"):
+                ent_raster = EntRaster.for_image(
+                    size=self.pil_image.size,
+                    reference_list=reference_list,
+                    map_ent_type=map_ent_type,
+                )
+        return color_idx_matrix, color_table, ent_raster
+
     def decode(
         self,
         reference_list: list[dict],
@@ -34,58 +112,123 @@ class MapDecoder(
         color_map_boundaries: tuple[int, int, int],
         color_background: tuple[int, int, int],
         box_size_lat: int,
-        map_ent_type: EntType,
+        map_ent_type: "EntType",
         title: str,
         color_to_label: dict[tuple, str] = None,
-    ) -> Image.Image:
-        color_matrix = MapDecoder.get_color_matrix(
-            pil_image=self.pil_image,
-            n_clusters=n_clusters,
-            min_saturation=min_saturation,
-            color_background=color_background,
-        )
+        use_ent_raster: bool = False,
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette = None,
+        max_tile_pixels: int = None,
+        n_processes: int = None,
+        renderer: str = "matplotlib",
+        metrics_hook: Callable[[dict], None] = None,
+        trace_memory: bool = False,
+        stage_cache: StageCache = None,
+        sampling: str = "grid",
+    ) -> DecodeResult:
+        if renderer not in MapDecoder.RENDERERS:
+            raise ValueError(f"Unknown renderer: {renderer}")
+        if sampling not in MapDecoder.SAMPLINGS:
+            raise ValueError(f"Unknown sampling: {sampling}")
+        metrics = DecodeMetrics(hook=metrics_hook, trace_memory=trace_memory)
 
-        info_list = MapDecoder.get_latlng_color_info_list(
+        color_idx_matrix, color_table, ent_raster = self.prepare(
             reference_list=reference_list,
+            min_saturation=min_saturation,
+            n_clusters=n_clusters,
             color_background=color_background,
-            box_size_lat=box_size_lat,
             map_ent_type=map_ent_type,
+            use_ent_raster=use_ent_raster,
+            quantizer_backend=quantizer_backend,
+            palette=palette,
+            max_tile_pixels=max_tile_pixels,
+            metrics=metrics,
+            stage_cache=stage_cache,
             color_to_label=color_to_label,
-            color_matrix=color_matrix,
         )
-        image_info_list = MapDecoder.generate_info_list_image(
-            info_list=info_list,
+
+        with metrics.stage("info_list"):
+            info_table = MapDecoder.get_info_table(
+                reference_list=reference_list,
+                color_background=color_background,
+                box_size_lat=box_size_lat,
+                map_ent_type=map_ent_type,
+                color_to_label=color_to_label,
+                ent_raster=ent_raster,
+                color_idx_matrix=color_idx_matrix,
+                color_table=color_table,
+                n_processes=n_processes,
+                metrics=metrics,
+                stage_cache=stage_cache,
+                sampling=sampling,
+            )
+        return DecodeResult(
+            map_decoder=self,
+            reference_list=reference_list,
+            color_reference_point=color_reference_point,
             color_map_boundaries=color_map_boundaries,
             box_size_lat=box_size_lat,
             map_ent_type=map_ent_type,
             title=title,
             color_to_label=color_to_label,
-        )
-        image_inspection = MapDecoder.generate_inspection_image(
-            pil_image=self.pil_image,
-            reference_list=reference_list,
-            color_reference_point=color_reference_point,
+            renderer=renderer,
+            metrics=metrics,
+            info_table=info_table,
+            color_idx_matrix=color_idx_matrix,
+            color_table=color_table,
         )
 
-        most_common_colors = MapDecoder.get_most_common_colors(
-            info_list=info_list
-        )
-
-        ent_to_label_to_n = self.get_ent_to_label_to_n(info_list)
-
-        image_for_ents = MapDecoder.generate_image_for_ents(
-            ent_to_label_to_n=ent_to_label_to_n,
-            color_to_label=color_to_label,
+    def decode_stream(
+        self,
+        reference_list: list[dict],
+        min_saturation: float,
+        n_clusters: int,
+        color_background: tuple[int, int, int],
+        box_size_lat: int,
+        map_ent_type: "EntType",
+        color_to_label: dict[tuple, str] = None,
+        use_ent_raster: bool = False,
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette = None,
+        max_tile_pixels: int = None,
+        n_processes: int = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        metrics: DecodeMetrics = None,
+        stage_cache: StageCache = None,
+        sampling: str = "grid",
+    ) -> Iterator[InfoTable]:
+        # Like decode, but yields the samples as InfoTables of about
+        # chunk_size rows, as the grid is swept, e.g. to pass to an
+        # InfoWriter and an InfoAggregator, instead of holding them all.
+        metrics = metrics or DecodeMetrics()
+        color_idx_matrix, color_table, ent_raster = self.prepare(
+            reference_list=reference_list,
+            min_saturation=min_saturation,
+            n_clusters=n_clusters,
+            color_background=color_background,
             map_ent_type=map_ent_type,
-            title=title,
-            color_map_boundaries=color_map_boundaries,
-        )
-
-        return (
-            info_list,
-            image_inspection,
-            image_info_list,
-            most_common_colors,
-            ent_to_label_to_n,
-            image_for_ents,
+            use_ent_raster=use_ent_raster,
+            quantizer_backend=quantizer_backend,
+            palette=palette,
+            max_tile_pixels=max_tile_pixels,
+            metrics=metrics,
+            stage_cache=stage_cache,
+            color_to_label=color_to_label,
         )
+        for info_table in MapDecoder.iter_info_tables(
+            reference_list=reference_list,
+            color_background=color_background,
+            box_size_lat=box_size_lat,
+            map_ent_type=map_ent_type,
+            color_to_label=color_to_label,
+            ent_raster=ent_raster,
+            color_idx_matrix=color_idx_matrix,
+            color_table=color_table,
+            n_processes=n_processes,
+            metrics=metrics,
+            chunk_size=chunk_size,
+            stage_cache=stage_cache,
+            sampling=sampling,
+        ):
+            metrics.count("rows_streamed", len(info_table))
+            yield info_table
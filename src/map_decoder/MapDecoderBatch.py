@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import time
+from typing import TYPE_CHECKING
+
+from utils import JSONFile, Log
+
+from map_decoder.MapDecoder import MapDecoder
+
+if TYPE_CHECKING:
+    from gig import EntType
+
+log = Log("MapDecoderBatch")
+
+
+class MapDecoderBatch:
+    # Decodes a manifest of maps on a pool of long-lived workers, which
+    # keep ent geometries, indexes and matplotlib loaded between jobs.
+    #
+    # A manifest is a JSON list of jobs, each like:
+    # {
+    #     "image_path": "maps/elephant-corridors.png",
+    #     "dir_output": "output/elephant-corridors",
+    #     "map_ent_type": "gnd",
+    #     "reference_list": [{"label": ..., "xy": ..., "latlng": ...}],
+    #     "color_to_label": [[[81, 174, 200], "Temporary Corridors"]],
+    #     "decode": {"min_saturation": 0.1, "n_clusters": 3, ...}
+    # }
+    # where "decode" holds the remaining MapDecoder.decode arguments.
+    # Workers are daemonic and cannot start pools of their own, so a
+    # job's "n_processes" is ignored when it runs in one.
+    COLOR_KEYS = [
+        "color_reference_point",
+        "color_map_boundaries",
+        "color_background",
+    ]
+
+    def __init__(self, job_list: list[dict]):
+        self.job_list = job_list
+
+    @staticmethod
+    def from_manifest(manifest_path: str) -> "MapDecoderBatch":
+        return MapDecoderBatch(JSONFile(manifest_path).read())
+
+    @staticmethod
+    def get_ent_type(ent_type_name: str) -> "EntType":
+        from gig import EntType
+
+        return getattr(EntType, ent_type_name.upper())
+
+    @staticmethod
+    def get_decode_kwargs(job: dict) -> dict:
+        kwargs = dict(job["decode"])
+        for k in MapDecoderBatch.COLOR_KEYS:
+            if k in kwargs:
+                kwargs[k] = tuple(kwargs[k])
+        kwargs["reference_list"] = [
+            ref | dict(xy=tuple(ref["xy"]), latlng=tuple(ref["latlng"]))
+            for ref in job["reference_list"]
+        ]
+        kwargs["color_to_label"] = {
+            tuple(color): label for color, label in job["color_to_label"]
+        }
+        kwargs["map_ent_type"] = MapDecoderBatch.get_ent_type(
+            job["map_ent_type"]
+        )
+        return kwargs
+
+    @staticmethod
+    def warm(ent_type_names: list[str]):
+        # Runs once per worker (or in the parent before forking)
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot  # noqa: F401
+
+        from gig_future import EntFuture, EntGeoStore, EntIndex
+
+        if not ent_type_names:
+            return
+        region_ent_type_names = [
+            ent_type.name for ent_type in EntFuture.REGION_ENT_TYPES
+        ]
+        i_deepest = max(
+            region_ent_type_names.index(name) for name in ent_type_names
+        )
+        for ent_type in EntFuture.REGION_ENT_TYPES[: i_deepest + 1]:
+            EntIndex.for_type(ent_type)
+
+        for name in ent_type_names:
+            map_ent_type = MapDecoderBatch.get_ent_type(name)
+            EntGeoStore.for_type(MapDecoder.get_ent_type_to_draw(map_ent_type))
+
+    @staticmethod
+    def run_job(job: dict) -> dict:
+        t_start = time.time()
+        image_path = job["image_path"]
+        try:
+            md = MapDecoder.open(image_path)
+            kwargs = MapDecoderBatch.get_decode_kwargs(job)
+            n_processes = kwargs.get("n_processes")
+            if (
+                n_processes
+                and n_processes > 1
+                and multiprocessing.current_process().daemon
+            ):
+                log.warning(
+                    f"{image_path}: Ignoring {n_processes=} in a worker"
+                )
+                kwargs["n_processes"] = None
+            result = md.decode(**kwargs)
+            result.write(job["dir_output"])
+            report, error = result.report, None
+        except Exception as e:
+            report, error = None, f"{type(e).__name__}: {e}"
+            log.error(f"{image_path}: {error}")
+
+        dt = time.time() - t_start
+        log.info(f"Decoded {image_path} ({dt:.1f}s)")
+        return dict(image_path=image_path, dt=dt, error=error, report=report)
+
+    def run(self, n_workers: int = None) -> list[dict]:
+        ent_type_names = sorted(
+            set(job["map_ent_type"] for job in self.job_list)
+        )
+        n_workers = n_workers or os.cpu_count()
+        if n_workers <= 1:
+            MapDecoderBatch.warm(ent_type_names)
+            return [MapDecoderBatch.run_job(job) for job in self.job_list]
+
+        start_method = (
+            "fork"
+            if "fork" in multiprocessing.get_all_start_methods()
+            else None
+        )
+        if start_method == "fork":
+            # Loaded once here, and inherited by every worker
+            MapDecoderBatch.warm(ent_type_names)
+            initializer, initargs = None, ()
+        else:
+            initializer, initargs = MapDecoderBatch.warm, (ent_type_names,)
+
+        with multiprocessing.get_context(start_method).Pool(
+            n_workers, initializer=initializer, initargs=initargs
+        ) as pool:
+            return pool.map(
+                MapDecoderBatch.run_job, self.job_list, chunksize=1
+            )
@@ -1,14 +1,23 @@
-import tempfile
+import io
+from typing import TYPE_CHECKING
 
-import matplotlib.pyplot as plt
-from gig import Ent, EntType
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from utils import Log
 
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+    from gig import EntType
+    from matplotlib.path import Path
+
 log = Log("MapDecoderDrawMixin")
 
 
 class MapDecoderDrawMixin:
+    # ent_type.name -> (EntGeoStore, boundary segments), and likewise
+    # for ent paths (EntType is not hashable)
+    _boundary_segments_cache = {}
+    _ent_paths_cache = {}
 
     @staticmethod
     def generate_inspection_image(
@@ -40,29 +49,153 @@ class MapDecoderDrawMixin:
 
         return result_image
 
+    @staticmethod
+    def get_ent_type_to_draw(map_ent_type: "EntType") -> "EntType":
+        from gig import EntType
+
+        # GND boundaries are too dense to draw, so DISTRICTs are drawn
+        if map_ent_type.name == EntType.GND.name:
+            return EntType.DISTRICT
+        return map_ent_type
+
+    @staticmethod
+    def get_boundary_segments(ent_type: "EntType") -> list[np.ndarray]:
+        # Boundary rings of every ent, as (lng, lat) arrays. Built once
+        # per EntType, then reused by every figure as one LineCollection.
+        import shapely
+
+        from gig_future import EntGeoStore
+
+        def build(store: EntGeoStore) -> list[np.ndarray]:
+            rings = shapely.get_rings(shapely.get_parts(store.geoms))
+            coords, ring_idxs = shapely.get_coordinates(
+                rings, return_index=True
+            )
+            return np.split(coords, np.flatnonzero(np.diff(ring_idxs)) + 1)
+
+        return EntGeoStore.get_derived(
+            ent_type, MapDecoderDrawMixin._boundary_segments_cache, build
+        )
+
+    @staticmethod
+    def get_ent_paths(ent_type: "EntType") -> list["Path"]:
+        # One compound Path (all rings, holes included) per ent, in
+        # EntGeoStore order, cached per EntType like the boundaries.
+        import shapely
+        from matplotlib.path import Path
+
+        from gig_future import EntGeoStore
+
+        def build(store: EntGeoStore) -> list[Path]:
+            paths = []
+            for geom in store.geoms:
+                rings = shapely.get_rings(shapely.get_parts(geom))
+                paths.append(
+                    Path.make_compound_path(
+                        *[
+                            Path(shapely.get_coordinates(ring), closed=True)
+                            for ring in rings
+                        ]
+                    )
+                )
+            return paths
+
+        return EntGeoStore.get_derived(
+            ent_type, MapDecoderDrawMixin._ent_paths_cache, build
+        )
+
+    @staticmethod
+    def get_winning_label_idxs(
+        ent_ids: list[str],
+        ent_to_label_to_n: dict,
+        labels: list[str],
+    ) -> np.ndarray:
+        # Index into labels of the most common label for each ent, or -1
+        # for ents with no samples.
+        ent_id_to_idx = {ent_id: i for i, ent_id in enumerate(ent_ids)}
+        label_to_idx = {label: i for i, label in enumerate(labels)}
+        rows, cols, ns = [], [], []
+        for ent_id, label_to_n in ent_to_label_to_n.items():
+            for label, n in label_to_n.items():
+                rows.append(ent_id_to_idx[ent_id])
+                cols.append(label_to_idx[label])
+                ns.append(n)
+
+        counts = np.zeros((len(ent_ids), len(labels)), dtype=int)
+        np.add.at(counts, (rows, cols), ns)
+        return np.where(counts.sum(axis=1) > 0, counts.argmax(axis=1), -1)
+
+    @staticmethod
+    def get_ent_summary(
+        ent_to_label_to_n: dict,
+        color_to_label: dict[tuple[int, int, int], str],
+        map_ent_type: "EntType",
+    ) -> tuple[np.ndarray, str]:
+        # Winning label index per ent (EntGeoStore order), and the
+        # population annotation shared by every renderer.
+        from gig_future import EntGeoStore
+
+        store = EntGeoStore.for_type(map_ent_type)
+        label_idxs = MapDecoderDrawMixin.get_winning_label_idxs(
+            ent_ids=[ent.id for ent in store.ents],
+            ent_to_label_to_n=ent_to_label_to_n,
+            labels=list(color_to_label.values()),
+        )
+        populations = np.array([ent.population for ent in store.ents])
+        p_coloured = populations[label_idxs >= 0].sum() / populations.sum()
+        n = len(ent_to_label_to_n)
+        annotation_text = (
+            f"{n} {map_ent_type.name.upper()}s,"
+            + f" corresponding to {p_coloured:.1%}% of population"
+        )
+        return label_idxs, annotation_text
+
+    @staticmethod
+    def save_figure(fig: "plt.Figure") -> Image.Image:
+        # Rendered in memory, so no PNG is left behind in the temp dir
+        import matplotlib.pyplot as plt
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, dpi=300, bbox_inches="tight")
+        plt.close(fig)
+        buffer.seek(0)
+        image = Image.open(buffer)
+        image.load()
+        return image
+
+    @staticmethod
+    def set_geo_aspect(ax: "plt.Axes"):
+        # Same aspect as geopandas uses for lat/lng (EPSG:4326) plots
+        y_min, y_max = ax.get_ylim()
+        ax.set_aspect(1 / np.cos(np.deg2rad((y_min + y_max) / 2)))
+
     @staticmethod
     def draw_map(
-        ax: plt.Axes,
-        map_ent_type: EntType,
+        ax: "plt.Axes",
+        map_ent_type: "EntType",
         color_map_boundaries: tuple[int, int, int],
     ):
-        map_ent_type_to_draw = map_ent_type
-        if map_ent_type.name == EntType.GND.name:
-            map_ent_type_to_draw = EntType.DISTRICT
-
-        ents = Ent.list_from_type(map_ent_type_to_draw)
-        for ent in ents:
-            geo = ent.geo()
-            geo.plot(
-                ax=ax,
-                facecolor="none",
-                edgecolor=color_map_boundaries,
-                linewidth=0.1,
+        from matplotlib.collections import LineCollection
+
+        map_ent_type_to_draw = MapDecoderDrawMixin.get_ent_type_to_draw(
+            map_ent_type
+        )
+        segments = MapDecoderDrawMixin.get_boundary_segments(
+            map_ent_type_to_draw
+        )
+        ax.add_collection(
+            LineCollection(
+                segments,
+                colors=[color_map_boundaries],
+                linewidths=0.1,
             )
+        )
+        ax.autoscale_view()
+        MapDecoderDrawMixin.set_geo_aspect(ax)
 
     @staticmethod
     def draw_legend(
-        ax: plt.Axes,
+        ax: "plt.Axes",
         color_to_label: dict[tuple, str],
     ):
         import matplotlib.patches as mpatches
@@ -100,10 +233,12 @@ class MapDecoderDrawMixin:
         info_list: list[dict],
         color_map_boundaries: tuple[int, int, int],
         box_size_lat: int,
-        map_ent_type: EntType,
+        map_ent_type: "EntType",
         title: str,
         color_to_label: dict[tuple, str],
     ) -> Image.Image:
+        import matplotlib.pyplot as plt
+
         plt.close()
         lats = [info["latlng"][0] for info in info_list]
         lngs = [info["latlng"][1] for info in info_list]
@@ -135,60 +270,46 @@ class MapDecoderDrawMixin:
         plt.title(title)
         MapDecoderDrawMixin.format_axes(ax)
 
-        temp_image_path = tempfile.NamedTemporaryFile(
-            suffix=".png", delete=False
-        ).name
-        plt.savefig(temp_image_path, dpi=300, bbox_inches="tight")
-        plt.close(fig)
-        return Image.open(temp_image_path)
+        return MapDecoderDrawMixin.save_figure(fig)
 
     @staticmethod
     def generate_image_for_ents(
         ent_to_label_to_n: dict,
         color_to_label: dict[tuple[int, int, int], str],
-        map_ent_type: EntType,
+        map_ent_type: "EntType",
         title: str,
         color_map_boundaries: tuple[int, int, int],
     ) -> Image.Image:
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import PathCollection
+
         plt.close()
         fig, ax = plt.subplots(figsize=(10, 10))
-        label_to_color = {
-            label: color for color, label in color_to_label.items()
-        }
-
         MapDecoderDrawMixin.draw_map(
             ax=ax,
             map_ent_type=map_ent_type,
             color_map_boundaries=color_map_boundaries,
         )
-        ents = Ent.list_from_type(map_ent_type)
-        total_population = 0
-        coloured_population = 0
-        for ent in ents:
-            population = ent.population
-            total_population += population
-            if ent.id in ent_to_label_to_n:
-                coloured_population += population
-                label_to_n = ent_to_label_to_n[ent.id]
-                max_label = sorted(
-                    label_to_n.items(),
-                    key=lambda item: item[1],
-                    reverse=True,
-                )[0][0]
-                color_rgb = label_to_color[max_label]
-                color = [c / 255 for c in color_rgb]
-
-            else:
-                continue
-
-            geo = ent.geo()
-
-            geo.plot(
-                ax=ax,
-                facecolor=color,
-                edgecolor="black",
-                linewidth=0.1,
+        label_idxs, annotation_text = MapDecoderDrawMixin.get_ent_summary(
+            ent_to_label_to_n=ent_to_label_to_n,
+            color_to_label=color_to_label,
+            map_ent_type=map_ent_type,
+        )
+        is_coloured = label_idxs >= 0
+
+        label_colors = np.array(list(color_to_label.keys())) / 255
+        paths = MapDecoderDrawMixin.get_ent_paths(map_ent_type)
+        ax.add_collection(
+            PathCollection(
+                [paths[i] for i in np.flatnonzero(is_coloured)],
+                facecolors=label_colors[label_idxs[is_coloured]],
+                edgecolors="black",
+                linewidths=0.1,
             )
+        )
+        ax.autoscale_view()
+        MapDecoderDrawMixin.set_geo_aspect(ax)
+
         MapDecoderDrawMixin.draw_legend(
             ax=ax,
             color_to_label=color_to_label,
@@ -196,12 +317,6 @@ class MapDecoderDrawMixin:
         MapDecoderDrawMixin.format_axes(ax)
         plt.title(title)
 
-        p_coloured = coloured_population / total_population
-        n = len(ent_to_label_to_n)
-        annotation_text = (
-            f"{n} {map_ent_type.name.upper()}s,"
-            + f" corresponding to {p_coloured:.1%}% of population"
-        )
         ax.annotate(
             annotation_text,
             xy=(0.5, 0.02),
@@ -211,9 +326,4 @@ class MapDecoderDrawMixin:
             fontsize="small",
         )
 
-        temp_image_path = tempfile.NamedTemporaryFile(
-            suffix=".png", delete=False
-        ).name
-        plt.savefig(temp_image_path, dpi=300, bbox_inches="tight")
-        plt.close(fig)
-        return Image.open(temp_image_path)
+        return MapDecoderDrawMixin.save_figure(fig)
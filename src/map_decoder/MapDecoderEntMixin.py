@@ -1,11 +1,15 @@
 from utils import Log
 
+from map_decoder.InfoTable import InfoTable
+
 log = Log("MapDecoder")
 
 
 class MapDecoderEntMixin:
     @staticmethod
-    def get_ent_to_label_to_n(info_list):
+    def get_ent_to_label_to_n(info_list: list[dict] | InfoTable):
+        if isinstance(info_list, InfoTable):
+            return info_list.get_ent_to_label_to_n()
         idx = {}
         for info in info_list:
             ent_id = info["ent_id"]
@@ -1,15 +1,28 @@
+import multiprocessing
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator
+
 import numpy as np
-from gig import EntType
-from tqdm import tqdm
 from utils import Log
 
-from gig_future import EntFuture
+from map_decoder.DecodeMetrics import DecodeMetrics
+from map_decoder.EntRaster import EntRaster
+from map_decoder.InfoTable import InfoTable
+from map_decoder.QuadtreeSampler import QuadtreeSampler
+from map_decoder.StageCache import StageCache
 from utils_future import Poly2GeoMapper
 
+if TYPE_CHECKING:
+    from multiprocessing.pool import Pool
+
+    from gig import EntType
+
 log = Log("MapDecoder")
 
 
 class MapDecoderGeoMixin:
+    SAMPLINGS = ["grid", "adaptive"]
 
     @staticmethod
     def get_extreme_points(  # noqa: C901
@@ -52,53 +65,144 @@ class MapDecoderGeoMixin:
         return step
 
     @staticmethod
-    def get_info(  # noqa: CFQ004
-        xy: tuple[int, int],
-        c: np.ndarray,
-        color_background: tuple[int, int, int],
-        params: dict,
+    def pack_colors(colors) -> np.ndarray:
+        colors = np.asarray(colors, dtype=np.int64)
+        return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+    @staticmethod
+    def get_label_idxs(
+        keys: np.ndarray,
         color_to_label: dict[tuple, str],
-        map_ent_type: EntType,
-    ) -> dict | None:
-        x, y = xy
-        color = tuple(int(c) for c in (c * 255).astype(int))
-        if color == color_background:
-            return None
-
-        label = color_to_label.get(color)
-        if not label:
-            log.error(f"Label not found for color: {color}")
-            return None
-
-        latlng = Poly2GeoMapper.transform((x, y), params)
-        latlng = (
-            round(latlng[0], 6),
-            round(latlng[1], 6),
+    ) -> np.ndarray:
+        # Index into color_to_label.values() for each packed color key,
+        # or -1 if the color has no label.
+        if not color_to_label:
+            return np.full(len(keys), -1, dtype=int)
+        label_keys = MapDecoderGeoMixin.pack_colors(
+            list(color_to_label.keys())
         )
-        idx_regions = EntFuture.idx_regions_from_latlng(latlng, map_ent_type)
-        ent = idx_regions.get(map_ent_type.name)
-        if not ent:
-            return None
-
-        info = dict(
-            xy=xy,
-            latlng=latlng,
-            ent_id=ent.id,
-            label=label,
-            color=color,
+        order = np.argsort(label_keys)
+        sorted_label_keys = label_keys[order]
+        pos = np.searchsorted(sorted_label_keys, keys)
+        pos = np.minimum(pos, len(sorted_label_keys) - 1)
+        is_match = sorted_label_keys[pos] == keys
+        return np.where(is_match, order[pos], -1)
+
+    @staticmethod
+    def get_ent_ids_for_chunk(args: tuple) -> tuple[np.ndarray, int]:
+        # Also returns the number of point-in-polygon lookups: one per
+        # point, per region level that the point reached.
+        from gig_future import EntFuture
+
+        latlngs, map_ent_type = args
+        region_hierarchy = EntFuture.idx_regions_from_latlng_list(
+            latlngs, map_ent_type
         )
+        n_lookups = len(latlngs)
+        for ent_ids in list(region_hierarchy.values())[:-1]:
+            n_lookups += int(np.count_nonzero(np.not_equal(ent_ids, None)))
+        return region_hierarchy[map_ent_type.name], n_lookups
 
-        return info
+    @staticmethod
+    @contextmanager
+    def open_pool(
+        map_ent_type: "EntType", n_processes: int = None
+    ) -> Iterator["Pool | None"]:
+        # Pool for get_ent_ids, or None if n_processes is not > 1
+        if not n_processes or n_processes <= 1:
+            yield None
+            return
+
+        from gig_future import EntFuture, EntIndex
+
+        # Load indexes in the parent, so forked workers share them
+        # (copy-on-write) instead of each re-reading them.
+        for ent_type in EntFuture.REGION_ENT_TYPES:
+            EntIndex.for_type(ent_type)
+            if ent_type.name == map_ent_type.name:
+                break
+
+        start_method = (
+            "fork"
+            if "fork" in multiprocessing.get_all_start_methods()
+            else None
+        )
+        with multiprocessing.get_context(start_method).Pool(
+            n_processes
+        ) as pool:
+            yield pool
 
     @staticmethod
-    def get_latlng_color_info_list(
+    def get_ent_ids(
+        latlngs: np.ndarray,
+        map_ent_type: "EntType",
+        n_processes: int = None,
+        metrics: DecodeMetrics = None,
+        pool: "Pool" = None,
+    ) -> np.ndarray:
+        # Pass a pool from open_pool to reuse it across calls; otherwise
+        # one is opened (and closed) here.
+        metrics = metrics or DecodeMetrics()
+        if not n_processes or n_processes <= 1 or len(latlngs) == 0:
+            ent_ids, n_lookups = MapDecoderGeoMixin.get_ent_ids_for_chunk(
+                (latlngs, map_ent_type)
+            )
+            metrics.count("point_in_polygon_lookups", n_lookups)
+            return ent_ids
+
+        if pool is None:
+            with MapDecoderGeoMixin.open_pool(
+                map_ent_type, n_processes
+            ) as pool:
+                return MapDecoderGeoMixin.get_ent_ids(
+                    latlngs, map_ent_type, n_processes, metrics, pool
+                )
+
+        chunks = np.array_split(latlngs, n_processes * 4)
+        t_start = time.time()
+        # map keeps chunk order, so results are deterministic
+        results = pool.map(
+            MapDecoderGeoMixin.get_ent_ids_for_chunk,
+            [(chunk, map_ent_type) for chunk in chunks],
+        )
+        dt = time.time() - t_start
+        log.debug(
+            f"Looked up {len(latlngs)} points in {len(chunks)} chunks"
+            + f" on {n_processes} processes ({dt:.2f}s)"
+        )
+        metrics.count("point_in_polygon_lookups", sum(n for _, n in results))
+        return np.concatenate([ent_ids for ent_ids, _ in results])
+
+    @staticmethod
+    def get_ent_ids_cached(
+        latlngs: np.ndarray,
+        map_ent_type: "EntType",
+        func: Callable[[], np.ndarray],
+        metrics: DecodeMetrics,
+        stage_cache: StageCache,
+    ) -> np.ndarray:
+        # Either sampling gives the same ent ids, so they share entries
+        from gig_future import EntGeoStore
+
+        store = EntGeoStore.for_type(map_ent_type)
+        return stage_cache.get_or_compute(
+            "ent_ids",
+            dict(
+                latlngs=latlngs,
+                map_ent_type=map_ent_type.name,
+                data_version=store.data_version,
+            ),
+            func,
+            metrics,
+        )
+
+    @staticmethod
+    def get_sample_grid(
         reference_list: list[dict],
-        color_background: tuple[int, int, int],
         box_size_lat: int,
-        map_ent_type: EntType,
-        color_to_label: dict[tuple, str],
-        color_matrix: np.ndarray,
-    ) -> list[dict]:
+        size: tuple[int, int],
+    ) -> tuple[dict, np.ndarray, np.ndarray]:
+        # Returns the fitted params, and the x and y values of the grid
         params = Poly2GeoMapper.fit(
             xys=[ref["xy"] for ref in reference_list],
             latlngs=[ref["latlng"] for ref in reference_list],
@@ -110,23 +214,279 @@ class MapDecoderGeoMixin:
             reference_list=reference_list,
             box_size_lat=box_size_lat,
         )
-        x_start = max(0, int(x_min))
-        x_end = min(color_matrix.shape[1], int(x_max) + 1)
-        x_range = range(x_start, x_end, step)
-        y_start = max(0, int(y_min))
-        y_end = min(color_matrix.shape[0], int(y_max) + 1)
-        y_range = range(y_start, y_end, step)
-        info_list = []
-        for x in tqdm(x_range, desc="Processing image"):
-            for y in y_range:
-                info = MapDecoderGeoMixin.get_info(
-                    xy=(x, y),
-                    c=color_matrix[y, x],
-                    color_background=color_background,
+        width, height = size
+        x_values = np.arange(
+            max(0, int(x_min)), min(width, int(x_max) + 1), step
+        )
+        y_values = np.arange(
+            max(0, int(y_min)), min(height, int(y_max) + 1), step
+        )
+        return params, x_values, y_values
+
+    @staticmethod
+    def get_info_table_for_block(
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        params: dict,
+        color_background: tuple[int, int, int],
+        map_ent_type: "EntType",
+        color_to_label: dict[tuple, str],
+        color_matrix: np.ndarray = None,
+        ent_raster: EntRaster = None,
+        color_idx_matrix: np.ndarray = None,
+        color_table: np.ndarray = None,
+        n_processes: int = None,
+        metrics: DecodeMetrics = None,
+        stage_cache: StageCache = None,
+        sampling: str = "grid",
+        pool: "Pool" = None,
+    ) -> InfoTable:
+        metrics = metrics or DecodeMetrics()
+        with metrics.stage("sample"):
+            # (x, y) grid, x-major like the original nested loops
+            xs, ys = np.meshgrid(x_values, y_values, indexing="ij")
+            xs, ys = xs.ravel(), ys.ravel()
+            if color_idx_matrix is None:
+                sampled = color_matrix[np.ix_(y_values, x_values)]
+                colors = (sampled.transpose(1, 0, 2) * 255).astype(int)
+                color_table, color_idxs = np.unique(
+                    colors.reshape(-1, 3), axis=0, return_inverse=True
+                )
+            else:
+                sampled = color_idx_matrix[np.ix_(y_values, x_values)]
+                color_idxs = sampled.T.astype(int)
+            color_idxs = color_idxs.reshape(-1)
+
+            # Everything below is per color table entry, then indexed per cell
+            table_keys = MapDecoderGeoMixin.pack_colors(color_table)
+            table_is_foreground = table_keys != MapDecoderGeoMixin.pack_colors(
+                color_background
+            )
+            table_label_idxs = MapDecoderGeoMixin.get_label_idxs(
+                table_keys, color_to_label
+            )
+            is_foreground = table_is_foreground[color_idxs]
+            has_label = is_foreground & (table_label_idxs[color_idxs] >= 0)
+            unmatched_color_idxs = np.unique(
+                color_idxs[is_foreground & ~has_label]
+            )
+            for color_idx in unmatched_color_idxs:
+                color = tuple(color_table[color_idx].tolist())
+                log.error(f"Label not found for color: {color}")
+            metrics.count("grid_cells", len(color_idxs))
+            metrics.count("background_skips", (~is_foreground).sum())
+            metrics.count("unmatched_colors", len(unmatched_color_idxs))
+            metrics.count(
+                "unmatched_cells", (is_foreground & ~has_label).sum()
+            )
+
+            # With a stage cache, every foreground cell is looked up, not
+            # only those with a label, so that the cached ent ids are
+            # still valid after the legend is edited.
+            is_lookup = is_foreground if stage_cache else has_label
+            xs, ys, color_idxs, has_label = (
+                xs[is_lookup],
+                ys[is_lookup],
+                color_idxs[is_lookup],
+                has_label[is_lookup],
+            )
+            label_idxs = table_label_idxs[color_idxs]
+
+        with metrics.stage("ent_lookup"):
+            lats, lngs = Poly2GeoMapper.transform((xs, ys), params)
+            latlngs = np.round(np.column_stack([lats, lngs]), 6)
+
+            def look_up() -> np.ndarray:
+                if sampling == "adaptive":
+                    needs_ent = is_lookup.reshape(len(x_values), len(y_values))
+                    return QuadtreeSampler.get_ent_ids_for_grid(
+                        x_values,
+                        y_values,
+                        needs_ent,
+                        params,
+                        map_ent_type,
+                        metrics,
+                    )[needs_ent]
+                return MapDecoderGeoMixin.get_ent_ids(
+                    latlngs, map_ent_type, n_processes, metrics, pool
+                )
+
+            if ent_raster is not None:
+                ent_ids = ent_raster.get_ent_ids(xs, ys)
+            elif stage_cache is not None:
+                ent_ids = MapDecoderGeoMixin.get_ent_ids_cached(
+                    latlngs, map_ent_type, look_up, metrics, stage_cache
+                )
+            else:
+                ent_ids = look_up()
+            has_ent = np.array(
+                [ent_id is not None for ent_id in ent_ids], dtype=bool
+            )
+            is_hit = has_ent & has_label
+            metrics.count("ent_hits", is_hit.sum())
+            metrics.count("ent_misses", (has_label & ~has_ent).sum())
+
+        with metrics.stage("build_info_table"):
+            hit_ent_ids, ent_codes = InfoTable.encode(
+                np.asarray(ent_ids, dtype=object)[is_hit]
+            )
+
+            # Several colors may share a label, so labels are de-duplicated
+            labels = list(dict.fromkeys(color_to_label.values()))
+            label_to_code = {label: i for i, label in enumerate(labels)}
+            label_codes = np.array(
+                [label_to_code[label] for label in color_to_label.values()],
+                dtype=int,
+            )[label_idxs[is_hit]]
+
+            info_table = InfoTable(
+                xs=xs[is_hit],
+                ys=ys[is_hit],
+                lats=latlngs[is_hit, 0],
+                lngs=latlngs[is_hit, 1],
+                ent_codes=ent_codes,
+                label_codes=label_codes,
+                color_codes=color_idxs[is_hit],
+                ent_ids=hit_ent_ids,
+                labels=labels,
+                color_table=color_table,
+            )
+        n_foreground = int(is_foreground.sum())
+        log.debug(f"{len(info_table)=} from {n_foreground} foreground cells")
+        return info_table
+
+    @staticmethod
+    def iter_info_tables(
+        reference_list: list[dict],
+        color_background: tuple[int, int, int],
+        box_size_lat: int,
+        map_ent_type: "EntType",
+        color_to_label: dict[tuple, str],
+        color_matrix: np.ndarray = None,
+        ent_raster: EntRaster = None,
+        color_idx_matrix: np.ndarray = None,
+        color_table: np.ndarray = None,
+        n_processes: int = None,
+        metrics: DecodeMetrics = None,
+        chunk_size: int = None,
+        stage_cache: StageCache = None,
+        sampling: str = "grid",
+    ) -> Iterator[InfoTable]:
+        # Sweeps the grid in blocks of whole columns, of about chunk_size
+        # cells each (or in one block, if chunk_size is None), and yields
+        # an InfoTable per block. Together, the blocks hold the same rows,
+        # in the same order, as get_info_table.
+        #
+        # sampling is "grid", to look up the ent of every sampled cell, or
+        # "adaptive", to skip lookups in blocks of cells that all fall in
+        # one ent (see QuadtreeSampler). That only pays off for ents
+        # several cells wide; for smaller ents, every cell is looked up.
+        if sampling not in MapDecoderGeoMixin.SAMPLINGS:
+            raise ValueError(f"Unknown sampling: {sampling}")
+        metrics = metrics or DecodeMetrics()
+        if color_idx_matrix is None:
+            height, width = color_matrix.shape[:2]
+        else:
+            height, width = color_idx_matrix.shape
+        with metrics.stage("fit"):
+            params, x_values, y_values = MapDecoderGeoMixin.get_sample_grid(
+                reference_list=reference_list,
+                box_size_lat=box_size_lat,
+                size=(width, height),
+            )
+
+        n_x_per_block = len(x_values)
+        if chunk_size:
+            n_x_per_block = chunk_size // max(1, len(y_values))
+        n_x_per_block = max(1, n_x_per_block)
+
+        # One pool for all blocks. Only grid lookups without a raster use it.
+        if ent_raster is not None or sampling != "grid":
+            n_processes = None
+        with MapDecoderGeoMixin.open_pool(map_ent_type, n_processes) as pool:
+            for i_x in range(0, max(1, len(x_values)), n_x_per_block):
+                yield MapDecoderGeoMixin.get_info_table_for_block(
+                    x_values=x_values[slice(i_x, i_x + n_x_per_block)],
+                    y_values=y_values,
                     params=params,
-                    color_to_label=color_to_label,
+                    color_background=color_background,
                     map_ent_type=map_ent_type,
+                    color_to_label=color_to_label,
+                    color_matrix=color_matrix,
+                    ent_raster=ent_raster,
+                    color_idx_matrix=color_idx_matrix,
+                    color_table=color_table,
+                    n_processes=n_processes,
+                    metrics=metrics,
+                    stage_cache=stage_cache,
+                    sampling=sampling,
+                    pool=pool,
                 )
-                if info is not None:
-                    info_list.append(info)
-        return info_list
+
+    @staticmethod
+    def get_info_table(
+        reference_list: list[dict],
+        color_background: tuple[int, int, int],
+        box_size_lat: int,
+        map_ent_type: "EntType",
+        color_to_label: dict[tuple, str],
+        color_matrix: np.ndarray = None,
+        ent_raster: EntRaster = None,
+        color_idx_matrix: np.ndarray = None,
+        color_table: np.ndarray = None,
+        n_processes: int = None,
+        metrics: DecodeMetrics = None,
+        stage_cache: StageCache = None,
+        sampling: str = "grid",
+    ) -> InfoTable:
+        (info_table,) = MapDecoderGeoMixin.iter_info_tables(
+            reference_list=reference_list,
+            color_background=color_background,
+            box_size_lat=box_size_lat,
+            map_ent_type=map_ent_type,
+            color_to_label=color_to_label,
+            color_matrix=color_matrix,
+            ent_raster=ent_raster,
+            color_idx_matrix=color_idx_matrix,
+            color_table=color_table,
+            n_processes=n_processes,
+            metrics=metrics,
+            stage_cache=stage_cache,
+            sampling=sampling,
+        )
+        return info_table
+
+    @staticmethod
+    def get_latlng_color_info_list(
+        reference_list: list[dict],
+        color_background: tuple[int, int, int],
+        box_size_lat: int,
+        map_ent_type: "EntType",
+        color_to_label: dict[tuple, str],
+        color_matrix: np.ndarray = None,
+        ent_raster: EntRaster = None,
+        color_idx_matrix: np.ndarray = None,
+        color_table: np.ndarray = None,
+        n_processes: int = None,
+        metrics: DecodeMetrics = None,
+        stage_cache: StageCache = None,
+        sampling: str = "grid",
+    ) -> list[dict]:
+        metrics = metrics or DecodeMetrics()
+        info_table = MapDecoderGeoMixin.get_info_table(
+            reference_list=reference_list,
+            color_background=color_background,
+            box_size_lat=box_size_lat,
+            map_ent_type=map_ent_type,
+            color_to_label=color_to_label,
+            color_matrix=color_matrix,
+            ent_raster=ent_raster,
+            color_idx_matrix=color_idx_matrix,
+            color_table=color_table,
+            n_processes=n_processes,
+            metrics=metrics,
+            stage_cache=stage_cache,
+            sampling=sampling,
+        )
+        with metrics.stage("build_info_list"):
+            return info_table.to_info_list()
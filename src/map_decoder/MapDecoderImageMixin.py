@@ -1,25 +1,59 @@
 import numpy as np
 from PIL import Image
-from sklearn.cluster import KMeans
 from utils import Log
 
+from map_decoder.ColorPalette import ColorPalette
+from map_decoder.ColorQuantizer import ColorQuantizer
+from map_decoder.DecodeMetrics import DecodeMetrics
+from map_decoder.InfoTable import InfoTable
+
 log = Log("MapDecoderImageMixin")
 
 
 class MapDecoderImageMixin:
 
+    COLOR_IDX_BACKGROUND = 0
+
+    @staticmethod
+    def quantize_colors(
+        color_array: np.ndarray,
+        n_clusters: int,
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette | list[tuple[int, int, int]] = None,
+        metrics: DecodeMetrics = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Returns the cluster index of each pixel, and the cluster centers
+        metrics = metrics or DecodeMetrics()
+        pixels = color_array.reshape(-1, 3)
+        if palette is not None:
+            if not isinstance(palette, ColorPalette):
+                palette = ColorPalette(palette)
+            return palette.assign(pixels), palette.colors
+
+        quantizer = ColorQuantizer(
+            n_clusters=n_clusters,
+            backend=quantizer_backend,
+        )
+        labels = quantizer.fit_predict(pixels)
+        metrics.details["quantizer"] = quantizer.report
+        return labels, quantizer.cluster_centers
+
     @staticmethod
     def cluster_colors(
         color_array: np.ndarray,
         n_clusters: int,
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette | list[tuple[int, int, int]] = None,
     ) -> np.ndarray:
         original_shape = color_array.shape
-        pixels = color_array.reshape(-1, 3)
-
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        kmeans.fit(pixels)
+        labels, cluster_centers = MapDecoderImageMixin.quantize_colors(
+            color_array=color_array,
+            n_clusters=n_clusters,
+            quantizer_backend=quantizer_backend,
+            palette=palette,
+        )
 
-        clustered_pixels = kmeans.cluster_centers_[kmeans.labels_]
+        clustered_pixels = cluster_centers[labels]
 
         clustered_array = clustered_pixels.reshape(original_shape)
 
@@ -53,46 +87,251 @@ class MapDecoderImageMixin:
         return result_array
 
     @staticmethod
-    def get_color_matrix(
+    def get_cluster_matrix(
         pil_image: Image.Image,
         n_clusters: int,
         min_saturation: float,
         color_background: tuple[int, int, int],
-    ) -> np.ndarray:
-        image_rgb = pil_image.convert("RGB")
-        color_array = np.array(image_rgb, dtype=np.float32)
-        color_array = MapDecoderImageMixin.replace_low_saturation_colors(
-            color_array=color_array,
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette | list[tuple[int, int, int]] = None,
+        max_tile_pixels: int = None,
+        metrics: DecodeMetrics = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Returns an H x W matrix of cluster indexes, and the float32
+        # cluster colors, with low saturation clusters set to background.
+        if max_tile_pixels:
+            cluster_matrix, cluster_centers = (
+                MapDecoderImageMixin.get_cluster_matrix_tiled(
+                    pil_image=pil_image,
+                    n_clusters=n_clusters,
+                    min_saturation=min_saturation,
+                    color_background=color_background,
+                    quantizer_backend=quantizer_backend,
+                    palette=palette,
+                    max_tile_pixels=max_tile_pixels,
+                    metrics=metrics,
+                )
+            )
+        else:
+            image_rgb = pil_image.convert("RGB")
+            color_array = np.array(image_rgb, dtype=np.float32)
+            color_array = MapDecoderImageMixin.replace_low_saturation_colors(
+                color_array=color_array,
+                min_saturation=min_saturation,
+                color_background=color_background,
+            )
+            labels, cluster_centers = MapDecoderImageMixin.quantize_colors(
+                color_array=color_array,
+                n_clusters=n_clusters,
+                quantizer_backend=quantizer_backend,
+                palette=palette,
+                metrics=metrics,
+            )
+            cluster_matrix = labels.reshape(color_array.shape[:2])
+
+        cluster_colors = MapDecoderImageMixin.replace_low_saturation_colors(
+            color_array=cluster_centers.astype(np.float32).reshape(-1, 1, 3),
             min_saturation=min_saturation,
             color_background=color_background,
+        ).reshape(-1, 3)
+        dtype = np.min_scalar_type(max(len(cluster_colors) - 1, 0))
+        return cluster_matrix.astype(dtype), cluster_colors
+
+    @staticmethod
+    def get_color_matrix(
+        pil_image: Image.Image,
+        n_clusters: int,
+        min_saturation: float,
+        color_background: tuple[int, int, int],
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette | list[tuple[int, int, int]] = None,
+        max_tile_pixels: int = None,
+        metrics: DecodeMetrics = None,
+    ) -> np.ndarray:
+        cluster_matrix, cluster_colors = (
+            MapDecoderImageMixin.get_cluster_matrix(
+                pil_image=pil_image,
+                n_clusters=n_clusters,
+                min_saturation=min_saturation,
+                color_background=color_background,
+                quantizer_backend=quantizer_backend,
+                palette=palette,
+                max_tile_pixels=max_tile_pixels,
+                metrics=metrics,
+            )
         )
-        color_array = MapDecoderImageMixin.cluster_colors(
-            color_array=color_array,
-            n_clusters=n_clusters,
+        color_matrix = cluster_colors[cluster_matrix] / 255.0
+        return color_matrix
+
+    @staticmethod
+    def get_color_idx_matrix(
+        pil_image: Image.Image,
+        n_clusters: int,
+        min_saturation: float,
+        color_background: tuple[int, int, int],
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette | list[tuple[int, int, int]] = None,
+        max_tile_pixels: int = None,
+        metrics: DecodeMetrics = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Compact alternative to get_color_matrix: a uint8 H x W matrix of
+        # indexes into a small (K, 3) int color table, where index
+        # COLOR_IDX_BACKGROUND is color_background.
+        cluster_matrix, cluster_colors = (
+            MapDecoderImageMixin.get_cluster_matrix(
+                pil_image=pil_image,
+                n_clusters=n_clusters,
+                min_saturation=min_saturation,
+                color_background=color_background,
+                quantizer_backend=quantizer_backend,
+                palette=palette,
+                max_tile_pixels=max_tile_pixels,
+                metrics=metrics,
+            )
         )
+        # Same rounding as get_color_matrix followed by (c * 255).astype(int)
+        colors = ((cluster_colors / 255.0) * 255).astype(int)
+        color_table = [tuple(color_background)]
+        cluster_to_color_idx = []
+        for color in map(tuple, colors.tolist()):
+            if color not in color_table:
+                color_table.append(color)
+            cluster_to_color_idx.append(color_table.index(color))
+        assert len(color_table) <= 256, "Too many colors for uint8"
+
+        color_idx_matrix = np.array(cluster_to_color_idx, dtype=np.uint8)[
+            cluster_matrix
+        ]
+        return color_idx_matrix, np.array(color_table, dtype=int)
+
+    @staticmethod
+    def iter_tiles(pil_image: Image.Image, max_tile_pixels: int):
+        # Full-width bands of rows, each at most max_tile_pixels pixels
+        width, height = pil_image.size
+        n_rows = max(1, max_tile_pixels // width)
+        for y_start in range(0, height, n_rows):
+            y_end = min(height, y_start + n_rows)
+            tile = pil_image.crop((0, y_start, width, y_end)).convert("RGB")
+            yield y_start, y_end, np.array(tile, dtype=np.float32)
+
+    @staticmethod
+    def get_pixel_sample(
+        pil_image: Image.Image,
+        sample_size: int,
+        max_tile_pixels: int,
+        random_state: int = 42,
+    ) -> np.ndarray:
+        width, height = pil_image.size
+        p_sample = min(1.0, sample_size / (width * height))
+        rng = np.random.default_rng(random_state)
+        samples = []
+        for _, _, tile in MapDecoderImageMixin.iter_tiles(
+            pil_image, max_tile_pixels
+        ):
+            pixels = tile.reshape(-1, 3)
+            samples.append(pixels[rng.random(len(pixels)) < p_sample])
+        return np.concatenate(samples)
+
+    @staticmethod
+    def get_cluster_matrix_tiled(
+        pil_image: Image.Image,
+        n_clusters: int,
+        min_saturation: float,
+        color_background: tuple[int, int, int],
+        quantizer_backend: str = "kmeans",
+        palette: ColorPalette | list[tuple[int, int, int]] = None,
+        max_tile_pixels: int = 1_000_000,
+        sample_size: int = 100_000,
+        metrics: DecodeMetrics = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Same stages as get_cluster_matrix, but the quantizer is fitted
+        # on a pixel sample and the image is streamed through in tiles,
+        # so temporaries are bounded by max_tile_pixels, not image size.
+        metrics = metrics or DecodeMetrics()
+        if palette is None:
+            sample = MapDecoderImageMixin.get_pixel_sample(
+                pil_image, sample_size, max_tile_pixels
+            )
+            sample = MapDecoderImageMixin.replace_low_saturation_colors(
+                color_array=sample.reshape(-1, 1, 3),
+                min_saturation=min_saturation,
+                color_background=color_background,
+            )
+            quantizer = ColorQuantizer(
+                n_clusters=n_clusters,
+                backend=quantizer_backend,
+            ).fit(sample)
+            metrics.details["quantizer"] = quantizer.report
+            palette = quantizer.get_palette()
+        elif not isinstance(palette, ColorPalette):
+            palette = ColorPalette(palette)
+
+        width, height = pil_image.size
+        dtype = np.min_scalar_type(max(len(palette) - 1, 0))
+        cluster_matrix = np.empty((height, width), dtype=dtype)
+        for y_start, y_end, tile in MapDecoderImageMixin.iter_tiles(
+            pil_image, max_tile_pixels
+        ):
+            tile = MapDecoderImageMixin.replace_low_saturation_colors(
+                color_array=tile,
+                min_saturation=min_saturation,
+                color_background=color_background,
+            )
+            cluster_matrix[y_start:y_end] = palette.assign(tile).reshape(
+                tile.shape[:2]
+            )
+        return cluster_matrix, palette.colors
+
+    @staticmethod
+    def fit_palette(
+        color_background: tuple[int, int, int],
+        color_to_label: dict[tuple, str] = None,
+        pil_image: Image.Image = None,
+        n_clusters: int = None,
+        min_saturation: float = None,
+        quantizer_backend: str = "unique_kmeans",
+    ) -> ColorPalette:
+        # From a legend alone, its colors (plus background) are the
+        # palette. From a sample image, the palette is the fitted
+        # cluster centers, unlabelled, since labels are matched by color.
+        if pil_image is None:
+            return ColorPalette.from_color_to_label(
+                color_to_label, color_background
+            )
+
+        color_array = np.array(pil_image.convert("RGB"), dtype=np.float32)
         color_array = MapDecoderImageMixin.replace_low_saturation_colors(
             color_array=color_array,
             min_saturation=min_saturation,
             color_background=color_background,
         )
-        color_matrix = color_array / 255.0
-        return color_matrix
+        quantizer = ColorQuantizer(
+            n_clusters=n_clusters,
+            backend=quantizer_backend,
+        ).fit(color_array)
+        return quantizer.get_palette()
 
     @staticmethod
     def get_most_common_colors(
-        info_list: list[dict],
+        info_list: list[dict] | InfoTable,
     ) -> dict[tuple, int]:
-        color_count = {}
-        for info in info_list:
-            color = info["color"]
-            if color not in color_count:
-                color_count[color] = 0
-            color_count[color] += 1
+        if isinstance(info_list, InfoTable):
+            return info_list.get_most_common_colors()
         n = len(info_list)
-
-        color_p_count = dict(
-            {k: round(v / n, 4) for k, v in color_count.items()}
+        if n == 0:
+            return {}
+        colors = np.array([info["color"] for info in info_list], dtype=int)
+        keys = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+        _, first_idxs, inverse = np.unique(
+            keys, return_index=True, return_inverse=True
         )
+        counts = np.bincount(inverse.reshape(-1))
+
+        # first-seen order, then a stable sort by share, as before
+        color_p_count = {
+            info_list[i_first]["color"]: round(int(counts[j]) / n, 4)
+            for j, i_first in sorted(enumerate(first_idxs), key=lambda x: x[1])
+        }
 
         color_p_count = dict(
             sorted(
@@ -0,0 +1,317 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from utils import Log
+
+from map_decoder.MapDecoderDrawMixin import MapDecoderDrawMixin
+from map_decoder.MapDecoderGeoMixin import MapDecoderGeoMixin
+from utils_future import Poly2GeoMapper
+
+if TYPE_CHECKING:
+    from gig import EntType
+
+log = Log("MapDecoderRenderMixin")
+
+
+class MapDecoderRenderMixin:
+    # PIL renderer: draws straight into a canvas in the source image's
+    # pixel frame (scaled up), projecting lat/lng with the inverse of the
+    # fitted transform. Nothing goes through matplotlib or the disk.
+    RENDERERS = ["matplotlib", "pil"]
+    CANVAS_LONG_SIDE = 3000
+    HEADER_HEIGHT = 120
+    FOOTER_HEIGHT = 80
+    COLOR_BACKGROUND = (255, 255, 255)
+
+    # ent_type.name -> (EntGeoStore,
+    #   (coords, ring_idxs, ring_ent_idxs, ring_is_exterior))
+    _ent_rings_cache = {}
+
+    @staticmethod
+    def get_font(size: int) -> ImageFont.ImageFont:
+        try:
+            return ImageFont.truetype("Arial.ttf", size)
+        except OSError:
+            return ImageFont.load_default(size=size)
+
+    @staticmethod
+    def get_to_pixels(reference_list: list[dict]):
+        # (lats, lngs) -> (xs, ys) in the source image
+        inverse_params = Poly2GeoMapper.fit_inverse(
+            xys=[ref["xy"] for ref in reference_list],
+            latlngs=[ref["latlng"] for ref in reference_list],
+        )
+
+        def to_pixels(lats: np.ndarray, lngs: np.ndarray):
+            return Poly2GeoMapper.transform_inverse(
+                (lats, lngs), inverse_params
+            )
+
+        return to_pixels
+
+    @staticmethod
+    def get_ent_rings(ent_type: "EntType") -> tuple:
+        # Every ring of every ent as flat (lng, lat) coords, with the
+        # ring each coord belongs to, and the ent and kind of each ring.
+        import shapely
+
+        from gig_future import EntGeoStore
+
+        def build(store: EntGeoStore) -> tuple:
+            polygons, polygon_ent_idxs = shapely.get_parts(
+                store.geoms, return_index=True
+            )
+            rings, ring_polygon_idxs = shapely.get_rings(
+                polygons, return_index=True
+            )
+            ring_is_exterior = np.diff(ring_polygon_idxs, prepend=-1) != 0
+            coords, ring_idxs = shapely.get_coordinates(
+                rings, return_index=True
+            )
+            return (
+                coords,
+                ring_idxs,
+                polygon_ent_idxs[ring_polygon_idxs],
+                ring_is_exterior,
+            )
+
+        return EntGeoStore.get_derived(
+            ent_type, MapDecoderRenderMixin._ent_rings_cache, build
+        )
+
+    @staticmethod
+    def project_rings(
+        ent_type: "EntType",
+        to_canvas,
+    ) -> tuple[list[list[tuple]], np.ndarray, np.ndarray]:
+        coords, ring_idxs, ring_ent_idxs, ring_is_exterior = (
+            MapDecoderRenderMixin.get_ent_rings(ent_type)
+        )
+        xs, ys = to_canvas(coords[:, 1], coords[:, 0])
+        xys = np.column_stack([xs, ys]).tolist()
+        splits = np.flatnonzero(np.diff(ring_idxs)) + 1
+        ring_xys = [
+            [tuple(xy) for xy in xys[i_start:i_end]]
+            for i_start, i_end in zip(
+                [0] + splits.tolist(), splits.tolist() + [len(xys)]
+            )
+        ]
+        return ring_xys, ring_ent_idxs, ring_is_exterior
+
+    @staticmethod
+    def new_canvas(
+        size: tuple[int, int],
+        reference_list: list[dict],
+    ):
+        width, height = size
+        scale = MapDecoderRenderMixin.CANVAS_LONG_SIDE / max(width, height)
+        image = Image.new(
+            "RGB",
+            (
+                round(width * scale),
+                round(height * scale)
+                + MapDecoderRenderMixin.HEADER_HEIGHT
+                + MapDecoderRenderMixin.FOOTER_HEIGHT,
+            ),
+            MapDecoderRenderMixin.COLOR_BACKGROUND,
+        )
+        to_pixels = MapDecoderRenderMixin.get_to_pixels(reference_list)
+
+        def to_canvas(lats: np.ndarray, lngs: np.ndarray):
+            xs, ys = to_pixels(lats, lngs)
+            return xs * scale, ys * scale + MapDecoderRenderMixin.HEADER_HEIGHT
+
+        return image, scale, to_canvas
+
+    @staticmethod
+    def render_map(
+        draw: ImageDraw.ImageDraw,
+        map_ent_type: "EntType",
+        color_map_boundaries: tuple[int, int, int],
+        to_canvas,
+    ):
+        map_ent_type_to_draw = MapDecoderDrawMixin.get_ent_type_to_draw(
+            map_ent_type
+        )
+        ring_xys, _, _ = MapDecoderRenderMixin.project_rings(
+            map_ent_type_to_draw, to_canvas
+        )
+        for xys in ring_xys:
+            draw.line(xys, fill=tuple(color_map_boundaries), width=1)
+
+    @staticmethod
+    def render_legend(
+        draw: ImageDraw.ImageDraw,
+        color_to_label: dict[tuple, str],
+        width: int,
+    ):
+        font = MapDecoderRenderMixin.get_font(36)
+        padding, swatch = 20, 36
+        line_height = swatch + padding
+        text_width = max(
+            draw.textlength(label, font=font)
+            for label in color_to_label.values()
+        )
+        box_width = 3 * padding + swatch + text_width
+        box_height = padding + line_height * len(color_to_label)
+        x0 = width - box_width - padding
+        y0 = MapDecoderRenderMixin.HEADER_HEIGHT + padding
+        draw.rectangle(
+            [x0, y0, x0 + box_width, y0 + box_height],
+            fill=MapDecoderRenderMixin.COLOR_BACKGROUND,
+            outline=(204, 204, 204),
+        )
+        for i, (color, label) in enumerate(color_to_label.items()):
+            y = y0 + padding + i * line_height
+            draw.rectangle(
+                [x0 + padding, y, x0 + padding + swatch, y + swatch],
+                fill=tuple(color),
+            )
+            draw.text(
+                (x0 + 2 * padding + swatch, y + swatch / 2),
+                label,
+                fill="black",
+                font=font,
+                anchor="lm",
+            )
+
+    @staticmethod
+    def render_title(draw: ImageDraw.ImageDraw, title: str, width: int):
+        draw.text(
+            (width / 2, MapDecoderRenderMixin.HEADER_HEIGHT / 2),
+            title,
+            fill="black",
+            font=MapDecoderRenderMixin.get_font(56),
+            anchor="mm",
+        )
+
+    @staticmethod
+    def render_annotation(
+        draw: ImageDraw.ImageDraw,
+        annotation_text: str,
+        width: int,
+        height: int,
+    ):
+        draw.text(
+            (width / 2, height - MapDecoderRenderMixin.FOOTER_HEIGHT / 2),
+            annotation_text,
+            fill="black",
+            font=MapDecoderRenderMixin.get_font(36),
+            anchor="mm",
+        )
+
+    @staticmethod
+    def render_polygon(
+        image: Image.Image,
+        draw: ImageDraw.ImageDraw,
+        ring_xys: list[list[tuple]],
+        color: tuple[int, int, int],
+    ):
+        # The exterior (ring_xys[0]) less its holes is filled through a
+        # mask over its bbox, so holes never clear anything already drawn
+        # there, such as an ent sitting in one.
+        if len(ring_xys) == 1:
+            draw.polygon(ring_xys[0], fill=color, outline="black")
+            return
+        xys = np.array(ring_xys[0])
+        x0, y0 = np.floor(xys.min(axis=0)).astype(int).tolist()
+        x1, y1 = np.ceil(xys.max(axis=0)).astype(int).tolist()
+        mask = Image.new("L", (x1 - x0 + 1, y1 - y0 + 1), 0)
+        draw_mask = ImageDraw.Draw(mask)
+        for i_ring, ring in enumerate(ring_xys):
+            draw_mask.polygon(
+                [(x - x0, y - y0) for x, y in ring],
+                fill=255 if i_ring == 0 else 0,
+            )
+        image.paste(color, (x0, y0, x1 + 1, y1 + 1), mask)
+        for ring in ring_xys:
+            draw.line(ring + ring[:1], fill="black", width=1)
+
+    @staticmethod
+    def render_info_list_image(
+        info_list: list[dict],
+        size: tuple[int, int],
+        reference_list: list[dict],
+        color_map_boundaries: tuple[int, int, int],
+        box_size_lat: int,
+        map_ent_type: "EntType",
+        title: str,
+        color_to_label: dict[tuple, str],
+    ) -> Image.Image:
+        image, scale, to_canvas = MapDecoderRenderMixin.new_canvas(
+            size, reference_list
+        )
+        draw = ImageDraw.Draw(image)
+
+        # Each sample is a square one grid step wide, centred on its xy
+        half = (
+            MapDecoderGeoMixin.get_step(reference_list, box_size_lat)
+            * scale
+            / 2
+        )
+        for info in info_list:
+            x, y = info["xy"]
+            cx = x * scale
+            cy = y * scale + MapDecoderRenderMixin.HEADER_HEIGHT
+            draw.rectangle(
+                [cx - half, cy - half, cx + half, cy + half],
+                fill=tuple(info["color"]),
+            )
+        # Boundaries go on top, as in the matplotlib renderer
+        MapDecoderRenderMixin.render_map(
+            draw, map_ent_type, color_map_boundaries, to_canvas
+        )
+
+        MapDecoderRenderMixin.render_legend(draw, color_to_label, image.width)
+        MapDecoderRenderMixin.render_title(draw, title, image.width)
+        return image
+
+    @staticmethod
+    def render_image_for_ents(
+        ent_to_label_to_n: dict,
+        size: tuple[int, int],
+        reference_list: list[dict],
+        color_to_label: dict[tuple[int, int, int], str],
+        map_ent_type: "EntType",
+        title: str,
+        color_map_boundaries: tuple[int, int, int],
+    ) -> Image.Image:
+        image, _, to_canvas = MapDecoderRenderMixin.new_canvas(
+            size, reference_list
+        )
+        draw = ImageDraw.Draw(image)
+
+        label_idxs, annotation_text = MapDecoderDrawMixin.get_ent_summary(
+            ent_to_label_to_n=ent_to_label_to_n,
+            color_to_label=color_to_label,
+            map_ent_type=map_ent_type,
+        )
+        label_colors = [tuple(color) for color in color_to_label.keys()]
+        ring_xys, ring_ent_idxs, ring_is_exterior = (
+            MapDecoderRenderMixin.project_rings(map_ent_type, to_canvas)
+        )
+        ring_label_idxs = label_idxs[ring_ent_idxs]
+        i_exteriors = np.flatnonzero(ring_is_exterior).tolist()
+        for i_start, i_end in zip(
+            i_exteriors, i_exteriors[1:] + [len(ring_xys)]
+        ):
+            label_idx = ring_label_idxs[i_start]
+            if label_idx < 0:
+                continue
+            MapDecoderRenderMixin.render_polygon(
+                image,
+                draw,
+                ring_xys[i_start:i_end],
+                label_colors[label_idx],
+            )
+        MapDecoderRenderMixin.render_map(
+            draw, map_ent_type, color_map_boundaries, to_canvas
+        )
+
+        MapDecoderRenderMixin.render_legend(draw, color_to_label, image.width)
+        MapDecoderRenderMixin.render_title(draw, title, image.width)
+        MapDecoderRenderMixin.render_annotation(
+            draw, annotation_text, image.width, image.height
+        )
+        return image
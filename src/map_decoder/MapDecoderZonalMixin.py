@@ -0,0 +1,225 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+from utils import Log
+
+from map_decoder.DecodeMetrics import DecodeMetrics
+from map_decoder.MapDecoderGeoMixin import MapDecoderGeoMixin
+from utils_future import Poly2GeoMapper
+
+if TYPE_CHECKING:
+    from gig import EntType
+
+log = Log("MapDecoder")
+
+
+class MapDecoderZonalMixin:
+    # Area-based alternative to ent_to_label_to_n: each label's pixels
+    # are turned into polygons, mapped to lat/lng, and overlaid on the
+    # map_ent_type ents, so the cost scales with the number of polygons,
+    # not with the sampling grid.
+    KM_PER_DEGREE = 111.32
+    # Pixel-space polygon edges are split to this length (in pixels)
+    # before being mapped, since the fitted transform is not affine.
+    MAX_SEGMENT_PIXELS = 16
+    AREA_SEGMENT_DEGREES = 0.01
+
+    @staticmethod
+    def get_label_code_matrix(
+        color_idx_matrix: np.ndarray,
+        color_table: np.ndarray,
+        color_to_label: dict[tuple, str],
+    ) -> tuple[np.ndarray, list[str]]:
+        # Index into labels for each pixel, or -1 if it has no label.
+        # Several colors may share a label, so labels are de-duplicated.
+        labels = list(dict.fromkeys(color_to_label.values()))
+        label_to_code = {label: i for i, label in enumerate(labels)}
+        color_label_codes = np.array(
+            [label_to_code[label] for label in color_to_label.values()] + [-1],
+            dtype=int,
+        )
+        table_label_idxs = MapDecoderGeoMixin.get_label_idxs(
+            MapDecoderGeoMixin.pack_colors(color_table), color_to_label
+        )
+        table_label_codes = color_label_codes[table_label_idxs]
+        return table_label_codes[color_idx_matrix], labels
+
+    @staticmethod
+    def get_run_boxes(
+        label_code_matrix: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Splits each label's pixels into disjoint rectangles: runs of
+        # one label along each row, with identical runs on consecutive
+        # rows merged. Returns (x0, y0, x1, y1) pixel bounds, with x1 and
+        # y1 exclusive, and the label code of each rectangle.
+        height, width = label_code_matrix.shape
+        padded = np.full((height, width + 2), -1, dtype=int)
+        padded[:, 1:-1] = label_code_matrix
+        ys, xs = np.nonzero(padded[:, 1:] != padded[:, :-1])
+        is_run = ys[:-1] == ys[1:]
+        run_ys, run_x0s, run_x1s = (
+            ys[:-1][is_run],
+            xs[:-1][is_run],
+            xs[1:][is_run],
+        )
+        run_codes = label_code_matrix[run_ys, run_x0s]
+        has_label = run_codes >= 0
+        run_ys, run_x0s, run_x1s, run_codes = (
+            run_ys[has_label],
+            run_x0s[has_label],
+            run_x1s[has_label],
+            run_codes[has_label],
+        )
+
+        # Runs are in row order, so a stable sort on (x0, x1, code) keeps
+        # each column of identical runs in row order too.
+        order = np.lexsort((run_ys, run_codes, run_x1s, run_x0s))
+        run_ys, run_x0s, run_x1s, run_codes = (
+            run_ys[order],
+            run_x0s[order],
+            run_x1s[order],
+            run_codes[order],
+        )
+        is_new_box = np.ones(len(run_ys), dtype=bool)
+        is_new_box[1:] = (
+            (run_x0s[1:] != run_x0s[:-1])
+            | (run_x1s[1:] != run_x1s[:-1])
+            | (run_codes[1:] != run_codes[:-1])
+            | (run_ys[1:] != run_ys[:-1] + 1)
+        )
+        box_starts = np.flatnonzero(is_new_box)
+        box_ends = np.append(box_starts[1:], len(run_ys)) - 1
+        bounds = np.column_stack(
+            [
+                run_x0s[box_starts],
+                run_ys[box_starts],
+                run_x1s[box_starts],
+                run_ys[box_ends] + 1,
+            ]
+        )
+        return bounds, run_codes[box_starts]
+
+    @staticmethod
+    def get_area_km2(geoms: np.ndarray) -> np.ndarray:
+        # Area of lng/lat geometries on a sphere, measured after mapping
+        # them with the sinusoidal projection, which preserves area. It
+        # bends meridians, so edges are first split to AREA_SEGMENT_DEGREES.
+        import shapely
+
+        km_per_radian = MapDecoderZonalMixin.KM_PER_DEGREE * 180 / np.pi
+
+        def to_sinusoidal(lnglats: np.ndarray) -> np.ndarray:
+            lngs, lats = np.radians(lnglats).T
+            return km_per_radian * np.column_stack([lngs * np.cos(lats), lats])
+
+        return shapely.area(
+            shapely.transform(
+                shapely.segmentize(
+                    geoms, MapDecoderZonalMixin.AREA_SEGMENT_DEGREES
+                ),
+                to_sinusoidal,
+            )
+        )
+
+    @staticmethod
+    def get_label_geoms(
+        bounds: np.ndarray,
+        reference_list: list[dict],
+    ) -> np.ndarray:
+        # Pixel rectangles -> lng/lat polygons. Pixel (x, y) covers
+        # [x - 0.5, x + 0.5] x [y - 0.5, y + 0.5].
+        import shapely
+
+        params = Poly2GeoMapper.fit(
+            xys=[ref["xy"] for ref in reference_list],
+            latlngs=[ref["latlng"] for ref in reference_list],
+        )
+        boxes = shapely.segmentize(
+            shapely.box(*(bounds.T - 0.5)),
+            MapDecoderZonalMixin.MAX_SEGMENT_PIXELS,
+        )
+
+        def to_lnglat(xys: np.ndarray) -> np.ndarray:
+            lats, lngs = Poly2GeoMapper.transform(
+                (xys[:, 0], xys[:, 1]), params
+            )
+            return np.column_stack([lngs, lats])
+
+        return shapely.transform(boxes, to_lnglat)
+
+    @staticmethod
+    def get_zonal_stats(
+        color_idx_matrix: np.ndarray,
+        color_table: np.ndarray,
+        reference_list: list[dict],
+        map_ent_type: "EntType",
+        color_to_label: dict[tuple, str],
+        metrics: DecodeMetrics = None,
+    ) -> dict[str, dict[str, dict]]:
+        # ent_id -> label -> dict(area_km2, fraction), where fraction is
+        # of the ent's area. Only ents that some label covers are listed.
+        import shapely
+
+        from gig_future import EntIndex
+
+        metrics = metrics or DecodeMetrics()
+        with metrics.stage("label_polygons"):
+            label_code_matrix, labels = (
+                MapDecoderZonalMixin.get_label_code_matrix(
+                    color_idx_matrix, color_table, color_to_label
+                )
+            )
+            bounds, label_codes = MapDecoderZonalMixin.get_run_boxes(
+                label_code_matrix
+            )
+            label_geoms = MapDecoderZonalMixin.get_label_geoms(
+                bounds, reference_list
+            )
+            metrics.count("label_polygons", len(label_geoms))
+
+        with metrics.stage("overlay"):
+            ent_index = EntIndex.for_type(map_ent_type)
+            label_idxs, ent_idxs = ent_index.tree.query(
+                label_geoms, predicate="intersects"
+            )
+            # Most polygons lie inside one ent, and need no intersection
+            is_inside = shapely.contains(
+                ent_index.geoms[ent_idxs], label_geoms[label_idxs]
+            )
+            pieces = label_geoms[label_idxs].copy()
+            pieces[~is_inside] = shapely.intersection(
+                ent_index.geoms[ent_idxs[~is_inside]],
+                label_geoms[label_idxs[~is_inside]],
+            )
+            metrics.count("overlay_pairs", len(label_idxs))
+            metrics.count("overlay_intersections", (~is_inside).sum())
+
+            n_labels = max(len(labels), 1)
+            pair_keys = ent_idxs * n_labels + label_codes[label_idxs]
+            area_km2 = np.bincount(
+                pair_keys,
+                weights=MapDecoderZonalMixin.get_area_km2(pieces),
+                minlength=len(ent_index.geoms) * n_labels,
+            ).reshape(-1, n_labels)
+
+        covered_ent_idxs = np.flatnonzero(area_km2.sum(axis=1) > 0)
+        ent_area_km2 = MapDecoderZonalMixin.get_area_km2(
+            ent_index.geoms[covered_ent_idxs]
+        )
+        zonal_stats = {}
+        for ent_idx, ent_area in zip(
+            covered_ent_idxs.tolist(), ent_area_km2.tolist()
+        ):
+            zonal_stats[ent_index.ent_ids[ent_idx]] = {
+                labels[label_code]: dict(
+                    area_km2=round(area, 6),
+                    fraction=round(area / ent_area, 6),
+                )
+                for label_code, area in enumerate(area_km2[ent_idx].tolist())
+                if area > 0
+            }
+        log.debug(
+            f"{len(label_geoms)} label polygons"
+            + f" over {len(zonal_stats)} {map_ent_type.name}s"
+        )
+        return zonal_stats
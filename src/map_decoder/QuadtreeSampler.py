@@ -0,0 +1,312 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+from utils import Log
+
+from map_decoder.DecodeMetrics import DecodeMetrics
+from utils_future import Poly2GeoMapper
+
+if TYPE_CHECKING:
+    from gig import EntType
+
+log = Log("QuadtreeSampler")
+
+
+class QuadtreeSampler:
+    # Finds the ent under each needed cell of a sampling grid, with far
+    # fewer point lookups than looking up every cell, by quadtree descent.
+    #
+    # The grid is tiled into square blocks of up to BLOCK_SIZE cells a
+    # side. If a block's probes (its needed corners, or else its first
+    # needed cell) fall in the same region at every level of the
+    # hierarchy, and its outline (in lat/lng) lies inside each of those
+    # regions, then so does every cell in it, and the block is filled
+    # without looking any of them up. Any other block is split in four,
+    # down to blocks of 2 x 2 cells, whose cells are looked up. Probes
+    # are needed cells, so this never looks up more cells than the grid.
+    #
+    # Blocks only pay off if they fit inside ents, so they are sized to
+    # half the typical ent's width, in cells. If that is under
+    # MIN_BLOCK_SIZE, as for small ents (e.g. GNDs) at a fine step, every
+    # needed cell is looked up, as with "grid" sampling.
+    BLOCK_SIZE = 16
+    MIN_BLOCK_SIZE = 4
+
+    def __init__(
+        self,
+        latlngs: np.ndarray,
+        map_ent_type: "EntType",
+        metrics: DecodeMetrics = None,
+    ):
+        from gig_future import EntFuture, EntIndex
+
+        # latlngs is (nx, ny, 2), rounded as for any other lookup
+        self.latlngs = latlngs
+        self.map_ent_type = map_ent_type
+        self.metrics = metrics or DecodeMetrics()
+
+        self.ent_types = []
+        for ent_type in EntFuture.REGION_ENT_TYPES:
+            self.ent_types.append(ent_type)
+            if ent_type.name == map_ent_type.name:
+                break
+        self.ent_indexes = [
+            EntIndex.for_type(ent_type) for ent_type in self.ent_types
+        ]
+        self.ent_id_to_idx_list = [
+            {ent_id: i for i, ent_id in enumerate(ent_index.ent_ids)}
+            for ent_index in self.ent_indexes
+        ]
+
+        nx, ny = latlngs.shape[:2]
+        # The region at every level, for each cell looked up so far
+        self.chains = np.full((len(self.ent_types), nx, ny), None, object)
+        self.is_known = np.zeros((nx, ny), dtype=bool)
+
+    def look_up(self, ii: np.ndarray, jj: np.ndarray):
+        from gig_future import EntFuture
+
+        ny = self.is_known.shape[1]
+        keys = np.unique(ii * ny + jj)
+        ii, jj = np.divmod(keys, ny)
+        is_new = ~self.is_known[ii, jj]
+        ii, jj = ii[is_new], jj[is_new]
+        if len(ii) == 0:
+            return
+
+        region_hierarchy = EntFuture.idx_regions_from_latlng_list(
+            self.latlngs[ii, jj], self.map_ent_type
+        )
+        n_lookups = len(ii)
+        for i_level, ent_type in enumerate(self.ent_types):
+            ent_ids = region_hierarchy[ent_type.name]
+            self.chains[i_level, ii, jj] = ent_ids
+            if i_level < len(self.ent_types) - 1:
+                n_lookups += int(np.count_nonzero(np.not_equal(ent_ids, None)))
+        self.is_known[ii, jj] = True
+        self.metrics.count("point_in_polygon_lookups", n_lookups)
+
+    def get_block_size(self) -> int:
+        import shapely
+
+        # Typical cell and ent widths, in degrees
+        cell_sizes = [
+            np.median(
+                np.linalg.norm(np.diff(self.latlngs, axis=axis), axis=-1)
+            )
+            for axis in [0, 1]
+            if self.latlngs.shape[axis] > 1
+        ] or [np.inf]
+        cell_size = max(cell_sizes)
+        x_min, y_min, x_max, y_max = shapely.bounds(
+            self.ent_indexes[-1].geoms
+        ).T
+        ent_size = np.median(np.minimum(x_max - x_min, y_max - y_min))
+        block_size = 1
+        while (
+            block_size < QuadtreeSampler.BLOCK_SIZE
+            and block_size * 2 <= ent_size / cell_size / 2
+        ):
+            block_size *= 2
+        return block_size
+
+    @staticmethod
+    def get_outline_cells(block: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # The cells around the edge of the block, in order
+        i0, i1, j0, j1 = block.tolist()
+        i_last, j_last = i1 - 1, j1 - 1
+        ii, jj = [], []
+        for i, j in (
+            [(i0, j) for j in range(j0, j1)]
+            + [(i, j_last) for i in range(i0 + 1, i1)]
+            + [(i_last, j) for j in range(j_last - 1, j0 - 1, -1)]
+            + [(i, j0) for i in range(i_last - 1, i0, -1)]
+        ):
+            ii.append(i)
+            jj.append(j)
+        return np.array(ii), np.array(jj)
+
+    def get_outline(self, block: np.ndarray):
+        import shapely
+
+        ii, jj = QuadtreeSampler.get_outline_cells(block)
+        lnglats = self.latlngs[ii, jj][:, ::-1]
+        i0, i1, j0, j1 = block.tolist()
+        if i1 - i0 < 2 or j1 - j0 < 2:
+            return shapely.LineString(lnglats)
+        return shapely.Polygon(lnglats)
+
+    def get_is_inside(
+        self, blocks: np.ndarray, ii: np.ndarray, jj: np.ndarray
+    ) -> np.ndarray:
+        # For blocks whose probes agree, whether the outline of each lies
+        # inside the region of its probe (ii, jj), at every level.
+        import shapely
+
+        outlines = np.array(
+            [self.get_outline(block) for block in blocks], dtype=object
+        )
+        is_inside = np.ones(len(blocks), dtype=bool)
+        for i_level, ent_index in enumerate(self.ent_indexes):
+            ent_id_to_idx = self.ent_id_to_idx_list[i_level]
+            geoms = ent_index.geoms[
+                [
+                    ent_id_to_idx[ent_id]
+                    for ent_id in self.chains[i_level, ii, jj]
+                ]
+            ]
+            is_inside &= shapely.contains(geoms, outlines)
+        self.metrics.count(
+            "block_containment_tests", len(blocks) * len(self.ent_indexes)
+        )
+        return is_inside
+
+    @staticmethod
+    def split(blocks: np.ndarray) -> np.ndarray:
+        children = []
+        for i0, i1, j0, j1 in blocks.tolist():
+            i_mid, j_mid = (i0 + i1) // 2, (j0 + j1) // 2
+            i_ranges = (
+                [(i0, i_mid), (i_mid, i1)] if i1 - i0 > 1 else [(i0, i1)]
+            )
+            j_ranges = (
+                [(j0, j_mid), (j_mid, j1)] if j1 - j0 > 1 else [(j0, j1)]
+            )
+            for i_range in i_ranges:
+                for j_range in j_ranges:
+                    children.append(i_range + j_range)
+        return np.array(children, dtype=int).reshape(-1, 4)
+
+    def get_ent_ids(
+        self,
+        needs_ent: np.ndarray,
+        block_size: int = None,
+    ) -> np.ndarray:
+        # (nx, ny) ent ids, set where needs_ent
+        nx, ny = needs_ent.shape
+        ent_ids = np.full((nx, ny), None, dtype=object)
+        if not needs_ent.any():
+            return ent_ids
+        if block_size is None:
+            block_size = self.get_block_size()
+        if block_size < QuadtreeSampler.MIN_BLOCK_SIZE:
+            log.debug(f"{block_size=}: looking up every cell")
+            self.look_up(*np.nonzero(needs_ent))
+            ent_ids[needs_ent] = self.chains[-1][needs_ent]
+            return ent_ids
+        # Summed-area table, to count the needed cells in any block
+        n_needed = np.pad(
+            needs_ent.astype(int).cumsum(axis=0).cumsum(axis=1),
+            ((1, 0), (1, 0)),
+        )
+
+        blocks = np.array(
+            [
+                (i0, min(i0 + block_size, nx), j0, min(j0 + block_size, ny))
+                for i0 in range(0, nx, block_size)
+                for j0 in range(0, ny, block_size)
+            ],
+            dtype=int,
+        ).reshape(-1, 4)
+        n_filled = 0
+        while len(blocks):
+            i0, i1, j0, j1 = blocks.T
+            n_block_needed = (
+                n_needed[i1, j1]
+                - n_needed[i0, j1]
+                - n_needed[i1, j0]
+                + n_needed[i0, j0]
+            )
+            blocks = blocks[n_block_needed > 0]
+            i0, i1, j0, j1 = blocks.T
+
+            # Small blocks, or those with no more needed cells than
+            # corners: look up every needed cell
+            n_block_needed = n_block_needed[n_block_needed > 0]
+            is_small = ((i1 - i0 <= 2) & (j1 - j0 <= 2)) | (
+                n_block_needed <= 4
+            )
+            if is_small.any():
+                ii, jj = [], []
+                for si0, si1, sj0, sj1 in blocks[is_small].tolist():
+                    sub_ii, sub_jj = np.nonzero(needs_ent[si0:si1, sj0:sj1])
+                    ii.append(sub_ii + si0)
+                    jj.append(sub_jj + sj0)
+                self.look_up(np.concatenate(ii), np.concatenate(jj))
+
+            # Other blocks: look up the probes, then fill or split
+            blocks = blocks[~is_small]
+            if len(blocks) == 0:
+                break
+            i0, i1, j0, j1 = blocks.T
+            corner_ii = np.stack([i0, i0, i1 - 1, i1 - 1], axis=1)
+            corner_jj = np.stack([j0, j1 - 1, j0, j1 - 1], axis=1)
+            first_ii, first_jj = np.array(
+                [
+                    np.unravel_index(
+                        np.argmax(needs_ent[bi0:bi1, bj0:bj1]),
+                        (bi1 - bi0, bj1 - bj0),
+                    )
+                    for bi0, bi1, bj0, bj1 in blocks.tolist()
+                ]
+            ).T
+            is_corner_needed = needs_ent[corner_ii, corner_jj]
+            corner_ii = np.where(
+                is_corner_needed, corner_ii, (i0 + first_ii)[:, None]
+            )
+            corner_jj = np.where(
+                is_corner_needed, corner_jj, (j0 + first_jj)[:, None]
+            )
+            self.look_up(corner_ii.ravel(), corner_jj.ravel())
+            corner_chains = self.chains[:, corner_ii, corner_jj]
+            has_ent = np.not_equal(corner_chains[-1, :, 0], None)
+            is_uniform = has_ent & (
+                corner_chains == corner_chains[:, :, :1]
+            ).all(axis=(0, 2))
+
+            is_filled = np.zeros(len(blocks), dtype=bool)
+            uniform_idxs = np.flatnonzero(is_uniform)
+            if len(uniform_idxs):
+                is_filled[uniform_idxs] = self.get_is_inside(
+                    blocks[uniform_idxs],
+                    corner_ii[uniform_idxs, 0],
+                    corner_jj[uniform_idxs, 0],
+                )
+            for i_block in np.flatnonzero(is_filled).tolist():
+                bi0, bi1, bj0, bj1 = blocks[i_block].tolist()
+                sub_needs = needs_ent[bi0:bi1, bj0:bj1]
+                ent_ids[bi0:bi1, bj0:bj1][sub_needs] = corner_chains[
+                    -1, i_block, 0
+                ]
+                n_filled += int(sub_needs.sum())
+
+            blocks = QuadtreeSampler.split(blocks[~is_filled])
+
+        is_looked_up = needs_ent & self.is_known
+        ent_ids[is_looked_up] = self.chains[-1][is_looked_up]
+        self.metrics.count("cells_filled", n_filled)
+        log.debug(
+            f"{int(needs_ent.sum())} cells: {n_filled} filled,"
+            + f" {int(is_looked_up.sum())} looked up"
+        )
+        return ent_ids
+
+    @staticmethod
+    def get_ent_ids_for_grid(
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        needs_ent: np.ndarray,
+        params: dict,
+        map_ent_type: "EntType",
+        metrics: DecodeMetrics = None,
+    ) -> np.ndarray:
+        latlngs = np.empty((len(x_values), len(y_values), 2))
+        Poly2GeoMapper.transform_grid(
+            x_values,
+            y_values,
+            params,
+            out=(latlngs[:, :, 0], latlngs[:, :, 1]),
+        )
+        latlngs = np.round(latlngs, 6)
+        sampler = QuadtreeSampler(latlngs, map_ent_type, metrics)
+        return sampler.get_ent_ids(needs_ent)
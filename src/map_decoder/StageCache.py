@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from typing import Callable
+
+import numpy as np
+from PIL import Image
+from utils import Log
+
+from map_decoder.DecodeMetrics import DecodeMetrics
+from utils_future import CacheDir
+
+log = Log("StageCache")
+
+
+class StageCache:
+    # On-disk cache of decode stage outputs, content-addressed: each
+    # output is stored under a hash of the stage name and of everything
+    # it was computed from (e.g. the image's pixels), so re-running decode
+    # with, say, a new title or legend reuses every stage whose inputs
+    # did not change. When the cache grows past max_bytes, the least
+    # recently used outputs are deleted.
+    #
+    # Outputs are pickled, so they are kept under the private CacheDir.
+    DIR_ROOT = os.path.join(CacheDir.DIR_ROOT, "stage_cache")
+    DEFAULT_MAX_BYTES = 1_000_000_000
+    # Bump when a stage's output changes for the same inputs, so
+    # entries written by older code are never read back.
+    VERSION = 1
+
+    def __init__(
+        self,
+        dir_root: str = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.dir_root = dir_root or StageCache.DIR_ROOT
+        self.max_bytes = max_bytes
+        CacheDir.make_private(self.dir_root)
+
+    @staticmethod
+    def hash_bytes(b: bytes) -> str:
+        return hashlib.sha256(b).hexdigest()
+
+    @staticmethod
+    def hash_image(pil_image: Image.Image) -> str:
+        # Pixels, not file bytes, so a re-saved copy of a map still hits
+        return StageCache.hash_bytes(
+            json.dumps([pil_image.mode, list(pil_image.size)]).encode()
+            + pil_image.tobytes()
+        )
+
+    @staticmethod
+    def to_jsonable(x):
+        if isinstance(x, np.ndarray):
+            return dict(
+                dtype=str(x.dtype),
+                shape=list(x.shape),
+                sha256=StageCache.hash_bytes(
+                    np.ascontiguousarray(x).tobytes()
+                ),
+            )
+        if isinstance(x, np.generic):
+            return x.item()
+        return vars(x)
+
+    @staticmethod
+    def get_key(stage: str, inputs: dict) -> str:
+        return StageCache.hash_bytes(
+            json.dumps(
+                dict(version=StageCache.VERSION, stage=stage, inputs=inputs),
+                sort_keys=True,
+                default=StageCache.to_jsonable,
+            ).encode()
+        )
+
+    def get_path(self, stage: str, key: str) -> str:
+        return os.path.join(self.dir_root, stage, f"{key}.pkl")
+
+    def get_or_compute(
+        self,
+        stage: str,
+        inputs: dict,
+        func: Callable[[], object],
+        metrics: DecodeMetrics = None,
+    ):
+        metrics = metrics or DecodeMetrics()
+        path = self.get_path(stage, StageCache.get_key(stage, inputs))
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    output = pickle.load(f)
+                os.utime(path)
+                metrics.count("stage_cache_hits")
+                log.debug(f"[{stage}] Hit {path}")
+                return output
+            except (OSError, EOFError, pickle.UnpicklingError) as e:
+                log.warning(f"[{stage}] Ignoring unreadable {path}: {e}")
+
+        output = func()
+        metrics.count("stage_cache_misses")
+        self.write(path, output)
+        self.evict()
+        return output
+
+    @staticmethod
+    def write(path: str, output):
+        # Written to a temp file first, so a reader never sees half of it
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, path_tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path_tmp, path)
+
+    def list_entries(self) -> list[tuple[float, int, str]]:
+        # (last used, size, path) for every cached output
+        entries = []
+        for dir_path, _, file_names in os.walk(self.dir_root):
+            for file_name in file_names:
+                if not file_name.endswith(".pkl"):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get_size(self) -> int:
+        return sum(size for _, size, _ in self.list_entries())
+
+    def evict(self):
+        entries = sorted(self.list_entries())
+        total_size = sum(size for _, size, _ in entries)
+        n_evicted = 0
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            n_evicted += 1
+        if n_evicted:
+            log.debug(f"Evicted {n_evicted} outputs ({total_size:,}B left)")
+
+    def clear(self):
+        for _, _, path in self.list_entries():
+            os.remove(path)
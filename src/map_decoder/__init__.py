@@ -1,8 +1,21 @@
 # map_decoder (auto generate by build_inits.py)
 # flake8: noqa: F408
 
+from map_decoder.ColorPalette import ColorPalette
+from map_decoder.ColorQuantizer import ColorQuantizer
+from map_decoder.DecodeMetrics import DecodeMetrics
+from map_decoder.DecodeResult import DecodeResult
+from map_decoder.EntRaster import EntRaster
+from map_decoder.InfoAggregator import InfoAggregator
+from map_decoder.InfoTable import InfoTable
+from map_decoder.InfoWriter import InfoWriter
 from map_decoder.MapDecoder import MapDecoder
+from map_decoder.MapDecoderBatch import MapDecoderBatch
 from map_decoder.MapDecoderDrawMixin import MapDecoderDrawMixin
 from map_decoder.MapDecoderEntMixin import MapDecoderEntMixin
 from map_decoder.MapDecoderGeoMixin import MapDecoderGeoMixin
 from map_decoder.MapDecoderImageMixin import MapDecoderImageMixin
+from map_decoder.MapDecoderRenderMixin import MapDecoderRenderMixin
+from map_decoder.MapDecoderZonalMixin import MapDecoderZonalMixin
+from map_decoder.QuadtreeSampler import QuadtreeSampler
+from map_decoder.StageCache import StageCache
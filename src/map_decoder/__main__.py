@@ -0,0 +1,32 @@
+import argparse
+import sys
+
+from utils import Log
+
+from map_decoder.MapDecoderBatch import MapDecoderBatch
+
+log = Log("map_decoder")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Decode a manifest of maps on a pool of workers."
+    )
+    parser.add_argument("manifest_path")
+    parser.add_argument("--n-workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    batch = MapDecoderBatch.from_manifest(args.manifest_path)
+    results = batch.run(n_workers=args.n_workers)
+
+    failed_results = [result for result in results if result["error"]]
+    for result in failed_results:
+        log.error(f"{result['image_path']}: {result['error']}")
+    log.info(
+        f"{len(results) - len(failed_results)}/{len(results)} maps decoded"
+    )
+    return 1 if failed_results else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import os
+import tempfile
+from typing import Callable
+
+from utils import Log
+
+log = Log("CacheDir")
+
+
+class CacheDir:
+    # Per-user root of every on-disk cache (ent geometries, rasters,
+    # stage outputs). Cached files are trusted when read back, so the
+    # root is private to the user (0700), never a shared temp dir, where
+    # another user could plant a file or own the directory.
+    DIR_ROOT = os.path.join(
+        os.environ.get("XDG_CACHE_HOME")
+        or os.path.join(os.path.expanduser("~"), ".cache"),
+        "map_decoder",
+    )
+
+    @staticmethod
+    def make_private(dir_path: str):
+        os.makedirs(dir_path, mode=0o700, exist_ok=True)
+        if not hasattr(os, "getuid"):
+            return
+        stat = os.stat(dir_path)
+        if stat.st_uid != os.getuid():
+            raise PermissionError(
+                f"{dir_path} is not owned by the current user"
+            )
+        if stat.st_mode & 0o077:
+            os.chmod(dir_path, 0o700)
+
+    @staticmethod
+    def get(name: str) -> str:
+        # DIR_ROOT/name, created private if need be
+        CacheDir.make_private(CacheDir.DIR_ROOT)
+        dir_path = os.path.join(CacheDir.DIR_ROOT, name)
+        CacheDir.make_private(dir_path)
+        return dir_path
+
+    @staticmethod
+    def write_atomic(path: str, write: Callable[[str], None]):
+        # write(path_tmp) writes to a fresh temp file in the same
+        # directory, which then replaces path, so concurrent readers and
+        # writers (e.g. pool or batch workers) never see half a file.
+        fd, path_tmp = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=os.path.splitext(path)[1]
+        )
+        os.close(fd)
+        try:
+            write(path_tmp)
+            os.replace(path_tmp, path)
+        except BaseException:
+            os.remove(path_tmp)
+            raise
@@ -25,6 +25,12 @@ class Poly2GeoMapper:
         params = [lat_params, lng_params]
         return params
 
+    @staticmethod
+    def evaluate(x, y, p: np.ndarray):
+        # p[0] x^2 + p[1] y^2 + p[2] xy + p[3] x + p[4] y + p[5], without
+        # building the (N, 6) design matrix
+        return (p[0] * x + p[2] * y + p[3]) * x + (p[1] * y + p[4]) * y + p[5]
+
     @staticmethod
     def transform(xy: tuple, params: list[np.ndarray]):
         lat_params, lng_params = params
@@ -32,13 +38,93 @@ class Poly2GeoMapper:
         x = np.asarray(x)
         y = np.asarray(y)
 
-        # Ensure A has shape (N, 6)
-        A = np.column_stack([x**2, y**2, x * y, x, y, np.ones_like(x)])
-
-        lat = A.dot(lat_params)
-        lng = A.dot(lng_params)
+        lat = Poly2GeoMapper.evaluate(x, y, lat_params)
+        lng = Poly2GeoMapper.evaluate(x, y, lng_params)
 
         # Return scalars if input was scalar
-        if lat.size == 1:
+        if x.ndim == 0:
             return float(lat), float(lng)
         return (lat, lng)
+
+    @staticmethod
+    def transform_grid(
+        x_values: np.ndarray,
+        y_values: np.ndarray,
+        params: list[np.ndarray],
+        out: tuple[np.ndarray, np.ndarray] = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # (lats, lngs) at every (x, y) of the grid, each of shape
+        # (len(x_values), len(y_values)), as meshgrid(indexing="ij").
+        # The surface separates into a term in x, a term in y, and
+        # p[2] * outer(x, y), so only the outputs are grid-sized. out may
+        # be a pair of preallocated (e.g. float32) arrays to write to.
+        x_values = np.asarray(x_values, dtype=float)
+        y_values = np.asarray(y_values, dtype=float)
+        if out is None:
+            shape = (len(x_values), len(y_values))
+            out = (np.empty(shape), np.empty(shape))
+        for p, values in zip(params, out):
+            np.multiply.outer(p[2] * x_values, y_values, out=values)
+            values += ((p[0] * x_values + p[3]) * x_values + p[5])[:, None]
+            values += ((p[1] * y_values + p[4]) * y_values)[None, :]
+        return out
+
+    @staticmethod
+    def inverse_transform(
+        latlng: tuple,
+        params: list[np.ndarray],
+        xy_guess: tuple = None,
+        n_iter: int = 5,
+    ):
+        # Solves transform(xy, params) == latlng for xy with Newton's
+        # method, starting from xy_guess (e.g. a rough inverse fit).
+        lat_params, lng_params = params
+        lat, lng = latlng
+        lat = np.asarray(lat, dtype=float)
+        lng = np.asarray(lng, dtype=float)
+        if xy_guess is None:
+            x, y = np.zeros_like(lat), np.zeros_like(lat)
+        else:
+            x = np.array(xy_guess[0], dtype=float)
+            y = np.array(xy_guess[1], dtype=float)
+
+        for _ in range(n_iter):
+            lat_cur, lng_cur = Poly2GeoMapper.transform((x, y), params)
+            f_lat = lat_cur - lat
+            f_lng = lng_cur - lng
+            dlat_dx = 2 * lat_params[0] * x + lat_params[2] * y + lat_params[3]
+            dlat_dy = 2 * lat_params[1] * y + lat_params[2] * x + lat_params[4]
+            dlng_dx = 2 * lng_params[0] * x + lng_params[2] * y + lng_params[3]
+            dlng_dy = 2 * lng_params[1] * y + lng_params[2] * x + lng_params[4]
+            det = dlat_dx * dlng_dy - dlat_dy * dlng_dx
+            x = x - (dlng_dy * f_lat - dlat_dy * f_lng) / det
+            y = y - (dlat_dx * f_lng - dlng_dx * f_lat) / det
+
+        return (x, y)
+
+    @staticmethod
+    def fit_inverse(
+        xys: list[tuple[int, int]], latlngs: list[tuple[float, float]]
+    ) -> list:
+        # Params for transform_inverse: those of fit, and a rough
+        # lat/lng -> pixel map, fitted by swapping the roles of xy and
+        # latlng, which Newton's method then polishes against them.
+        return [
+            Poly2GeoMapper.fit(xys=xys, latlngs=latlngs),
+            Poly2GeoMapper.fit(xys=latlngs, latlngs=xys),
+        ]
+
+    @staticmethod
+    def transform_inverse(
+        latlng: tuple,
+        inverse_params: list,
+        n_iter: int = 5,
+    ):
+        # (lat, lng) -> (x, y), with inverse_params from fit_inverse
+        params, rough_inverse_params = inverse_params
+        return Poly2GeoMapper.inverse_transform(
+            latlng,
+            params,
+            xy_guess=Poly2GeoMapper.transform(latlng, rough_inverse_params),
+            n_iter=n_iter,
+        )
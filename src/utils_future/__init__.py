@@ -1,4 +1,5 @@
 # utils_future (auto generate by build_inits.py)
 # flake8: noqa: F408
 
+from utils_future.CacheDir import CacheDir
 from utils_future.Poly2GeoMapper import Poly2GeoMapper
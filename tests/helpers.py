@@ -0,0 +1,120 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import shapely
+from gig import Ent, EntType
+from PIL import Image
+
+from gig_future import EntGeoStore
+
+
+def get_temp_dir(test_case: unittest.TestCase) -> str:
+    # A new temp dir, removed when test_case finishes
+    dir_temp = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, dir_temp)
+    return dir_temp
+
+
+def get_ents(geoms: list, ent_ids: list[str] = None) -> list[Ent]:
+    # Ents for geoms, with ids LK-1, LK-2, ... unless given
+    ent_ids = ent_ids or [f"LK-{i + 1}" for i in range(len(geoms))]
+    return [
+        Ent(
+            dict(
+                id=ent_id,
+                name=f"Synthetic {ent_id}",
+                population=1_000 * (i + 1),
+                centroid=[
+                    shapely.centroid(geom).y,
+                    shapely.centroid(geom).x,
+                ],
+            )
+        )
+        for i, (ent_id, geom) in enumerate(zip(ent_ids, geoms))
+    ]
+
+
+def set_ents(
+    geoms: list,
+    ent_ids: list[str] = None,
+    ent_type: EntType = EntType.PROVINCE,
+) -> EntGeoStore:
+    # Puts synthetic ents in place of gig's, so nothing hits the network.
+    # Undo with EntGeoStore.reset(), e.g. in tearDown.
+    return EntGeoStore.set_for_type(ent_type, get_ents(geoms, ent_ids), geoms)
+
+
+# Four samples over two ents, two labels and three colors
+INFO_LIST = [
+    dict(
+        xy=(0, 0),
+        latlng=(7.0, 80.0),
+        ent_id="LK-2",
+        label="b",
+        color=(4, 5, 6),
+    ),
+    dict(
+        xy=(0, 4),
+        latlng=(7.1, 80.0),
+        ent_id="LK-1",
+        label="a",
+        color=(1, 2, 3),
+    ),
+    dict(
+        xy=(4, 0),
+        latlng=(7.0, 80.1),
+        ent_id="LK-1",
+        label="b",
+        color=(7, 8, 9),
+    ),
+    dict(
+        xy=(4, 4),
+        latlng=(7.1, 80.1),
+        ent_id="LK-2",
+        label="b",
+        color=(4, 5, 6),
+    ),
+]
+
+
+# A 60 x 60 map over two provinces, split at lng 81.5, where pixel
+# (x, y) is at lat = 9 - y / 20, lng = 80 + x / 20. Red is in the west,
+# blue in the east, and green straddles both.
+MAP_GEOMS = [shapely.box(80, 6, 81.5, 9), shapely.box(81.5, 6, 83, 9)]
+MAP_EXTREME_POINTS = {(30, 0): "N", (30, 60): "S", (0, 30): "W", (60, 30): "E"}
+MAP_REFERENCE_LIST = [
+    dict(
+        xy=(x, y),
+        latlng=(9 - y / 20, 80 + x / 20),
+        extreme_point=MAP_EXTREME_POINTS.get((x, y)),
+    )
+    for x in [0, 30, 60]
+    for y in [0, 30, 60]
+]
+MAP_COLOR_TO_LABEL = {
+    (255, 0, 0): "red",
+    (0, 0, 255): "blue",
+    (0, 255, 0): "green",
+}
+MAP_DECODE_KWARGS = dict(
+    reference_list=MAP_REFERENCE_LIST,
+    min_saturation=0.1,
+    n_clusters=4,
+    color_reference_point=(255, 0, 0),
+    color_map_boundaries=(0, 0, 0),
+    color_background=(255, 255, 255),
+    box_size_lat=0.2,
+    map_ent_type=EntType.PROVINCE,
+    title="Synthetic",
+    color_to_label=MAP_COLOR_TO_LABEL,
+)
+
+
+def get_map_image() -> Image.Image:
+    pixels = np.full((60, 60, 3), 255, dtype=np.uint8)
+    pixels[4:26, 4:26] = (255, 0, 0)
+    pixels[4:26, 34:56] = (0, 0, 255)
+    pixels[34:56, 20:40] = (0, 255, 0)
+    return Image.fromarray(pixels)
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utils_future import CacheDir
+
+
+class TestCase(unittest.TestCase):
+    def test_get(self):
+        with tempfile.TemporaryDirectory() as dir_tmp:
+            dir_root = os.path.join(dir_tmp, "map_decoder")
+            os.makedirs(dir_root, mode=0o777)
+            os.chmod(dir_root, 0o777)
+            with mock.patch.object(CacheDir, "DIR_ROOT", dir_root):
+                dir_path = CacheDir.get("ent_raster")
+            self.assertEqual(dir_path, os.path.join(dir_root, "ent_raster"))
+            for path in [dir_root, dir_path]:
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+
+    def test_write_atomic(self):
+        with tempfile.TemporaryDirectory() as dir_tmp:
+            path = os.path.join(dir_tmp, "x.txt")
+
+            def write(path_tmp: str):
+                self.assertNotEqual(path_tmp, path)
+                with open(path_tmp, "w") as f:
+                    f.write("x")
+
+            CacheDir.write_atomic(path, write)
+            with open(path) as f:
+                self.assertEqual(f.read(), "x")
+
+            def fail(path_tmp: str):
+                raise ValueError()
+
+            with self.assertRaises(ValueError):
+                CacheDir.write_atomic(path, fail)
+            self.assertEqual(os.listdir(dir_tmp), ["x.txt"])
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from map_decoder import ColorPalette, MapDecoder
+from tests.helpers import get_map_image
+
+TEST_COLOR_TO_LABEL = {
+    (81, 174, 200): "Temporary Corridors",
+    (20, 167, 85): "Permanent Corridors and Parks",
+}
+
+
+class TestCase(unittest.TestCase):
+    def test_assign(self):
+        palette = ColorPalette.from_color_to_label(
+            TEST_COLOR_TO_LABEL, (255, 255, 255)
+        )
+        self.assertEqual(len(palette), 3)
+        self.assertIsNone(palette.labels[2])
+
+        pixels = np.array([[80, 170, 199], [250, 251, 252], [21, 160, 90]])
+        self.assertEqual(palette.assign(pixels).tolist(), [0, 2, 1])
+
+    def test_fit_palette(self):
+        palette = MapDecoder.fit_palette(
+            (255, 255, 255),
+            pil_image=get_map_image(),
+            n_clusters=4,
+            min_saturation=0.1,
+        )
+        self.assertEqual(len(palette), 4)
+        self.assertIsNone(palette.labels)
+
+    def test_write_and_read(self):
+        palette = ColorPalette.from_color_to_label(
+            TEST_COLOR_TO_LABEL, (255, 255, 255)
+        )
+        with tempfile.TemporaryDirectory() as dir_temp:
+            path = os.path.join(dir_temp, "palette.json")
+            palette.write(path)
+            observed_palette = ColorPalette.read(path)
+        np.testing.assert_array_equal(observed_palette.colors, palette.colors)
+        self.assertEqual(observed_palette.labels, palette.labels)
@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+
+from map_decoder import ColorQuantizer
+
+TEST_COLORS = [(255, 255, 255), (81, 174, 200), (20, 167, 85)]
+TEST_PIXELS = np.repeat(
+    np.array(TEST_COLORS, dtype=np.float32), [500, 300, 200], axis=0
+) + np.random.default_rng(0).integers(-3, 4, size=(1000, 3))
+
+
+class TestCase(unittest.TestCase):
+    def test_backends(self):
+        for backend in ColorQuantizer.BACKENDS:
+            quantizer = ColorQuantizer(n_clusters=3, backend=backend)
+            labels = quantizer.fit_predict(TEST_PIXELS)
+            self.assertEqual(labels.shape, (1000,))
+            self.assertGreaterEqual(quantizer.fit_time, 0)
+            self.assertGreaterEqual(quantizer.inertia, 0)
+
+            if backend == "median_cut":
+                # splits at the median, so clusters can straddle colors
+                continue
+            centers = quantizer.cluster_centers[labels]
+            for i, color in [(0, TEST_COLORS[0]), (999, TEST_COLORS[2])]:
+                np.testing.assert_allclose(centers[i], color, atol=5)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            ColorQuantizer(n_clusters=3, backend="unknown")
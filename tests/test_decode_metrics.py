@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from map_decoder import DecodeMetrics
+
+
+class TestCase(unittest.TestCase):
+    def test_stages(self):
+        stages = []
+        metrics = DecodeMetrics(hook=stages.append, trace_memory=True)
+        with metrics.stage("outer"):
+            metrics.count("a")
+            with metrics.stage("inner"):
+                x = np.ones(1_000_000)
+                metrics.count("a", 2)
+                metrics.count("b", 3)
+            del x
+
+        self.assertEqual([d["name"] for d in stages], ["inner", "outer"])
+        inner, outer = stages
+        self.assertEqual(inner["depth"], 1)
+        self.assertEqual(inner["counters"], {"a": 2, "b": 3})
+        self.assertEqual(outer["counters"], {"a": 3, "b": 3})
+        self.assertGreaterEqual(inner["peak_memory"], 8_000_000)
+        self.assertGreaterEqual(outer["peak_memory"], inner["peak_memory"])
+
+        self.assertIsNone(inner["max_rss"])
+
+        report = metrics.report
+        self.assertEqual(report["counters"], {"a": 3, "b": 3})
+        self.assertIsNone(report["max_rss"])
+        self.assertEqual(report["wall_time"], outer["wall_time"])
+
+    def test_no_memory(self):
+        metrics = DecodeMetrics()
+        with metrics.stage("stage"):
+            pass
+        report = metrics.report
+        self.assertIsNone(report["stages"][0]["peak_memory"])
+        if DecodeMetrics.get_max_rss() is not None:
+            self.assertGreater(report["stages"][0]["max_rss"], 1_000_000)
+            self.assertGreaterEqual(
+                report["max_rss"], report["stages"][0]["max_rss"]
+            )
@@ -0,0 +1,74 @@
+import unittest
+
+from gig import EntType
+
+from map_decoder import DecodeResult, InfoTable, MapDecoder
+from tests import helpers
+
+INFO_LIST = [
+    dict(ent_id="LK-1", label="a", color=(1, 2, 3)),
+    dict(ent_id="LK-1", label="b", color=(4, 5, 6)),
+    dict(ent_id="LK-2", label="b", color=(4, 5, 6)),
+]
+
+
+class TestCase(unittest.TestCase):
+    def get_result(self) -> DecodeResult:
+        return DecodeResult(
+            map_decoder=MapDecoder(None),
+            info_list=INFO_LIST,
+            reference_list=[],
+            color_reference_point=(255, 0, 0),
+            color_map_boundaries=(0, 0, 0),
+            box_size_lat=0.01,
+            map_ent_type=EntType.PROVINCE,
+            title="Test",
+            color_to_label={(1, 2, 3): "a", (4, 5, 6): "b"},
+        )
+
+    def test_lazy(self):
+        result = self.get_result()
+        self.assertEqual(
+            result.ent_to_label_to_n,
+            {"LK-1": {"a": 1, "b": 1}, "LK-2": {"b": 1}},
+        )
+        self.assertEqual(
+            result.most_common_colors, {(4, 5, 6): 0.6667, (1, 2, 3): 0.3333}
+        )
+        for field in ["image_inspection", "image_info_list", "image_for_ents"]:
+            self.assertNotIn(field, result.__dict__)
+
+    def test_tuple_compat(self):
+        result = self.get_result()
+        self.assertEqual(len(result), 6)
+        self.assertIs(result[0], INFO_LIST)
+        self.assertIs(result[4], result.ent_to_label_to_n)
+
+    def test_info_list_from_info_table(self):
+        info_table = InfoTable.from_info_list(helpers.INFO_LIST)
+        result = DecodeResult(
+            map_decoder=MapDecoder(None),
+            reference_list=[],
+            color_reference_point=(255, 0, 0),
+            color_map_boundaries=(0, 0, 0),
+            box_size_lat=0.01,
+            map_ent_type=EntType.PROVINCE,
+            title="Test",
+            color_to_label={(1, 2, 3): "a", (4, 5, 6): "b"},
+            info_table=info_table,
+        )
+        self.assertNotIn("info_list", result.__dict__)
+        self.assertEqual(result.info_list, helpers.INFO_LIST)
+
+    def test_no_info(self):
+        with self.assertRaises(ValueError):
+            DecodeResult(
+                MapDecoder(None),
+                [],
+                (255, 0, 0),
+                (0, 0, 0),
+                0.01,
+                EntType.PROVINCE,
+                "Test",
+                {},
+            )
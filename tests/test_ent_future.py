@@ -53,3 +53,21 @@ class TestCase(unittest.TestCase):
             region_hierarchy[EntType.GND.name].name,
             "Kurunduwatta",
         )
+
+    def test_idx_regions_from_latlng_list(self):
+        region_hierarchy = EntFuture.idx_regions_from_latlng_list(
+            latlngs=[
+                (6.915706285411007, 79.86352777692407),  # Town Hall
+                (4.1748, 73.50888),  # Male, Maldives
+            ],
+        )
+        for ent_type in EntFuture.REGION_ENT_TYPES:
+            ent_ids = region_hierarchy[ent_type.name]
+            self.assertEqual(len(ent_ids), 2)
+            self.assertIsNone(ent_ids[1])
+
+        region_hierarchy_single = EntFuture.idx_regions_from_latlng(
+            latlng=(6.915706285411007, 79.86352777692407),
+        )
+        for ent_type_name, ent in region_hierarchy_single.items():
+            self.assertEqual(region_hierarchy[ent_type_name][0], ent.id)
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import shapely
+from gig import Ent, EntType
+
+from gig_future import EntGeoStore
+from utils_future import CacheDir
+
+
+class TestCase(unittest.TestCase):
+    def test_write_and_read_geoms(self):
+        ent_ids = ["LK-1", "LK-2"]
+        geoms = [shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 2)]
+        with tempfile.TemporaryDirectory() as dir_store:
+            EntGeoStore.write_geoms(dir_store, ent_ids, geoms)
+            observed_ent_ids, observed_geoms = EntGeoStore.read_geoms(
+                dir_store
+            )
+            self.assertEqual(
+                sorted(os.listdir(dir_store)),
+                ["ids.json", "offsets.npy", "wkb.npy"],
+            )
+        self.assertEqual(observed_ent_ids, ent_ids)
+        for geom, observed_geom in zip(geoms, observed_geoms):
+            self.assertTrue(shapely.equals(geom, observed_geom))
+
+    def test_get_dir_store(self):
+        ents = [Ent(dict(id="LK-1", name="Western"))]
+        with tempfile.TemporaryDirectory() as dir_root:
+            with mock.patch.object(CacheDir, "DIR_ROOT", dir_root):
+                dir_store = EntGeoStore.get_dir_store(EntType.PROVINCE, ents)
+            self.assertTrue(
+                dir_store.startswith(os.path.join(dir_root, "ent_geo"))
+            )
+            self.assertEqual(
+                os.stat(os.path.dirname(os.path.dirname(dir_store))).st_mode
+                & 0o777,
+                0o700,
+            )
+
+    def test_data_version(self):
+        ents = [Ent(dict(id="LK-1", centroid=[0.5, 0.5]))]
+        store = EntGeoStore(EntType.PROVINCE, ents, [shapely.box(0, 0, 1, 1)])
+        same_ids_store = EntGeoStore(
+            EntType.PROVINCE, ents, [shapely.box(0, 0, 1, 2)]
+        )
+        self.assertNotEqual(store.data_version, same_ids_store.data_version)
+        self.assertEqual(
+            store.data_version,
+            EntGeoStore(
+                EntType.PROVINCE, ents, [shapely.box(0, 0, 1, 1)]
+            ).data_version,
+        )
+
+    def test_get_source_version(self):
+        source_version = EntGeoStore.get_source_version(
+            [Ent(dict(id="LK-1", centroid=[0.5, 0.5]))]
+        )
+        self.assertNotEqual(
+            EntGeoStore.get_source_version(
+                [Ent(dict(id="LK-1", centroid=[1.0, 0.5]))]
+            ),
+            source_version,
+        )
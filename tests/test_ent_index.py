@@ -0,0 +1,55 @@
+import unittest
+
+import shapely
+from gig import EntType
+
+from gig_future import EntIndex
+from tests.helpers import get_ents
+
+
+def get_ent_index() -> EntIndex:
+    # Two districts of LK-1 and one of LK-2, side by side
+    geoms = [shapely.box(80 + i, 6, 81 + i, 7) for i in range(3)]
+    return EntIndex(get_ents(geoms, ["LK-11", "LK-12", "LK-21"]), geoms)
+
+
+class TestCase(unittest.TestCase):
+    def test_find(self):
+        ent_index = EntIndex.for_type(EntType.GND)
+        self.assertIs(EntIndex.for_type(EntType.GND), ent_index)
+
+        ent = ent_index.find(
+            latlng=(6.915706285411007, 79.86352777692407),  # Town Hall
+        )
+        self.assertEqual(ent.name, "Kurunduwatta")
+
+        self.assertIsNone(ent_index.find(latlng=(4.1748, 73.50888)))
+
+    def test_get_ancestor_ent_ids(self):
+        self.assertEqual(
+            EntIndex.get_ancestor_ent_ids("LK-1127015"),
+            ["LK", "LK-1", "LK-11", "LK-1127"],
+        )
+        self.assertEqual(EntIndex.get_ancestor_ent_ids("LK-1"), ["LK"])
+        self.assertEqual(EntIndex.get_ancestor_ent_ids("LK"), [])
+
+    def test_get_child_idxs(self):
+        ent_index = get_ent_index()
+        self.assertEqual(ent_index.get_child_idxs("LK").tolist(), [0, 1, 2])
+        self.assertEqual(ent_index.get_child_idxs("LK-1").tolist(), [0, 1])
+        self.assertEqual(ent_index.get_child_idxs("LK-2").tolist(), [2])
+        self.assertEqual(ent_index.get_child_idxs("LK-3").tolist(), [])
+
+    def test_find_with_parent(self):
+        ent_index = get_ent_index()
+        latlng = (6.5, 81.5)
+        self.assertEqual(ent_index.find(latlng).id, "LK-12")
+        self.assertEqual(ent_index.find(latlng, "LK-1").id, "LK-12")
+        self.assertIsNone(ent_index.find(latlng, "LK-2"))
+        self.assertIsNone(ent_index.find((6.5, 79.5), "LK-1"))
+
+        idxs = ent_index.find_idxs(
+            [(6.5, 81.5), (6.5, 81.5), (6.5, 82.5)],
+            ["LK-1", "LK-2", "LK"],
+        )
+        self.assertEqual(idxs.tolist(), [1, -1, 2])
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import shapely
+from gig import EntType
+
+from gig_future import EntGeoStore
+from map_decoder import EntRaster, MapDecoder
+from tests.helpers import set_ents
+from utils_future import Poly2GeoMapper
+
+# Pixel (x, y) is at lat = 9 - y / 10, lng = 80 + x / 10
+REFERENCE_LIST = [
+    dict(xy=(x, y), latlng=(9 - y / 10, 80 + x / 10))
+    for x in [0, 15, 30]
+    for y in [0, 15, 30]
+]
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        # LK-1 is an enclave, filling a hole in LK-2, and comes first
+        inner = shapely.box(81, 7, 82, 8)
+        outer = shapely.Polygon(
+            shapely.box(80.5, 6.5, 82.5, 8.5).exterior.coords,
+            holes=[inner.exterior.coords],
+        )
+        set_ents([inner, outer])
+
+    def tearDown(self):
+        EntGeoStore.reset()
+
+    def test_build_with_enclave(self):
+        ent_raster = EntRaster.build(
+            (30, 30), REFERENCE_LIST, EntType.PROVINCE
+        )
+        self.assertEqual(ent_raster.raster.shape, (30, 30))
+        ent_ids = ent_raster.get_ent_ids([15, 7, 22, 2], [15, 15, 15, 2])
+        self.assertEqual(ent_ids.tolist(), ["LK-1", "LK-2", "LK-2", None])
+
+    def test_build_matches_exact_lookup(self):
+        # Neighbours share slanted edges, so a raster that paints outlines
+        # would hand the pixels along them to whichever ent came last.
+        # No vertex or edge is on the pixel grid (every 0.1 degrees),
+        # where either lookup could go either way.
+        hole = [(82.15, 7.15), (82.65, 7.35), (82.45, 8.25)]
+        set_ents(
+            [
+                shapely.Polygon(
+                    [
+                        (80.05, 6.05),
+                        (82.33, 6.05),
+                        (80.77, 8.95),
+                        (80.05, 8.95),
+                    ]
+                ),
+                shapely.Polygon(
+                    [
+                        (82.33, 6.05),
+                        (82.95, 6.05),
+                        (82.95, 8.95),
+                        (80.77, 8.95),
+                    ],
+                    holes=[hole],
+                ),
+                shapely.Polygon(hole),
+            ]
+        )
+        size = (30, 30)
+        ent_raster = EntRaster.build(size, REFERENCE_LIST, EntType.PROVINCE)
+        ys, xs = np.indices(size[::-1])
+        xs, ys = xs.ravel(), ys.ravel()
+        params = Poly2GeoMapper.fit(
+            xys=[ref["xy"] for ref in REFERENCE_LIST],
+            latlngs=[ref["latlng"] for ref in REFERENCE_LIST],
+        )
+        lats, lngs = Poly2GeoMapper.transform((xs, ys), params)
+        expected = MapDecoder.get_ent_ids(
+            np.column_stack([lats, lngs]), EntType.PROVINCE
+        )
+        self.assertEqual(
+            set(expected.tolist()), {"LK-1", "LK-2", "LK-3", None}
+        )
+        np.testing.assert_array_equal(ent_raster.get_ent_ids(xs, ys), expected)
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import map_decoder
+
+DIR_SRC = os.path.dirname(os.path.dirname(map_decoder.__file__))
+HEAVY_MODULES = ["gig", "matplotlib", "shapely", "sklearn", "tqdm"]
+
+CODE = f"""
+import json, sys
+import map_decoder
+import utils_future
+loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+print(json.dumps(dict(loaded=loaded)))
+"""
+
+
+class TestCase(unittest.TestCase):
+    def test_import(self):
+        env = os.environ | dict(PYTHONPATH=DIR_SRC)
+        output = subprocess.check_output(
+            [sys.executable, "-c", CODE], env=env, text=True
+        )
+        d = json.loads(output.strip().splitlines()[-1])
+        self.assertEqual(d["loaded"], [])
@@ -0,0 +1,21 @@
+import unittest
+
+from map_decoder import InfoAggregator, InfoTable
+from tests.helpers import INFO_LIST
+
+
+class TestCase(unittest.TestCase):
+    def test_update(self):
+        info_table = InfoTable.from_info_list(INFO_LIST)
+        aggregator = InfoAggregator()
+        for info in INFO_LIST:
+            aggregator.update(InfoTable.from_info_list([info]))
+        self.assertEqual(aggregator.n, len(INFO_LIST))
+        self.assertEqual(
+            list(aggregator.ent_to_label_to_n.items()),
+            list(info_table.get_ent_to_label_to_n().items()),
+        )
+        self.assertEqual(
+            list(aggregator.most_common_colors.items()),
+            list(info_table.get_most_common_colors().items()),
+        )
@@ -0,0 +1,31 @@
+import unittest
+
+from map_decoder import InfoTable, MapDecoder
+from tests.helpers import INFO_LIST
+
+
+class TestCase(unittest.TestCase):
+    def test_round_trip(self):
+        info_table = InfoTable.from_info_list(INFO_LIST)
+        self.assertEqual(len(info_table), 4)
+        self.assertEqual(info_table.ent_ids.tolist(), ["LK-2", "LK-1"])
+        self.assertEqual(info_table.labels, ["b", "a"])
+        self.assertEqual(info_table.to_info_list(), INFO_LIST)
+
+    def test_aggregations(self):
+        info_table = InfoTable.from_info_list(INFO_LIST)
+        for info in [info_table, INFO_LIST]:
+            self.assertEqual(
+                list(MapDecoder.get_ent_to_label_to_n(info).items()),
+                [("LK-2", {"b": 2}), ("LK-1", {"a": 1, "b": 1})],
+            )
+            self.assertEqual(
+                list(MapDecoder.get_most_common_colors(info).items()),
+                [((4, 5, 6), 0.5), ((1, 2, 3), 0.25), ((7, 8, 9), 0.25)],
+            )
+
+    def test_empty(self):
+        info_table = InfoTable.from_info_list([])
+        self.assertEqual(info_table.to_info_list(), [])
+        self.assertEqual(info_table.get_ent_to_label_to_n(), {})
+        self.assertEqual(info_table.get_most_common_colors(), {})
@@ -0,0 +1,45 @@
+import importlib.util
+import json
+import os
+import unittest
+
+from map_decoder import InfoTable, InfoWriter
+from tests.helpers import INFO_LIST, get_temp_dir
+
+
+class TestCase(unittest.TestCase):
+    def write(self, filename: str) -> str:
+        path = os.path.join(get_temp_dir(self), filename)
+        with InfoWriter(path) as writer:
+            writer.write(InfoTable.from_info_list(INFO_LIST[:1]))
+            writer.write(InfoTable.from_info_list(INFO_LIST[1:]))
+        self.assertEqual(writer.n, len(INFO_LIST))
+        return path
+
+    def test_jsonl(self):
+        path = self.write("info_list.jsonl")
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, json.loads(json.dumps(INFO_LIST)))
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("pyarrow"), "pyarrow not installed"
+    )
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        path = self.write("info_list.parquet")
+        rows = pq.read_table(path).to_pylist()
+        self.assertEqual(
+            [(row["x"], row["y"]) for row in rows],
+            [info["xy"] for info in INFO_LIST],
+        )
+        self.assertEqual(
+            [row["ent_id"] for row in rows],
+            [info["ent_id"] for info in INFO_LIST],
+        )
+        self.assertEqual(rows[0]["color"], [4, 5, 6])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            InfoWriter("info_list.csv")
@@ -1,11 +1,31 @@
+import multiprocessing
 import os
 import unittest
+from unittest import mock
 
-from map_decoder import MapDecoder
+import numpy as np
+from gig import EntType
+
+from gig_future import EntFuture, EntGeoStore
+from map_decoder import DecodeMetrics, MapDecoder, MapDecoderGeoMixin
+from utils_future import Poly2GeoMapper
+from tests.helpers import MAP_DECODE_KWARGS, MAP_GEOMS, get_map_image, set_ents
 
 TEST_MAP_DECODER = MapDecoder.open(
     os.path.join("tests", "inputs", "lk-elephant-corridors.png")
 )
+TEST_REFERENCE_LIST = [
+    dict(xy=(154, 37), latlng=(9.8354, 80.2121), extreme_point="N"),
+    dict(xy=(208, 607), latlng=(5.9187, 80.5912), extreme_point="S"),
+    dict(xy=(76, 269), latlng=(8.2103, 79.6926), extreme_point="W"),
+    dict(xy=(390, 442), latlng=(7.0227, 81.8787), extreme_point="E"),
+    dict(xy=(96, 458), latlng=(6.9429, 79.8400), extreme_point=None),
+    dict(xy=(98, 417), latlng=(7.2065, 79.8409), extreme_point=None),
+]
+TEST_COLOR_TO_LABEL = {
+    (81, 174, 200): "Temporary Corridors",
+    (20, 167, 85): "Permanent Corridors and Parks",
+}
 
 
 class TestCase(unittest.TestCase):
@@ -20,3 +40,229 @@ class TestCase(unittest.TestCase):
         self.assertEqual(cm.shape, (654, 455, 3))
         first_item = tuple((cm[0, 0] * 255).astype(int))
         self.assertEqual(first_item, (255, 255, 255))
+
+    def test_color_matrix_tiled(self):
+        md = TEST_MAP_DECODER
+        cm = md.get_color_matrix(
+            md.pil_image,
+            n_clusters=3,
+            min_saturation=0.1,
+            color_background=(255, 255, 255),
+            max_tile_pixels=10_000,
+        )
+        self.assertEqual(cm.shape, (654, 455, 3))
+        self.assertEqual(cm.dtype, np.float32)
+        first_item = tuple((cm[0, 0] * 255).astype(int))
+        self.assertEqual(first_item, (255, 255, 255))
+        self.assertEqual(len(np.unique(cm.reshape(-1, 3), axis=0)), 3)
+
+    def test_decode_tiled(self):
+        # Centers fitted on a sample are off the legend by a unit or so,
+        # so a tiled decode must still match every legend color.
+        set_ents(MAP_GEOMS)
+        self.addCleanup(EntGeoStore.reset)
+        kwargs = dict(
+            reference_list=TEST_REFERENCE_LIST,
+            min_saturation=0.1,
+            n_clusters=3,
+            color_reference_point=(255, 0, 0),
+            color_map_boundaries=(0, 0, 0),
+            color_background=(255, 255, 255),
+            box_size_lat=0.03,
+            map_ent_type=EntType.PROVINCE,
+            title="Elephant Corridors",
+            color_to_label=TEST_COLOR_TO_LABEL,
+        )
+        info_list = TEST_MAP_DECODER.decode(**kwargs).info_list
+        self.assertEqual(
+            {info["label"] for info in info_list},
+            set(TEST_COLOR_TO_LABEL.values()),
+        )
+        self.assertEqual(
+            TEST_MAP_DECODER.decode(
+                **kwargs, max_tile_pixels=20_000
+            ).info_list,
+            info_list,
+        )
+
+    def test_color_idx_matrix(self):
+        md = TEST_MAP_DECODER
+        color_idx_matrix, color_table = md.get_color_idx_matrix(
+            md.pil_image,
+            n_clusters=3,
+            min_saturation=0.1,
+            color_background=(255, 255, 255),
+        )
+        self.assertEqual(color_idx_matrix.shape, (654, 455))
+        self.assertEqual(color_idx_matrix.dtype, np.uint8)
+        self.assertEqual(color_table.shape, (3, 3))
+        self.assertEqual(tuple(color_table[0]), (255, 255, 255))
+        self.assertEqual(color_idx_matrix[0, 0], 0)
+
+    def test_most_common_colors(self):
+        info_list = [
+            dict(color=(1, 2, 3)),
+            dict(color=(4, 5, 6)),
+            dict(color=(4, 5, 6)),
+            dict(color=(7, 8, 9)),
+        ]
+        self.assertEqual(
+            list(MapDecoder.get_most_common_colors(info_list).items()),
+            [((4, 5, 6), 0.5), ((1, 2, 3), 0.25), ((7, 8, 9), 0.25)],
+        )
+
+    def test_quantizer_report(self):
+        set_ents(MAP_GEOMS)
+        self.addCleanup(EntGeoStore.reset)
+        result = MapDecoder(get_map_image()).decode(**MAP_DECODE_KWARGS)
+        quantizer = result.report["details"]["quantizer"]
+        self.assertEqual(quantizer["backend"], "kmeans")
+        self.assertEqual(quantizer["n_clusters"], 4)
+        self.assertGreaterEqual(quantizer["fit_time"], 0)
+        self.assertGreaterEqual(quantizer["inertia"], 0)
+
+        # Tiled, with a legend, nothing is fitted
+        result = MapDecoder(get_map_image()).decode(
+            **MAP_DECODE_KWARGS, max_tile_pixels=1_000
+        )
+        self.assertNotIn("quantizer", result.report["details"])
+
+    def test_latlng_color_info_list_matches_nested_loops(self):
+        set_ents(MAP_GEOMS)
+        self.addCleanup(EntGeoStore.reset)
+        md = MapDecoder(get_map_image())
+        color_background = (255, 255, 255)
+        color_matrix = md.get_color_matrix(
+            md.pil_image,
+            n_clusters=4,
+            min_saturation=0.1,
+            color_background=color_background,
+        )
+        reference_list = MAP_DECODE_KWARGS["reference_list"]
+        color_to_label = MAP_DECODE_KWARGS["color_to_label"]
+        box_size_lat = 0.05
+
+        # One cell at a time, as sampling was before it was vectorized
+        params, x_values, y_values = md.get_sample_grid(
+            reference_list, box_size_lat, md.pil_image.size
+        )
+        expected_info_list = []
+        for x in x_values.tolist():
+            for y in y_values.tolist():
+                color = tuple(
+                    int(v) for v in (color_matrix[y, x] * 255).astype(int)
+                )
+                label = color_to_label.get(color)
+                if color == color_background or not label:
+                    continue
+                lat, lng = Poly2GeoMapper.transform((x, y), params)
+                latlng = (round(float(lat), 6), round(float(lng), 6))
+                ent = EntFuture.idx_regions_from_latlng(
+                    latlng, EntType.PROVINCE
+                ).get(EntType.PROVINCE.name)
+                if not ent:
+                    continue
+                expected_info_list.append(
+                    dict(
+                        xy=(x, y),
+                        latlng=latlng,
+                        ent_id=ent.id,
+                        label=label,
+                        color=color,
+                    )
+                )
+
+        self.assertGreater(len(expected_info_list), 1_000)
+        for sampling in MapDecoder.SAMPLINGS:
+            self.assertEqual(
+                md.get_latlng_color_info_list(
+                    reference_list=reference_list,
+                    color_background=color_background,
+                    box_size_lat=box_size_lat,
+                    map_ent_type=EntType.PROVINCE,
+                    color_to_label=color_to_label,
+                    color_matrix=color_matrix,
+                    sampling=sampling,
+                ),
+                expected_info_list,
+            )
+
+    def test_get_info_table_for_block_empty(self):
+        set_ents(MAP_GEOMS)
+        self.addCleanup(EntGeoStore.reset)
+        md = MapDecoder(get_map_image())
+        params, x_values, y_values = md.get_sample_grid(
+            MAP_DECODE_KWARGS["reference_list"], 0.2, md.pil_image.size
+        )
+        color_matrix = md.get_color_matrix(
+            md.pil_image,
+            n_clusters=4,
+            min_saturation=0.1,
+            color_background=(255, 255, 255),
+        )
+        for sampling in MapDecoder.SAMPLINGS:
+            for block_x_values, block_y_values in [
+                (x_values[:0], y_values),
+                (x_values, y_values[:0]),
+            ]:
+                info_table = md.get_info_table_for_block(
+                    block_x_values,
+                    block_y_values,
+                    params,
+                    color_background=(255, 255, 255),
+                    map_ent_type=EntType.PROVINCE,
+                    color_to_label=MAP_DECODE_KWARGS["color_to_label"],
+                    color_matrix=color_matrix,
+                    sampling=sampling,
+                )
+                self.assertEqual(len(info_table), 0)
+
+    @unittest.skipUnless(
+        "fork" in multiprocessing.get_all_start_methods(), "needs fork"
+    )
+    def test_get_ent_ids_n_processes(self):
+        set_ents(MAP_GEOMS)
+        self.addCleanup(EntGeoStore.reset)
+        lats, lngs = np.meshgrid(
+            np.linspace(5.5, 9.5, 20), np.linspace(79.5, 83.5, 20)
+        )
+        latlngs = np.column_stack([lats.ravel(), lngs.ravel()])
+
+        ent_ids = MapDecoder.get_ent_ids(latlngs, EntType.PROVINCE)
+        self.assertEqual(set(ent_ids), {"LK-1", "LK-2", None})
+        metrics = DecodeMetrics()
+        self.assertEqual(
+            MapDecoder.get_ent_ids(
+                latlngs, EntType.PROVINCE, n_processes=2, metrics=metrics
+            ).tolist(),
+            ent_ids.tolist(),
+        )
+        self.assertEqual(
+            metrics.counters["point_in_polygon_lookups"], len(latlngs)
+        )
+
+        # decode_stream shares one pool across all of its blocks
+        def decode_stream(**kwargs):
+            kwargs = MAP_DECODE_KWARGS | kwargs
+            for k in [
+                "color_reference_point",
+                "color_map_boundaries",
+                "title",
+            ]:
+                del kwargs[k]
+            return [
+                info_table.to_info_list()
+                for info_table in MapDecoder(get_map_image()).decode_stream(
+                    chunk_size=30, **kwargs
+                )
+            ]
+
+        with mock.patch.object(
+            MapDecoderGeoMixin,
+            "open_pool",
+            wraps=MapDecoderGeoMixin.open_pool,
+        ) as open_pool:
+            info_lists = decode_stream(n_processes=2)
+        open_pool.assert_called_once()
+        self.assertGreater(len(info_lists), 1)
+        self.assertEqual(info_lists, decode_stream())
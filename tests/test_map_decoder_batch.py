@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import unittest
+from unittest import mock
+
+from gig import EntType
+from utils import JSONFile
+
+from gig_future import EntGeoStore
+from map_decoder import MapDecoder, MapDecoderBatch
+from map_decoder.__main__ import main
+from tests.helpers import (
+    MAP_COLOR_TO_LABEL,
+    MAP_DECODE_KWARGS,
+    MAP_GEOMS,
+    MAP_REFERENCE_LIST,
+    get_map_image,
+    get_temp_dir,
+    set_ents,
+)
+
+
+def get_job(dir_root: str, name: str) -> dict:
+    decode_kwargs = {
+        k: v
+        for k, v in MAP_DECODE_KWARGS.items()
+        if k not in ["reference_list", "map_ent_type", "color_to_label"]
+    }
+    return dict(
+        image_path=os.path.join(dir_root, f"{name}.png"),
+        dir_output=os.path.join(dir_root, name),
+        map_ent_type="province",
+        reference_list=[
+            ref | dict(xy=list(ref["xy"]), latlng=list(ref["latlng"]))
+            for ref in MAP_REFERENCE_LIST
+        ],
+        color_to_label=[
+            [list(color), label] for color, label in MAP_COLOR_TO_LABEL.items()
+        ],
+        decode=decode_kwargs | dict(renderer="pil"),
+    )
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        set_ents(MAP_GEOMS)
+        self.dir_root = get_temp_dir(self)
+        get_map_image().save(os.path.join(self.dir_root, "map.png"))
+
+    def tearDown(self):
+        EntGeoStore.reset()
+
+    def test_from_manifest(self):
+        manifest_path = os.path.join(self.dir_root, "manifest.json")
+        JSONFile(manifest_path).write([get_job(self.dir_root, "map")])
+        batch = MapDecoderBatch.from_manifest(manifest_path)
+        self.assertEqual(len(batch.job_list), 1)
+
+        kwargs = MapDecoderBatch.get_decode_kwargs(batch.job_list[0])
+        self.assertEqual(kwargs["map_ent_type"].name, EntType.PROVINCE.name)
+        self.assertEqual(kwargs["color_to_label"], MAP_COLOR_TO_LABEL)
+        self.assertEqual(kwargs["color_background"], (255, 255, 255))
+        self.assertEqual(
+            [ref["xy"] for ref in kwargs["reference_list"]],
+            [ref["xy"] for ref in MAP_REFERENCE_LIST],
+        )
+
+    def test_run_job_error(self):
+        result = MapDecoderBatch.run_job(get_job(self.dir_root, "missing"))
+        self.assertIsNone(result["report"])
+        self.assertIn("missing.png", result["error"])
+
+    def test_run(self):
+        job = get_job(self.dir_root, "map")
+        (result,) = MapDecoderBatch([job]).run(n_workers=1)
+        self.assertIsNone(result["error"])
+        ent_to_label_to_n = JSONFile(
+            os.path.join(job["dir_output"], "ent_to_label_to_n.json")
+        ).read()
+        self.assertEqual(
+            ent_to_label_to_n,
+            {
+                "LK-1": {"red": 36, "green": 15},
+                "LK-2": {"green": 10, "blue": 30},
+            },
+        )
+        for name in ["info_list.png", "ents.png", "report.json"]:
+            self.assertTrue(
+                os.path.exists(os.path.join(job["dir_output"], name))
+            )
+
+    def test_run_job_n_processes_in_worker(self):
+        # A daemonic worker cannot start a pool, so n_processes is dropped
+        job = get_job(self.dir_root, "map")
+        job["decode"]["n_processes"] = 2
+        with mock.patch.object(
+            multiprocessing,
+            "current_process",
+            return_value=mock.Mock(daemon=True),
+        ), mock.patch.object(
+            MapDecoder, "decode", autospec=True, side_effect=MapDecoder.decode
+        ) as decode:
+            result = MapDecoderBatch.run_job(job)
+        self.assertIsNone(result["error"])
+        self.assertIsNone(decode.call_args.kwargs["n_processes"])
+
+    def test_run_empty(self):
+        self.assertEqual(MapDecoderBatch([]).run(n_workers=1), [])
+
+    def test_main(self):
+        manifest_path = os.path.join(self.dir_root, "manifest.json")
+        JSONFile(manifest_path).write([get_job(self.dir_root, "map")])
+        self.assertEqual(main([manifest_path, "--n-workers", "1"]), 0)
+
+        JSONFile(manifest_path).write(
+            [get_job(self.dir_root, "map"), get_job(self.dir_root, "missing")]
+        )
+        self.assertEqual(main([manifest_path, "--n-workers", "1"]), 1)
@@ -0,0 +1,16 @@
+import unittest
+
+from map_decoder import MapDecoderDrawMixin
+
+
+class TestCase(unittest.TestCase):
+    def test_get_winning_label_idxs(self):
+        label_idxs = MapDecoderDrawMixin.get_winning_label_idxs(
+            ent_ids=["LK-1", "LK-2", "LK-3"],
+            ent_to_label_to_n={
+                "LK-1": {"a": 1, "b": 3},
+                "LK-3": {"a": 2},
+            },
+            labels=["a", "b"],
+        )
+        self.assertEqual(label_idxs.tolist(), [1, -1, 0])
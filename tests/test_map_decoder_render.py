@@ -0,0 +1,125 @@
+import unittest
+
+import numpy as np
+import shapely
+from gig import EntType
+
+from gig_future import EntGeoStore
+from map_decoder import MapDecoder, MapDecoderRenderMixin
+from tests.helpers import (
+    MAP_COLOR_TO_LABEL,
+    MAP_DECODE_KWARGS,
+    MAP_GEOMS,
+    MAP_REFERENCE_LIST,
+    get_map_image,
+    set_ents,
+)
+
+REFERENCE_LIST = [
+    dict(xy=(154, 37), latlng=(9.835389, 80.212146)),
+    dict(xy=(208, 607), latlng=(5.918717, 80.591235)),
+    dict(xy=(76, 269), latlng=(8.210297, 79.692590)),
+    dict(xy=(390, 442), latlng=(7.022706, 81.878701)),
+    dict(xy=(96, 458), latlng=(6.942870, 79.839950)),
+    dict(xy=(98, 417), latlng=(7.206481, 79.840926)),
+]
+
+
+class TestCase(unittest.TestCase):
+    def test_get_to_pixels(self):
+        to_pixels = MapDecoderRenderMixin.get_to_pixels(REFERENCE_LIST)
+        lats = np.array([ref["latlng"][0] for ref in REFERENCE_LIST])
+        lngs = np.array([ref["latlng"][1] for ref in REFERENCE_LIST])
+        xs, ys = to_pixels(lats, lngs)
+        xys = np.array([ref["xy"] for ref in REFERENCE_LIST])
+        # Least-squares fit, so reference points land near, not on, xy
+        self.assertLess(np.abs(xs - xys[:, 0]).max(), 10)
+        self.assertLess(np.abs(ys - xys[:, 1]).max(), 10)
+
+    def test_new_canvas(self):
+        image, scale, _ = MapDecoderRenderMixin.new_canvas(
+            (455, 654), REFERENCE_LIST
+        )
+        self.assertAlmostEqual(scale, 3000 / 654)
+        self.assertEqual(image.width, round(455 * scale))
+        self.assertEqual(
+            image.height,
+            3000
+            + MapDecoderRenderMixin.HEADER_HEIGHT
+            + MapDecoderRenderMixin.FOOTER_HEIGHT,
+        )
+
+    def test_boundaries_on_top(self):
+        set_ents(MAP_GEOMS)
+        self.addCleanup(EntGeoStore.reset)
+        color_map_boundaries = (255, 0, 255)
+        result = MapDecoder(get_map_image()).decode(
+            **(
+                MAP_DECODE_KWARGS
+                | dict(color_map_boundaries=color_map_boundaries)
+            ),
+            renderer="pil",
+        )
+
+        # The provinces meet at x = 30, and green covers y = 34..55 on
+        # both sides, so samples and ents are filled on either side of it.
+        scale = MapDecoderRenderMixin.CANVAS_LONG_SIDE / 60
+        x = round(30 * scale)
+        y = round(45 * scale) + MapDecoderRenderMixin.HEADER_HEIGHT
+        for image in [result.image_info_list, result.image_for_ents]:
+            pixels = np.array(image)
+            self.assertNotEqual(
+                tuple(pixels[y, x - 20]),
+                MapDecoderRenderMixin.COLOR_BACKGROUND,
+            )
+            border = pixels[y, range(x - 2, x + 3)]
+            self.assertIn(
+                color_map_boundaries, [tuple(color) for color in border]
+            )
+
+    def test_nested_enclaves(self):
+        # An ent in the hole of another ent, which is in the hole of a
+        # third, listed before the outermost, so that its fill comes
+        # first and must survive the outer ent's hole.
+        def ring(d):
+            return shapely.box(81.5 - d, 7.5 - d, 81.5 + d, 7.5 + d)
+
+        set_ents(
+            [
+                shapely.Polygon(
+                    ring(0.5).exterior, holes=[ring(0.25).exterior]
+                ),
+                shapely.Polygon(
+                    ring(1.25).exterior, holes=[ring(0.75).exterior]
+                ),
+                ring(0.2),
+            ]
+        )
+        self.addCleanup(EntGeoStore.reset)
+        image = MapDecoderRenderMixin.render_image_for_ents(
+            ent_to_label_to_n={
+                "LK-1": {"blue": 1},
+                "LK-2": {"red": 1},
+                "LK-3": {"green": 1},
+            },
+            size=(60, 60),
+            reference_list=MAP_REFERENCE_LIST,
+            color_to_label=MAP_COLOR_TO_LABEL,
+            map_ent_type=EntType.PROVINCE,
+            title="Enclaves",
+            color_map_boundaries=(0, 0, 0),
+        )
+
+        # Along lat 7.5, where pixel x is at lng 80 + x / 20
+        pixels = np.array(image)
+        scale = MapDecoderRenderMixin.CANVAS_LONG_SIDE / 60
+        y = round(30 * scale) + MapDecoderRenderMixin.HEADER_HEIGHT
+        for lng, color in [
+            (80.5, (255, 0, 0)),
+            (80.9, MapDecoderRenderMixin.COLOR_BACKGROUND),
+            (81.1, (0, 0, 255)),
+            (81.27, MapDecoderRenderMixin.COLOR_BACKGROUND),
+            (81.5, (0, 255, 0)),
+        ]:
+            x = round((lng - 80) * 20 * scale)
+            self.assertEqual(tuple(pixels[y, x]), color, lng)
@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+import shapely
+from gig import EntType
+
+from gig_future import EntGeoStore
+from map_decoder import MapDecoder
+from tests.helpers import set_ents
+
+# Pixel (x, y) is at lat = 9 - y / 10, lng = 80 + x / 10
+REFERENCE_LIST = [
+    dict(xy=(x, y), latlng=(9 - y / 10, 80 + x / 10))
+    for x in [0, 10, 20]
+    for y in [0, 10, 20]
+]
+COLOR_TO_LABEL = {(1, 2, 3): "a", (4, 5, 6): "b"}
+GEOMS = [
+    shapely.box(79.9, 7, 81, 9.1),
+    shapely.box(81, 7, 82.1, 9.1),
+]
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        set_ents(GEOMS)
+
+    def tearDown(self):
+        EntGeoStore.reset()
+
+    def test_get_run_boxes(self):
+        label_code_matrix = np.array(
+            [
+                [0, 0, -1, 1],
+                [0, 0, -1, 1],
+                [0, 1, 1, 1],
+            ]
+        )
+        bounds, label_codes = MapDecoder.get_run_boxes(label_code_matrix)
+        covered = np.full(label_code_matrix.shape, -1)
+        for (x0, y0, x1, y1), label_code in zip(bounds, label_codes):
+            self.assertTrue((covered[y0:y1, x0:x1] == -1).all())
+            covered[y0:y1, x0:x1] = label_code
+        np.testing.assert_array_equal(covered, label_code_matrix)
+        self.assertEqual(len(bounds), 4)
+
+    def test_get_zonal_stats(self):
+        # "a" on x = 0..9 (all in the west), "b" on x = 10..19 (both)
+        color_idx_matrix = np.zeros((20, 20), dtype=np.uint8)
+        color_idx_matrix[:, :10] = 1
+        color_idx_matrix[:, 10:] = 2
+        color_table = np.array([(255, 255, 255), (1, 2, 3), (4, 5, 6)])
+
+        zonal_stats = MapDecoder.get_zonal_stats(
+            color_idx_matrix=color_idx_matrix,
+            color_table=color_table,
+            reference_list=REFERENCE_LIST,
+            map_ent_type=EntType.PROVINCE,
+            color_to_label=COLOR_TO_LABEL,
+        )
+        self.assertEqual(list(zonal_stats.keys()), ["LK-1", "LK-2"])
+        self.assertEqual(list(zonal_stats["LK-1"].keys()), ["a", "b"])
+        self.assertEqual(list(zonal_stats["LK-2"].keys()), ["b"])
+
+        # On a sphere, a lng/lat box has area R^2 dlng (sin lat1 - sin lat0)
+        def get_box_area_km2(dlng, lat0, lat1):
+            km_per_radian = 111.32 * 180 / np.pi
+            return (
+                km_per_radian**2
+                * np.radians(dlng)
+                * (np.sin(np.radians(lat1)) - np.sin(np.radians(lat0)))
+            )
+
+        a = zonal_stats["LK-1"]["a"]
+        self.assertAlmostEqual(
+            a["area_km2"] / get_box_area_km2(1.0, 7.05, 9.05), 1, 6
+        )
+        self.assertAlmostEqual(
+            a["fraction"],
+            get_box_area_km2(1.0, 7.05, 9.05) / get_box_area_km2(1.1, 7, 9.1),
+            5,
+        )
+        self.assertAlmostEqual(
+            zonal_stats["LK-1"]["b"]["fraction"]
+            + zonal_stats["LK-2"]["b"]["fraction"],
+            (0.05 + 0.95) * 2.0 / (1.1 * 2.1),
+            5,
+        )
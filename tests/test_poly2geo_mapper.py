@@ -1,5 +1,7 @@
 import unittest
 
+import numpy as np
+
 from utils_future import Poly2GeoMapper
 
 TEST_REFERENCE_LIST = [
@@ -53,3 +55,62 @@ class TestCase(unittest.TestCase):
             self.assertAlmostEqual(
                 expected_latlng[1], predicted_latlng[1], places=10
             )
+
+    def test_inverse_transform(self):
+        xys = [ref["xy"] for ref in TEST_REFERENCE_LIST]
+        latlngs = [ref["latlng"] for ref in TEST_REFERENCE_LIST]
+        params = Poly2GeoMapper.fit(xys=xys, latlngs=latlngs)
+        rough_inverse_params = Poly2GeoMapper.fit(xys=latlngs, latlngs=xys)
+
+        xs = np.array([0.0, 100.0, 250.0, 400.0])
+        ys = np.array([0.0, 300.0, 500.0, 650.0])
+        latlng = Poly2GeoMapper.transform((xs, ys), params)
+        observed_xs, observed_ys = Poly2GeoMapper.inverse_transform(
+            latlng,
+            params,
+            xy_guess=Poly2GeoMapper.transform(latlng, rough_inverse_params),
+        )
+        np.testing.assert_allclose(observed_xs, xs, atol=1e-6)
+        np.testing.assert_allclose(observed_ys, ys, atol=1e-6)
+
+    def test_transform_grid(self):
+        xys = [ref["xy"] for ref in TEST_REFERENCE_LIST]
+        latlngs = [ref["latlng"] for ref in TEST_REFERENCE_LIST]
+        params = Poly2GeoMapper.fit(xys=xys, latlngs=latlngs)
+
+        x_values = np.arange(0, 450, 7)
+        y_values = np.arange(0, 650, 11)
+        xs, ys = np.meshgrid(x_values, y_values, indexing="ij")
+        expected_lats, expected_lngs = Poly2GeoMapper.transform(
+            (xs, ys), params
+        )
+
+        lats, lngs = Poly2GeoMapper.transform_grid(x_values, y_values, params)
+        self.assertEqual(lats.shape, (len(x_values), len(y_values)))
+        np.testing.assert_allclose(lats, expected_lats, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(lngs, expected_lngs, rtol=0, atol=1e-12)
+
+        shape = (len(x_values), len(y_values))
+        out = (
+            np.empty(shape, dtype=np.float32),
+            np.empty(shape, dtype=np.float32),
+        )
+        lats32, lngs32 = Poly2GeoMapper.transform_grid(
+            x_values, y_values, params, out=out
+        )
+        self.assertIs(lats32, out[0])
+        self.assertEqual(lats32.dtype, np.float32)
+        np.testing.assert_allclose(lats32, expected_lats, rtol=0, atol=1e-5)
+        np.testing.assert_allclose(lngs32, expected_lngs, rtol=0, atol=1e-5)
+
+    def test_fit_inverse(self):
+        xys = [ref["xy"] for ref in TEST_REFERENCE_LIST]
+        latlngs = [ref["latlng"] for ref in TEST_REFERENCE_LIST]
+        inverse_params = Poly2GeoMapper.fit_inverse(xys=xys, latlngs=latlngs)
+
+        for ref in TEST_REFERENCE_LIST:
+            x, y = Poly2GeoMapper.transform_inverse(
+                ref["latlng"], inverse_params
+            )
+            self.assertAlmostEqual(x, ref["xy"][0], places=6)
+            self.assertAlmostEqual(y, ref["xy"][1], places=6)
@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+import shapely
+from gig import EntType
+
+from gig_future import EntFuture, EntGeoStore
+from map_decoder import DecodeMetrics, QuadtreeSampler
+from tests.helpers import set_ents
+
+# Two provinces, split by a diagonal, with a hole in the first
+GEOMS = [
+    shapely.Polygon(
+        [(80, 6), (81, 6), (80, 9), (80, 6)],
+        holes=[[(80.2, 6.5), (80.4, 6.5), (80.4, 6.7), (80.2, 6.7)]],
+    ),
+    shapely.Polygon([(81, 6), (82, 6), (82, 9), (80, 9), (81, 6)]),
+]
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        set_ents(GEOMS)
+
+    def tearDown(self):
+        EntGeoStore.reset()
+
+    def test_get_ent_ids(self):
+        nx, ny = 60, 90
+        lats, lngs = np.meshgrid(
+            np.linspace(5.9, 9.1, ny), np.linspace(79.9, 82.1, nx)
+        )
+        latlngs = np.round(np.stack([lats, lngs], axis=2), 6)
+        needs_ent = np.random.default_rng(0).random((nx, ny)) < 0.8
+
+        metrics = DecodeMetrics()
+        ent_ids = QuadtreeSampler(
+            latlngs, EntType.PROVINCE, metrics
+        ).get_ent_ids(needs_ent)
+
+        expected = EntFuture.idx_regions_from_latlng_list(
+            latlngs[needs_ent], EntType.PROVINCE
+        )[EntType.PROVINCE.name]
+        self.assertEqual(ent_ids[needs_ent].tolist(), expected.tolist())
+        self.assertTrue(np.equal(ent_ids[~needs_ent], None).all())
+        self.assertLess(
+            metrics.counters["point_in_polygon_lookups"], needs_ent.sum() / 2
+        )
+        self.assertEqual(
+            QuadtreeSampler(latlngs, EntType.PROVINCE).get_block_size(),
+            QuadtreeSampler.BLOCK_SIZE,
+        )
+        self.assertGreater(metrics.counters["cells_filled"], 0)
+
+    def test_get_ent_ids_small_ents(self):
+        # Ents narrower than four cells: every needed cell is looked up
+        set_ents(
+            [
+                shapely.box(lng, lat, lng + 0.1, lat + 0.1)
+                for lng in np.arange(80, 82, 0.1)
+                for lat in np.arange(6, 9, 0.1)
+            ]
+        )
+        nx, ny = 40, 60
+        lats, lngs = np.meshgrid(
+            np.linspace(6.01, 8.99, ny), np.linspace(80.01, 81.99, nx)
+        )
+        latlngs = np.round(np.stack([lats, lngs], axis=2), 6)
+        needs_ent = np.random.default_rng(0).random((nx, ny)) < 0.8
+
+        metrics = DecodeMetrics()
+        sampler = QuadtreeSampler(latlngs, EntType.PROVINCE, metrics)
+        self.assertLess(sampler.get_block_size(), sampler.MIN_BLOCK_SIZE)
+        ent_ids = sampler.get_ent_ids(needs_ent)
+
+        expected = EntFuture.idx_regions_from_latlng_list(
+            latlngs[needs_ent], EntType.PROVINCE
+        )[EntType.PROVINCE.name]
+        self.assertEqual(ent_ids[needs_ent].tolist(), expected.tolist())
+        self.assertEqual(
+            metrics.counters["point_in_polygon_lookups"], needs_ent.sum()
+        )
+
+    def test_split(self):
+        self.assertEqual(
+            QuadtreeSampler.split(np.array([[0, 4, 0, 1]])).tolist(),
+            [[0, 2, 0, 1], [2, 4, 0, 1]],
+        )
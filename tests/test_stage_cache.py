@@ -0,0 +1,98 @@
+import os
+import unittest
+
+import numpy as np
+
+from gig_future import EntGeoStore
+from map_decoder import DecodeMetrics, MapDecoder, StageCache
+from tests.helpers import (
+    MAP_COLOR_TO_LABEL,
+    MAP_DECODE_KWARGS,
+    MAP_GEOMS,
+    get_map_image,
+    get_temp_dir,
+    set_ents,
+)
+
+
+class TestCase(unittest.TestCase):
+    def test_get_or_compute(self):
+        cache = StageCache(get_temp_dir(self))
+        metrics = DecodeMetrics()
+        calls = []
+
+        def compute(inputs: dict):
+            return cache.get_or_compute(
+                "stage",
+                inputs,
+                lambda: calls.append(1) or inputs["a"] * 2,
+                metrics,
+            )
+
+        a = np.arange(10)
+        np.testing.assert_array_equal(compute(dict(a=a)), a * 2)
+        np.testing.assert_array_equal(compute(dict(a=a.copy())), a * 2)
+        np.testing.assert_array_equal(compute(dict(a=a + 1)), a * 2 + 2)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            metrics.counters, {"stage_cache_misses": 2, "stage_cache_hits": 1}
+        )
+
+    def test_evict(self):
+        cache = StageCache(get_temp_dir(self), max_bytes=2_500)
+        for i in range(3):
+            cache.get_or_compute("stage", dict(i=i), lambda: bytes(1_000))
+            path = cache.get_path(
+                "stage", StageCache.get_key("stage", dict(i=i))
+            )
+            os.utime(path, (i, i))
+        cache.evict()
+        self.assertEqual(len(cache.list_entries()), 2)
+        self.assertLessEqual(cache.get_size(), 2_500)
+        self.assertFalse(
+            os.path.exists(
+                cache.get_path("stage", StageCache.get_key("stage", dict(i=0)))
+            )
+        )
+
+    def test_private_dir(self):
+        dir_root = os.path.join(get_temp_dir(self), "stage_cache")
+        os.makedirs(dir_root, mode=0o777)
+        os.chmod(dir_root, 0o777)
+        StageCache(dir_root)
+        self.assertEqual(os.stat(dir_root).st_mode & 0o777, 0o700)
+
+    def test_get_key_version(self):
+        key = StageCache.get_key("stage", dict(i=0))
+        self.addCleanup(setattr, StageCache, "VERSION", StageCache.VERSION)
+        StageCache.VERSION += 1
+        self.assertNotEqual(StageCache.get_key("stage", dict(i=0)), key)
+
+    def test_decode_with_new_legend(self):
+        # A legend edit reuses the cached stages, and must still give the
+        # same result as decoding from scratch.
+        set_ents(MAP_GEOMS)
+        self.addCleanup(EntGeoStore.reset)
+        cache = StageCache(get_temp_dir(self))
+        color_to_label = dict(zip(MAP_COLOR_TO_LABEL, ["low", "high", "high"]))
+
+        def decode(**kwargs):
+            result = MapDecoder(get_map_image()).decode(
+                **(MAP_DECODE_KWARGS | kwargs)
+            )
+            return result.ent_to_label_to_n, result.metrics.counters
+
+        decode(stage_cache=cache)
+        ent_to_label_to_n, counters = decode(
+            color_to_label=color_to_label, stage_cache=cache
+        )
+        self.assertNotIn("stage_cache_misses", counters)
+        self.assertGreater(counters["stage_cache_hits"], 0)
+        self.assertEqual(
+            ent_to_label_to_n,
+            decode(color_to_label=color_to_label)[0],
+        )
+        self.assertEqual(
+            ent_to_label_to_n,
+            {"LK-1": {"low": 36, "high": 15}, "LK-2": {"high": 40}},
+        )